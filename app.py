@@ -1,38 +1,113 @@
+import hashlib
+import inspect
+import itertools
 import json
+import os
+import queue
+import threading
 import time
-from collections import Counter
-from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
-import requests
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from catalog import MovieRecord
+from engine import (
+    CATEGORY_BY_OPTION_INDEX,
+    DEFAULT_INCLUDE_ADULT,
+    DEFAULT_MIN_VOTE_AVG,
+    DEFAULT_MIN_VOTE_COUNT,
+    DEFAULT_PAGES_TO_POOL,
+    DEFAULT_SEMANTIC_RERANK,
+    DEFAULT_SHOW_TRAILER,
+    DETAILS_MAX_WORKERS,
+    DISCOVER_CACHE_TTL,
+    DISPLAY_LABEL,
+    LANGUAGE_OPTIONS,
+    LLM_SKIP_MARGIN,
+    LOCAL_CATALOG_DIR,
+    METRICS_TEXTFILE,
+    POSTER_BASE,
+    QUESTIONS,
+    SEMANTIC_WEIGHT,
+    SUBMIT_DEADLINE_SECONDS,
+    TMDB_TIMEOUT,
+    CircuitOpenError,
+    Deadline,
+    DeadlineExceeded,
+    RankedCandidates,
+    RecommendOptions,
+    TmdbAuthError,
+    accept_llm_pick,
+    analyze_answers,
+    build_reason,
+    build_tmdb_auth,
+    cache_samples,
+    candidate_pool,
+    decide_final_genre,
+    get_auth_failure_cache,
+    get_circuit_breaker,
+    get_http_session,
+    get_llm_metrics,
+    get_llm_pick_cache,
+    get_local_catalog,
+    get_metrics,
+    get_semantic_store,
+    get_span_log,
+    get_tmdb_disk_cache,
+    get_tmdb_rate_limiter,
+    get_tmdb_single_flight,
+    histogram_summary,
+    http_pool_stats,
+    llm_candidates_payload,
+    llm_skip_decision,
+    local_pick,
+    movie_details_cached,
+    openai_pick_one_movie,
+    rank_candidates,
+    rank_pool,
+    shared_resource,
+    swr_cache_stats,
+    tmdb_auth_fingerprint,
+    to_display_movie,
+)
+from metrics import Registry, write_textfile
+from posters import PosterCache
 
 # ============================================================
 # Config
 # ============================================================
 st.set_page_config(page_title="나와 어울리는 영화는?", page_icon="🎬", layout="centered")
 
-TMDB_API_BASE = "https://api.themoviedb.org/3"
-POSTER_BASE = "https://image.tmdb.org/t/p/w500"
-OPENAI_API_BASE = "https://api.openai.com/v1"
-
-# TMDB 장르 ID
-TMDB_GENRE_IDS = {
-    "action": 28,
-    "comedy": 35,
-    "drama": 18,
-    "scifi": 878,
-    "romance": 10749,
-    "fantasy": 14,
-}
-
-DISPLAY_LABEL = {
-    "action": "액션",
-    "comedy": "코미디",
-    "drama": "드라마",
-    "scifi": "SF",
-    "romance": "로맨스",
-    "fantasy": "판타지",
-}
+# 포스터 썸네일 디스크 캐시: w500 원본을 한 번만 받아 카드 왼쪽 칸(약 230px, HiDPI 1.5배) 크기로 줄여 제공
+POSTER_CACHE_DIR = os.getenv("POSTER_CACHE_DIR", os.path.join(".cache", "posters"))
+POSTER_CACHE_MAX_BYTES = int(os.getenv("POSTER_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+POSTER_THUMB_WIDTH = int(os.getenv("POSTER_THUMB_WIDTH", "342"))
+POSTER_THUMB_WORKERS = 4
+# 제출 1회의 모든 카드가 썸네일을 기다리는 시간의 합계 - 다 쓰면 원격 URL로 표시하고 생성은 계속 진행
+POSTER_WAIT_SECONDS = 0.5
+# 제출이 외부 호출을 기다리는 동안 rerun/stop 요청을 처리할 기회를 주는 주기 (초)
+RERUN_POLL_SECONDS = 0.1
+
+# 카탈로그 캐시 워밍: 장르 x 언어 조합의 Discover 풀 + 기본 필터 제출이 보여줄 후보들의 상세를 미리 조회
+# 인증 정보가 환경변수로 주어졌을 때만 동작
+TMDB_WARMUP_BEARER = os.getenv("TMDB_WARMUP_BEARER", "")
+TMDB_WARMUP_API_KEY = os.getenv("TMDB_WARMUP_API_KEY", "")
+# 기본 제출(평점/인기도 순)이 보여줄 상위 N편
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", "5"))
+WARMUP_MAX_WORKERS = int(os.getenv("WARMUP_MAX_WORKERS", "4"))
+WARMUP_INTERVAL_SECONDS = float(os.getenv("WARMUP_INTERVAL_SECONDS", str(60 * 30)))  # 0이면 시작 시 1회만
+
+# 답변 조합 전체(장르/이유/상위 5편)를 미리 계산한 조회 테이블 (언어별 사이드바 기본 필터 프로필)
+# 로컬 카탈로그가 있거나 TMDB_WARMUP_* 인증이 있는 언어만 빌드
+ANSWER_TABLE_DIR = os.getenv("ANSWER_TABLE_DIR", os.path.join(".cache", "answer_tables"))
+ANSWER_TABLE_INTERVAL_SECONDS = float(os.getenv("ANSWER_TABLE_INTERVAL_SECONDS", str(60 * 30)))  # 0이면 1회만
+# 저장된 상위 5편을 쓰는 최대 나이: 그 풀이 Discover 캐시에서 신선한 동안(TTL) + 재빌드 한 주기.
+# 재빌드가 밀리거나 실패해 이보다 오래되면 일반 경로(SWR 재검증을 거치는 Discover)로 계산
+ANSWER_TABLE_MAX_AGE = int(os.getenv("ANSWER_TABLE_MAX_AGE", str(int(DISCOVER_CACHE_TTL + ANSWER_TABLE_INTERVAL_SECONDS))))
 
 # ============================================================
 # Sidebar
@@ -52,18 +127,32 @@ read_access_token_v4 = st.sidebar.text_input(
     help="Read Access Token을 넣으면 Authorization: Bearer 로 호출합니다.",
 )
 
-language = st.sidebar.selectbox("언어(language)", ["ko-KR", "en-US", "ja-JP"], index=0)
-include_adult = st.sidebar.checkbox("성인 콘텐츠 포함(include_adult)", value=False)
-min_vote_avg = st.sidebar.slider("최소 평점(vote_average) 필터", 0.0, 9.0, 6.0, 0.1)
-min_vote_count = st.sidebar.slider("최소 투표 수(vote_count) 필터", 0, 5000, 200, 50)
-pages_to_pool = st.sidebar.slider("추천 후보 풀(페이지 수)", 1, 5, 2, 1)
-show_trailer = st.sidebar.checkbox("예고편(YouTube) 표시", value=True)
+language = st.sidebar.selectbox("언어(language)", LANGUAGE_OPTIONS, index=0)
+local_catalog_available = get_local_catalog(language) is not None
+use_local_catalog = st.sidebar.checkbox(
+    "로컬 카탈로그로 후보 조회",
+    value=local_catalog_available,
+    disabled=not local_catalog_available,
+    help=f"{LOCAL_CATALOG_DIR}/{language} 카탈로그가 있으면 Discover 호출 없이 로컬에서 필터/정렬합니다.",
+)
+include_adult = st.sidebar.checkbox("성인 콘텐츠 포함(include_adult)", value=DEFAULT_INCLUDE_ADULT)
+min_vote_avg = st.sidebar.slider("최소 평점(vote_average) 필터", 0.0, 9.0, DEFAULT_MIN_VOTE_AVG, 0.1)
+min_vote_count = st.sidebar.slider("최소 투표 수(vote_count) 필터", 0, 5000, DEFAULT_MIN_VOTE_COUNT, 50)
+# 로컬 카탈로그는 네트워크 비용이 없으므로 훨씬 큰 풀을 허용
+pages_to_pool = st.sidebar.slider("추천 후보 풀(페이지 수)", 1, 50 if use_local_catalog else 5, DEFAULT_PAGES_TO_POOL, 1)
+show_trailer = st.sidebar.checkbox("예고편(YouTube) 표시", value=DEFAULT_SHOW_TRAILER)
 
 st.sidebar.divider()
 
 # --- OpenAI ---
 st.sidebar.subheader("OpenAI (LLM 최종 1편 선정)")
 use_llm_final_pick = st.sidebar.checkbox("LLM으로 최종 1편만 추천", value=True)
+use_semantic_rerank = st.sidebar.checkbox(
+    "로컬 의미 유사도로 재정렬",
+    value=DEFAULT_SEMANTIC_RERANK,
+    help="답변 문장과 줄거리의 유사도(오프라인 TF-IDF)를 후보 정렬에 반영합니다. "
+    "LLM을 쓰지 않거나 실패하면 이 점수로 최종 1편을 고릅니다.",
+)
 openai_api_key = st.sidebar.text_input("OpenAI API Key", type="password")
 openai_model = st.sidebar.selectbox(
     "모델",
@@ -71,6 +160,16 @@ openai_model = st.sidebar.selectbox(
     index=0,
     help="JSON Schema 출력이 안정적인 모델을 권장합니다.",
 )
+stream_llm = st.sidebar.checkbox(
+    "LLM 응답 스트리밍",
+    value=True,
+    help="최종 추천 카드를 먼저 띄우고 추천 이유를 생성되는 대로 보여줍니다.",
+)
+pipeline_llm = st.sidebar.checkbox(
+    "LLM 선정을 상세 조회와 동시에 실행",
+    value=True,
+    help="Discover 결과만으로 LLM 요청을 먼저 보내고, 후보 상세 조회는 그동안 병렬로 진행합니다.",
+)
 
 # ============================================================
 # UI: Title
@@ -81,375 +180,681 @@ st.caption("추가 옵션을 켜면 - 추천 5편 중에서 LLM이 ‘진짜 좋
 st.divider()
 
 # ============================================================
-# Questions
-# 선택지 순서(중요): 1) 로맨스/드라마, 2) 액션/어드벤처, 3) SF/판타지, 4) 코미디
+# Helpers - Details & posters
 # ============================================================
-questions = [
-    {
-        "q": "Q1. 시험이 끝난 날, 가장 하고 싶은 일은?",
-        "options": [
-            "조용한 카페에 가서 음악 들으며 하루를 정리한다",
-            "친구들이랑 즉흥적으로 여행이나 액티비티를 간다",
-            "집에서 몰입감 있는 세계관의 작품을 정주행한다",
-            "아무 생각 없이 웃긴 영상이나 예능을 본다",
-        ],
-    },
-    {
-        "q": "Q2. 영화 볼 때 가장 중요하게 보는 요소는?",
-        "options": [
-            "인물 간의 감정선과 관계 변화",
-            "긴장감 넘치는 전개와 시원한 장면",
-            "설정의 참신함과 세계관의 완성도",
-            "대사나 상황에서 나오는 웃음 포인트",
-        ],
-    },
-    {
-        "q": "Q3. 친구가 영화를 추천해달라고 하면?",
-        "options": [
-            "여운이 오래 남는 작품을 추천한다",
-            "같이 보면서 감탄할 수 있는 영화를 추천한다",
-            "“이건 설정이 미쳤다” 싶은 영화를 추천한다",
-            "같이 웃으면서 볼 수 있는 영화를 추천한다",
-        ],
-    },
-    {
-        "q": "Q4. 당신이 더 끌리는 영화 속 주인공은?",
-        "options": [
-            "현실적인 고민을 안고 성장하는 인물",
-            "위험한 상황에서도 몸부터 움직이는 인물",
-            "특별한 능력이나 운명을 지닌 인물",
-            "실수 많고 인간적인 매력의 인물",
-        ],
-    },
-    {
-        "q": "Q5. 주말에 혼자 영화 한 편을 본다면?",
-        "options": [
-            "감정이입하며 천천히 몰입할 수 있는 영화",
-            "스트레스가 확 풀리는 영화",
-            "현실을 잠시 잊게 해주는 영화",
-            "가볍게 웃고 끝낼 수 있는 영화",
-        ],
-    },
-]
-
-category_by_option_index = {
-    0: "romance_drama",
-    1: "action_adventure",
-    2: "sf_fantasy",
-    3: "comedy",
-}
+def iter_details_parallel(
+    base_movies: List[MovieRecord],
+    auth: Tuple[Dict[str, str], Dict[str, Any]],
+    language: str,
+    with_trailer: bool,
+    max_workers: int = DETAILS_MAX_WORKERS,
+    deadline: Optional[Deadline] = None,
+    on_idle: Optional[Callable[[], None]] = None,
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    base_movies의 상세 정보를 동시에 조회하고, 끝나는 순서대로 (index, 표시용 dict)를 yield.
+    - 워커 스레드에도 현재 ScriptRunContext를 붙여 캐시/공유 리소스를 그대로 사용
+    - 상세 조회가 실패하면 해당 카드만 Discover 결과로 대체
+    - 기다리는 동안 RERUN_POLL_SECONDS마다 on_idle 호출 (RunHeartbeat.beat)
+    """
+    ctx = get_script_run_ctx()
+
+    def attach_ctx() -> None:
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+
+    def fetch(base_movie: MovieRecord) -> Dict[str, Any]:
+        try:
+            details = movie_details_cached(
+                _auth=auth,
+                movie_id=base_movie["id"],
+                language=language,
+                with_trailer=with_trailer,
+                _deadline=deadline,
+            )
+        except Exception:
+            details = base_movie
+        return to_display_movie(base_movie, details)
+
+    if not base_movies:
+        return
+
+    workers = max(1, min(max_workers, len(base_movies)))
+    ex = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tmdb-details", initializer=attach_ctx)
+    try:
+        futures = {ex.submit(fetch, m): i for i, m in enumerate(base_movies)}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=RERUN_POLL_SECONDS if on_idle else None, return_when=FIRST_COMPLETED)
+            if not done:
+                on_idle()
+            for fut in done:
+                yield futures[fut], fut.result()
+    finally:
+        # 실행이 버려져 중간에 끝나도 남은 조회를 기다리지 않는다 (deadline이 취소돼 곧 끝남)
+        ex.shutdown(wait=False, cancel_futures=True)
+
+
+def poster_url(poster_path: Optional[str]) -> Optional[str]:
+    if not poster_path:
+        return None
+    return POSTER_BASE + poster_path
+
+
+def fetch_poster_bytes(poster_path: str) -> bytes:
+    # 이미지 CDN은 API rate limit/circuit breaker 대상이 아니므로 세션만 공유
+    r = get_http_session().get(POSTER_BASE + poster_path, timeout=TMDB_TIMEOUT)
+    r.raise_for_status()
+    return r.content
+
+
+@shared_resource
+def get_poster_cache() -> PosterCache:
+    return PosterCache(
+        POSTER_CACHE_DIR,
+        fetch_poster_bytes,
+        thumb_width=POSTER_THUMB_WIDTH,
+        max_bytes=POSTER_CACHE_MAX_BYTES,
+        max_workers=POSTER_THUMB_WORKERS,
+    )
+
+
+def poster_image(poster_path: Optional[str], wait_budget: Optional[Deadline] = None) -> Optional[str]:
+    """
+    st.image에 넘길 포스터: 로컬 썸네일이 준비됐으면 파일 경로, 아니면 원격 URL.
+    wait_budget은 카드들이 함께 쓰는 대기 예산 - 카드마다 따로 기다리지 않는다.
+    """
+    if not poster_path:
+        return None
+    wait = wait_budget.remaining() if wait_budget is not None else POSTER_WAIT_SECONDS
+    return get_poster_cache().get(poster_path, timeout=wait) or poster_url(poster_path)
+
 
 # ============================================================
-# Helpers - TMDB Auth & Requests
+# Helpers - Background LLM pick
 # ============================================================
-def build_tmdb_auth(api_key: str, bearer: str) -> Tuple[Dict[str, str], Dict[str, Any]]:
-    headers: Dict[str, str] = {"accept": "application/json"}
-    base_params: Dict[str, Any] = {}
+class BackgroundPick:
+    """
+    openai_pick_one_movie를 별도 스레드에서 실행한다.
+    - 스트리밍 부분 결과는 큐에 쌓고, 렌더링은 스크립트 스레드가 poll()/wait()로 꺼내서 한다
+      (Streamlit 요소는 스크립트 스레드에서만 그리도록)
+    - result()는 완료까지 기다린 뒤 결과를 돌려주거나 예외를 다시 던진다
+    """
 
-    bearer = (bearer or "").strip()
-    api_key = (api_key or "").strip()
+    def __init__(self, **pick_kwargs: Any) -> None:
+        self.timings: Dict[str, Any] = {}
+        self._partials: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._done = threading.Event()
+        self._result: Optional[Dict[str, Any]] = None
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, args=(pick_kwargs,), name="openai-pick", daemon=True)
+        ctx = get_script_run_ctx()
+        if ctx is not None:
+            add_script_run_ctx(self._thread, ctx)
+        self._thread.start()
+
+    def _run(self, pick_kwargs: Dict[str, Any]) -> None:
+        try:
+            self._result = openai_pick_one_movie(on_partial=self._partials.put, timings=self.timings, **pick_kwargs)
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def poll(self) -> Optional[Dict[str, Any]]:
+        """지금까지 쌓인 부분 결과 중 가장 최신 것 (없으면 None, 기다리지 않음)"""
+        latest = None
+        while True:
+            try:
+                latest = self._partials.get_nowait()
+            except queue.Empty:
+                return latest
 
-    if bearer:
-        headers["Authorization"] = f"Bearer {bearer}"
-    elif api_key:
-        base_params["api_key"] = api_key
+    def wait(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """부분 결과가 오거나 완료될 때까지 최대 timeout초 대기"""
+        try:
+            first = self._partials.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return self.poll() or first
 
-    return headers, base_params
+    def result(self) -> Dict[str, Any]:
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._result
 
 
-def tmdb_get(
-    path: str,
-    headers: Dict[str, str],
-    base_params: Dict[str, Any],
-    params: Optional[Dict[str, Any]] = None,
-    max_retries: int = 4,
-) -> Dict[str, Any]:
-    url = f"{TMDB_API_BASE}{path}"
-    merged = dict(base_params)
-    if params:
-        merged.update(params)
+# ============================================================
+# Helpers - Catalog warm-up
+# ============================================================
+class WarmupStatus:
+    """캐시 워밍 진행 상황 (디버그 정보에 표시)"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.state = "idle"
+        self.runs = 0
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.started_at: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def begin(self, total: int) -> None:
+        with self._lock:
+            self.state = "running"
+            self.total, self.done, self.failed = total, 0, 0
+            self.started_at = time.time()
+
+    def advance(self, error: Optional[Exception] = None) -> None:
+        with self._lock:
+            self.done += 1
+            if error is not None:
+                self.failed += 1
+                self.last_error = str(error)
+
+    def fail(self, error: Exception) -> None:
+        """워밍 1회가 통째로 실패"""
+        with self._lock:
+            self.last_error = str(error)
+        self.finish()
+
+    def finish(self) -> None:
+        with self._lock:
+            self.state = "done"
+            self.runs += 1
+            self.last_duration = time.time() - (self.started_at or time.time())
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "runs": self.runs,
+                "progress": f"{self.done}/{self.total}",
+                "failed": self.failed,
+                "elapsed_s": round(time.time() - self.started_at, 2) if self.state == "running" and self.started_at else None,
+                "last_duration_s": round(self.last_duration, 2) if self.last_duration is not None else None,
+                "last_error": self.last_error,
+            }
 
-    last_err: Optional[Exception] = None
-    for attempt in range(max_retries):
-        try:
-            r = requests.get(url, headers=headers, params=merged, timeout=15)
 
-            if r.status_code in (429, 500, 502, 503, 504):
-                time.sleep(min(8, 1.2 * (2**attempt)))
-                continue
+def warm_catalog(auth: Tuple[Dict[str, str], Dict[str, Any]], status: WarmupStatus) -> None:
+    """
+    답변 조합이 도달하는 장르 x 언어마다 사이드바 기본 필터로 Discover 풀과 상위 WARMUP_TOP_N편 상세를 캐시에 채운다.
+    기본 제출(의미 재랭킹 꺼짐)의 후보는 답변과 무관하게 평점/인기도 순이라 장르 x 언어마다 한 번이면 된다.
+    실제 제출과 같은 단계/캐시 함수를 호출하므로 같은 키로 저장되고, TMDB 호출은 공용 rate limiter를 거친다.
+    """
+    combos = itertools.product(*[range(len(item["options"])) for item in QUESTIONS])
+    genre_keys = sorted({analyze_answers(list(combo)).genre_key for combo in combos})
+    jobs = [(genre_key, lang) for genre_key in genre_keys for lang in LANGUAGE_OPTIONS]
+    status.begin(len(jobs))
+
+    def warm_one(genre_key: str, lang: str) -> None:
+        # 답변 조합 테이블과 같은 규칙 - 로컬 카탈로그가 있는 언어는 제출도 로컬 백엔드를 쓴다
+        options = RecommendOptions(language=lang, backend="local" if get_local_catalog(lang) is not None else "tmdb")
+        pool = candidate_pool(genre_key, options, auth)
+        for m in rank_pool(pool, WARMUP_TOP_N):
+            if isinstance(m.get("id"), int):
+                movie_details_cached(_auth=auth, movie_id=m["id"], language=lang, with_trailer=DEFAULT_SHOW_TRAILER)
+
+    with ThreadPoolExecutor(max_workers=max(1, WARMUP_MAX_WORKERS), thread_name_prefix="catalog-warmup") as ex:
+        futures = [ex.submit(warm_one, genre_key, lang) for genre_key, lang in jobs]
+        for fut in as_completed(futures):
+            status.advance(fut.exception())
+
+    status.finish()
+
+
+@shared_resource
+def start_catalog_warmer() -> Optional[WarmupStatus]:
+    """프로세스당 한 번 백그라운드 워밍 스레드를 시작 (WARMUP_INTERVAL_SECONDS마다 반복)"""
+    headers, base_params = build_tmdb_auth(TMDB_WARMUP_API_KEY, TMDB_WARMUP_BEARER)
+    if "Authorization" not in headers and "api_key" not in base_params:
+        return None
+
+    status = WarmupStatus()
+
+    def loop() -> None:
+        while True:
+            try:
+                warm_catalog((headers, base_params), status)
+            except Exception as e:
+                status.fail(e)
+            if WARMUP_INTERVAL_SECONDS <= 0:
+                return
+            time.sleep(WARMUP_INTERVAL_SECONDS)
 
-            r.raise_for_status()
-            return r.json()
+    threading.Thread(target=loop, name="catalog-warmer", daemon=True).start()
+    return status
 
-        except requests.RequestException as e:
-            last_err = e
-            time.sleep(min(8, 1.2 * (2**attempt)))
 
-    raise RuntimeError(f"TMDB 요청 실패: {last_err}")
+warmup_status = start_catalog_warmer()
+
+
+# ============================================================
+# Helpers - Materialized answer table
+# ============================================================
+ANSWER_TABLE_FORMAT = 1
 
 
-@st.cache_data(ttl=60 * 30)
-def discover_movies_cached(
-    auth_fingerprint: str,
-    genre_id: int,
+def answer_profile(
     language: str,
     include_adult: bool,
     min_vote_avg: float,
     min_vote_count: int,
     pages: int,
-) -> List[Dict[str, Any]]:
-    headers, base_params = st.session_state["tmdb_auth"]
-
-    pool: List[Dict[str, Any]] = []
-    for page in range(1, pages + 1):
-        data = tmdb_get(
-            "/discover/movie",
-            headers=headers,
-            base_params=base_params,
-            params={
-                "with_genres": genre_id,
-                "language": language,
-                "sort_by": "popularity.desc",
-                "include_adult": str(include_adult).lower(),
-                "page": page,
-                "vote_average.gte": min_vote_avg,
-                "vote_count.gte": min_vote_count,
-            },
-        )
-        pool.extend(data.get("results") or [])
+    backend: str,
+    semantic: bool,
+) -> Dict[str, Any]:
+    """상위 5편 결과를 좌우하는 설정 묶음. 이 값이 같아야 테이블 결과를 그대로 쓸 수 있다"""
+    return {
+        "language": language,
+        "include_adult": include_adult,
+        "min_vote_avg": round(float(min_vote_avg), 2),
+        "min_vote_count": int(min_vote_count),
+        "pages": int(pages),
+        "backend": backend,
+        "semantic_weight": SEMANTIC_WEIGHT if semantic else None,
+    }
+
+
+def answer_profile_key(profile: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(profile, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
 
-    uniq: Dict[int, Dict[str, Any]] = {}
+def answer_index(option_indices: List[int]) -> int:
+    """답변 조합 -> 행 번호 (Q1이 최상위 자리인 혼합 진법)"""
+    index = 0
+    for item, opt in zip(QUESTIONS, option_indices):
+        index = index * len(item["options"]) + opt
+    return index
+
+
+def questions_digest() -> str:
+    """질문/선택지/장르 결정 규칙이 바뀌면 달라지는 값 - 달라지면 장르/이유를 전부 다시 계산"""
+    parts = [
+        json.dumps([QUESTIONS, CATEGORY_BY_OPTION_INDEX, DISPLAY_LABEL], ensure_ascii=False, sort_keys=True),
+        inspect.getsource(decide_final_genre),
+        inspect.getsource(build_reason),
+    ]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def pool_digest(pool: List[MovieRecord]) -> str:
+    """후보 풀 내용 요약 (점수/유사도에 쓰이는 필드) - 같으면 그 장르의 상위 5편은 다시 계산할 필요가 없다"""
+    h = hashlib.blake2b(digest_size=8)
     for m in pool:
-        mid = m.get("id")
-        if isinstance(mid, int) and mid not in uniq:
-            uniq[mid] = m
+        fields = (m.get("id"), m.get("vote_average"), m.get("popularity"), m.get("poster_path"), m.get("title"), m.get("overview"))
+        h.update(repr(fields).encode("utf-8"))
+    return h.hexdigest()
 
-    return list(uniq.values())
 
+class AnswerTable:
+    """
+    퀴즈 답변 조합 전체에 대해 (장르, 이유 문장, 상위 5편 id/점수/유사도)를 미리 계산해 둔 테이블.
+    - 프로필(answer_profile)마다 JSON 파일 하나, 시작 시 전부 메모리로 읽어 제출은 dict 조회 1번
+    - 영화 레코드는 장르별 pools에 한 번만 저장하고 행에서는 id로 참조
+    - 재빌드는 증분: 질문 digest가 같고 장르 풀 digest가 같은 행은 그대로 재사용
+    """
 
-@st.cache_data(ttl=60 * 60)
-def movie_details_cached(
-    auth_fingerprint: str,
-    movie_id: int,
-    language: str,
-    with_trailer: bool,
-) -> Dict[str, Any]:
-    headers, base_params = st.session_state["tmdb_auth"]
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._tables: Dict[str, Dict[str, Any]] = {}
+        self.counters = {"hits": 0, "misses": 0, "builds": 0, "rows_reused": 0, "rows_computed": 0}
+        self.last_error: Optional[str] = None
+        # 마지막 재빌드가 실패한 프로필 키 -> 에러. 다음 빌드가 성공할 때까지 그 테이블은 조회하지 않는다
+        self._failed: Dict[str, str] = {}
+        self._load_all()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_all(self) -> None:
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if data.get("format") == ANSWER_TABLE_FORMAT:
+                self._tables[name[: -len(".json")]] = data
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._tables.get(key)
+
+    def put(self, key: str, data: Dict[str, Any]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self._path(key) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self._path(key))
+        with self._lock:
+            self._tables[key] = data
+            self._failed.pop(key, None)
+
+    def record_build(self, reused: int, computed: int) -> None:
+        with self._lock:
+            self.counters["builds"] += 1
+            self.counters["rows_reused"] += reused
+            self.counters["rows_computed"] += computed
+
+    def record_failure(self, key: str, error: Exception) -> None:
+        with self._lock:
+            self._failed[key] = str(error)
+            self.last_error = str(error)
+
+    def lookup(self, profile: Dict[str, Any], option_indices: List[int]) -> Optional[Dict[str, Any]]:
+        """
+        조건이 맞으면 {"genre_key", "reason", "top5": [MovieRecord], "scores", "semantic"} 반환.
+        질문이 바뀌었거나, 오래됐거나, 마지막 재빌드가 실패한 테이블이면 None (일반 경로로 계산)
+        """
+        key = answer_profile_key(profile)
+        with self._lock:
+            table = None if key in self._failed else self._tables.get(key)
+        row = None
+        if (
+            table is not None
+            and table.get("questions_digest") == ANSWER_QUESTIONS_DIGEST
+            and time.time() - table.get("built_at", 0) <= ANSWER_TABLE_MAX_AGE
+        ):
+            rows = table["rows"]
+            index = answer_index(option_indices)
+            row = rows[index] if 0 <= index < len(rows) else None
+            # 후보가 없던 조합은 일반 경로에서 안내 문구를 보여주도록 미스로 처리
+            if row and not row[2]:
+                row = None
+        with self._lock:
+            self.counters["hits" if row else "misses"] += 1
+        if not row:
+            return None
+
+        genre_key, reason, ids, scores, sims = row
+        movies = table["pools"][genre_key]["movies"]
+        return {
+            "genre_key": genre_key,
+            "reason": reason,
+            "top5": [MovieRecord(**movies[str(mid)]) for mid in ids],
+            "scores": scores,
+            "semantic": dict(zip(ids, sims)) if sims else {},
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "last_error": self.last_error,
+                "failed_profiles": len(self._failed),
+                "hit_ratio": round(self.counters["hits"] / total, 3) if total else None,
+                "tables": {
+                    key: {
+                        "language": t["profile"]["language"],
+                        "backend": t["profile"]["backend"],
+                        "rows": len(t["rows"]),
+                        "age_s": round(time.time() - t.get("built_at", 0)),
+                    }
+                    for key, t in self._tables.items()
+                },
+            }
 
-    params: Dict[str, Any] = {"language": language}
-    if with_trailer:
-        params["append_to_response"] = "videos"
 
-    return tmdb_get(f"/movie/{movie_id}", headers=headers, base_params=base_params, params=params)
+ANSWER_QUESTIONS_DIGEST = questions_digest()
 
 
-def poster_url(poster_path: Optional[str]) -> Optional[str]:
-    if not poster_path:
-        return None
-    return POSTER_BASE + poster_path
+@shared_resource
+def get_answer_table() -> AnswerTable:
+    return AnswerTable(ANSWER_TABLE_DIR)
 
 
-def extract_youtube_trailer(videos_obj: Dict[str, Any]) -> Optional[str]:
-    results = (videos_obj or {}).get("results") or []
-    youtube = [v for v in results if v.get("site") == "YouTube" and v.get("key")]
+def build_answer_table(
+    table: AnswerTable,
+    profile: Dict[str, Any],
+    auth: Optional[Tuple[Dict[str, str], Dict[str, Any]]],
+) -> None:
+    """
+    profile에 대해 모든 답변 조합의 결과를 계산해 저장한다 (증분).
+    장르 결정/후보 풀/재랭킹은 실제 제출과 같은 engine 단계 함수를 거치므로 캐시/레이트 리미터도 공유한다.
+    """
+    key = answer_profile_key(profile)
+    previous = table.get(key) or {}
+    q_digest = ANSWER_QUESTIONS_DIGEST
+    same_questions = previous.get("questions_digest") == q_digest
+    old_rows = previous.get("rows") or []
+    options = RecommendOptions(
+        language=profile["language"],
+        include_adult=profile["include_adult"],
+        min_vote_avg=profile["min_vote_avg"],
+        min_vote_count=profile["min_vote_count"],
+        pages=profile["pages"],
+        backend=profile["backend"],
+        use_semantic=profile["semantic_weight"] is not None,
+    )
+
+    # 1) 조합마다 장르/이유 (순수 함수라 항상 바로 계산)
+    combos = list(itertools.product(*[range(len(item["options"])) for item in QUESTIONS]))
+    decided = []
+    for combo in combos:
+        decision = analyze_answers(list(combo))
+        decided.append((decision.texts, decision.genre_key, decision.reason))
+
+    # 2) 필요한 장르 풀만 조회
+    pools: Dict[str, List[MovieRecord]] = {}
+    pool_by_id: Dict[str, Dict[int, MovieRecord]] = {}
+    pools_out: Dict[str, Dict[str, Any]] = {}
+    for genre_key in sorted({g for _, g, _ in decided}):
+        pool = candidate_pool(genre_key, options, auth)
+        pools[genre_key] = pool
+        pool_by_id[genre_key] = {m.get("id"): m for m in pool}
+        pools_out[genre_key] = {"digest": pool_digest(pool), "movies": {}}
+    old_pools = previous.get("pools") or {}
+
+    # 3) 상위 5편: 질문과 그 장르 풀이 그대로면 이전 행 재사용
+    rows = []
+    reused = 0
+    for index, (texts, genre_key, reason) in enumerate(decided):
+        pool_info = pools_out[genre_key]
+        old = old_rows[index] if same_questions and index < len(old_rows) else None
+        if old and old[0] == genre_key and old_pools.get(genre_key, {}).get("digest") == pool_info["digest"]:
+            _, _, ids, scores, sims = old
+            reused += 1
+        else:
+            ranked = rank_candidates(pools[genre_key], texts, options)
+            ids = [m["id"] for m in ranked.top5]
+            scores = [round(sc, 6) for sc in ranked.scores]
+            sims = [round(ranked.semantic_by_id[mid], 6) for mid in ids] if ranked.semantic_by_id else []
+        for mid in ids:
+            pool_info["movies"].setdefault(str(mid), pool_by_id[genre_key][mid].to_dict())
+        rows.append([genre_key, reason, ids, scores, sims])
+
+    table.put(
+        key,
+        {
+            "format": ANSWER_TABLE_FORMAT,
+            "profile": profile,
+            "questions_digest": q_digest,
+            "built_at": time.time(),
+            "pools": pools_out,
+            "rows": rows,
+        },
+    )
+    table.record_build(reused, len(rows) - reused)
 
-    if not youtube:
-        return None
 
-    def score(v: Dict[str, Any]) -> int:
-        t = (v.get("type") or "").lower()
-        official = v.get("official") is True
-        s = 0
-        if t == "trailer":
-            s += 20
-        elif t == "teaser":
-            s += 10
-        if official:
-            s += 5
-        return s
+@shared_resource
+def start_answer_table_builder() -> Optional[AnswerTable]:
+    """
+    프로세스당 한 번 백그라운드로 언어별 기본 프로필 테이블을 빌드 (ANSWER_TABLE_INTERVAL_SECONDS마다 증분 갱신).
+    로컬 카탈로그도, TMDB_WARMUP_* 인증도 없는 언어는 건너뛴다.
+    """
+    table = get_answer_table()
+    headers, base_params = build_tmdb_auth(TMDB_WARMUP_API_KEY, TMDB_WARMUP_BEARER)
+    has_auth = "Authorization" in headers or "api_key" in base_params
+    profiles = []
+    for lang in LANGUAGE_OPTIONS:
+        backend = "local" if get_local_catalog(lang) is not None else "tmdb"
+        if backend == "tmdb" and not has_auth:
+            continue
+        profiles.append(
+            answer_profile(
+                lang,
+                DEFAULT_INCLUDE_ADULT,
+                DEFAULT_MIN_VOTE_AVG,
+                DEFAULT_MIN_VOTE_COUNT,
+                DEFAULT_PAGES_TO_POOL,
+                backend,
+                semantic=DEFAULT_SEMANTIC_RERANK,
+            )
+        )
+    if not profiles:
+        return table
 
-    youtube.sort(key=score, reverse=True)
-    return f"https://www.youtube.com/watch?v={youtube[0]['key']}"
+    def loop() -> None:
+        while True:
+            for profile in profiles:
+                try:
+                    build_answer_table(table, profile, (headers, base_params))
+                except Exception as e:
+                    # 다음 주기에 다시 시도 - 그 사이 제출은 이 테이블 없이 일반 경로로 동작
+                    table.record_failure(answer_profile_key(profile), e)
+            if ANSWER_TABLE_INTERVAL_SECONDS <= 0:
+                return
+            time.sleep(ANSWER_TABLE_INTERVAL_SECONDS)
 
+    threading.Thread(target=loop, name="answer-table-builder", daemon=True).start()
+    return table
 
-# ============================================================
-# Helpers - Genre decision & reasons
-# ============================================================
-def decide_final_genre(selected_texts: List[str], category_counts: Counter) -> str:
-    top_category = category_counts.most_common(1)[0][0]
-
-    if top_category == "action_adventure":
-        return "action"
-    if top_category == "comedy":
-        return "comedy"
-
-    if top_category == "romance_drama":
-        romance_keywords = ["관계", "감정선", "감정이입", "로맨스", "설렘"]
-        drama_keywords = ["여운", "성장", "현실", "고민", "정리", "천천히"]
-        romance_score = sum(any(k in t for k in romance_keywords) for t in selected_texts)
-        drama_score = sum(any(k in t for k in drama_keywords) for t in selected_texts)
-        return "romance" if romance_score > drama_score else "drama"
-
-    if top_category == "sf_fantasy":
-        scifi_keywords = ["설정", "참신", "미래", "과학", "우주", "AI", "시간"]
-        fantasy_keywords = ["능력", "운명", "마법", "전설", "왕국", "드래곤", "특별한"]
-        scifi_score = sum(any(k in t for k in scifi_keywords) for t in selected_texts)
-        fantasy_score = sum(any(k in t for k in fantasy_keywords) for t in selected_texts)
-        return "fantasy" if fantasy_score > scifi_score else "scifi"
-
-    return "drama"
-
-
-def build_reason(genre_key: str, selected_texts: List[str], category_counts: Counter) -> str:
-    label = DISPLAY_LABEL.get(genre_key, genre_key)
-    top_cat, top_cnt = category_counts.most_common(1)[0]
-    cat_kor = {
-        "romance_drama": "로맨스/드라마",
-        "action_adventure": "액션/어드벤처",
-        "sf_fantasy": "SF/판타지",
-        "comedy": "코미디",
-    }.get(top_cat, top_cat)
-
-    picks = []
-    for t in selected_texts:
-        if len(picks) >= 2:
-            break
-        picks.append(t if len(t) <= 28 else t[:28] + "…")
-
-    base = f"답변에서 **{cat_kor} 성향**이 가장 강했어요({top_cnt}/5). - 그래서 **{label}** 장르가 잘 맞습니다."
-    if picks:
-        base += f" - 취향 포인트: “{picks[0]}”" + (f", “{picks[1]}”" if len(picks) > 1 else "")
-    return base
+
+start_answer_table_builder()
 
 
 # ============================================================
-# Helpers - OpenAI Responses API
+# Helpers - Stage timings
 # ============================================================
-def openai_extract_output_text(resp_json: Dict[str, Any]) -> str:
-    """
-    Responses API: output[] -> message -> content[] -> output_text.text
+class StageTimer:
     """
-    out = resp_json.get("output") or []
-    chunks: List[str] = []
-    for item in out:
-        if item.get("type") == "message":
-            for c in item.get("content") or []:
-                if c.get("type") == "output_text" and isinstance(c.get("text"), str):
-                    chunks.append(c["text"])
-    return "\n".join(chunks).strip()
-
-
-def openai_pick_one_movie(
-    api_key: str,
-    model: str,
-    user_answers: List[str],
-    inferred_genre_key: str,
-    candidates: List[Dict[str, Any]],
-) -> Dict[str, Any]:
-    """
-    candidates: list of dicts with fields: id, title, overview, vote_average, vote_count, release_date
-    returns: {"movie_id": int, "title": str, "reason": str, "confidence": float}
+    제출 1회의 단계별 소요 시간(초). 같은 이름을 여러 번 재면 합산한다.
+    - stage(): 스크립트 스레드에서 순서대로 실행되는 구간
+    - add(): 다른 스레드에서 잰 시간 (예: 파이프라인으로 겹쳐 도는 LLM 호출) - render 계산에서 제외
+    - finish(): total과, 측정 구간 밖에서 쓴 시간(카드/헤더 렌더링 등)을 render로 채운다
     """
-    api_key = (api_key or "").strip()
-    if not api_key:
-        raise ValueError("OpenAI API Key가 비어있습니다.")
-
-    schema = {
-        "type": "object",
-        "additionalProperties": False,
-        "properties": {
-            "movie_id": {"type": "integer", "description": "최종 추천 영화의 TMDB movie id"},
-            "title": {"type": "string", "description": "최종 추천 영화 제목"},
-            "reason": {"type": "string", "description": "사용자의 답변과 후보 영화 정보에 근거한 추천 이유 (2~4문장)"},
-            "confidence": {"type": "number", "minimum": 0, "maximum": 1, "description": "추천 확신도 (0~1)"},
-        },
-        "required": ["movie_id", "title", "reason", "confidence"],
-    }
 
-    inferred = DISPLAY_LABEL.get(inferred_genre_key, inferred_genre_key)
-
-    prompt_user = {
-        "role": "user",
-        "content": (
-            "아래는 대학생 사용자의 심리테스트 답변과, TMDB에서 뽑은 후보 영화 5편이다.\n"
-            "목표: ‘사용자가 실제로 가장 좋아할 가능성이 높은 단 한 편’을 고른다.\n\n"
-            f"[사용자 답변]\n- " + "\n- ".join(user_answers) + "\n\n"
-            f"[시스템이 추정한 선호 장르]\n- {inferred} ({inferred_genre_key})\n\n"
-            "[후보 영화 5편]\n"
-            + "\n".join(
-                [
-                    (
-                        f"- id={m['id']} | title={m.get('title','')} | vote={m.get('vote_average','')} "
-                        f"| votes={m.get('vote_count','')} | release={m.get('release_date','')}\n"
-                        f"  overview={m.get('overview','')}"
-                    )
-                    for m in candidates
-                ]
-            )
-            + "\n\n"
-            "선정 기준:\n"
-            "1) 답변에서 드러난 ‘시청 동기’(힐링/자극/몰입/웃음)와 톤이 잘 맞는가\n"
-            "2) 줄거리가 너무 무겁거나 난해한 경우는 감점(단, 답변이 몰입/세계관을 강하게 원하면 예외)\n"
-            "3) 후보 중 중복된 결(비슷한 톤)이면, 더 접근성이 좋고 만족도가 높을 것으로 보이는 쪽을 선택\n\n"
-            "출력은 반드시 JSON만."
-        ),
-    }
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self._script_thread_total = 0.0
 
-    instructions = (
-        "너는 개인화 추천 전문가다. "
-        "사용자의 답변을 근거로, 후보 5편 중 최적 1편을 고른다. "
-        "반드시 주어진 JSON 스키마로만 출력한다."
-    )
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            self._script_thread_total += elapsed
 
-    body = {
-        "model": model,
-        "instructions": instructions,
-        "input": [prompt_user],
-        "temperature": 0.4,
-        "max_output_tokens": 400,
-        "text": {
-            "format": {
-                "type": "json_schema",
-                "strict": True,
-                "schema": schema,
-            }
-        },
-    }
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
 
-    r = requests.post(
-        f"{OPENAI_API_BASE}/responses",
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}",
-        },
-        data=json.dumps(body),
-        timeout=30,
-    )
+    def finish(self) -> Dict[str, float]:
+        total = time.perf_counter() - self.started
+        self.stages["render"] = self.stages.get("render", 0.0) + max(0.0, total - self._script_thread_total)
+        self.stages["total"] = total
+        return {name: round(v, 6) for name, v in self.stages.items()}
 
-    # 에러 처리
-    if r.status_code in (401, 403):
-        raise RuntimeError("OpenAI 인증 실패: API Key를 확인해 주세요.")
-    if r.status_code == 429:
-        raise RuntimeError("OpenAI 요청이 너무 많습니다(429). 잠시 후 다시 시도해 주세요.")
-    if r.status_code >= 400:
-        raise RuntimeError(f"OpenAI 요청 실패({r.status_code}): {r.text[:400]}")
 
-    resp_json = r.json()
-    text = openai_extract_output_text(resp_json)
-    if not text:
-        raise RuntimeError("OpenAI 응답에서 텍스트를 추출하지 못했습니다.")
+# ============================================================
+# Helpers - Metrics export
+# ============================================================
+def collect_app_stats() -> Iterator[Tuple[str, str, str, Dict[str, str], float]]:
+    """앱에만 있는 캐시(답변 조합 테이블, 포스터 썸네일) 지표 - 엔진 collector에 더해 등록"""
+    yield from cache_samples("answer_table", get_answer_table().stats())
+    yield from cache_samples("posters", get_poster_cache().stats())
 
-    try:
-        parsed = json.loads(text)
-    except json.JSONDecodeError:
-        # 마지막 보험: 텍스트에서 JSON 구간만 잘라 파싱
-        start = text.find("{")
-        end = text.rfind("}")
-        if start == -1 or end == -1 or end <= start:
-            raise RuntimeError("OpenAI JSON 파싱 실패: 유효한 JSON을 찾지 못했습니다.")
-        parsed = json.loads(text[start : end + 1])
 
-    return parsed
+@shared_resource
+def get_app_metrics() -> Registry:
+    registry = get_metrics()
+    registry.add_collector(collect_app_stats)
+    return registry
+
+
+get_app_metrics()
+
+
+def record_submit_metrics(stage_timings: Dict[str, float]) -> None:
+    """제출 1회의 단계별 시간을 히스토그램에 넣고, 설정돼 있으면 textfile도 갱신"""
+    metrics = get_metrics()
+    hist = metrics.histogram("submit_stage_seconds", "제출 1회의 단계별 소요 시간", ("stage",))
+    for stage, seconds in stage_timings.items():
+        hist.observe(seconds, stage=stage)
+    metrics.counter("submits_total", "결과 보기 제출 수").inc()
+    if METRICS_TEXTFILE:
+        try:
+            write_textfile(metrics, METRICS_TEXTFILE)
+        except OSError:
+            pass
+
+
+# ============================================================
+# Helpers - Run cancellation
+# ============================================================
+def cancel_run(deadline: Deadline, reason: str) -> None:
+    if not deadline.closed and not deadline.cancelled():
+        deadline.cancel()
+        get_metrics().counter("runs_cancelled_total", "버려진 실행이라 취소한 제출 수", ("reason",)).inc(reason=reason)
+
+
+class RunHeartbeat:
+    """
+    Streamlit은 스크립트 스레드가 st 명령을 호출할 때에만 rerun/stop 요청을 처리한다 (그 자리에서 예외로 스크립트를 끝냄).
+    외부 호출을 기다리는 동안 보이지 않는 자리표시자를 RERUN_POLL_SECONDS마다 비워 그 처리 지점을 만든다.
+    그러면 위젯 변경으로 버려진 실행이 기다리던 곳에서 바로 끝나고, 제출의 except 블록이 deadline을 취소한다.
+    """
+
+    def __init__(self) -> None:
+        self._slot = st.empty()
+
+    def beat(self) -> None:
+        self._slot.empty()
+
+    def call(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """fn(*args)을 작업 스레드에서 실행하고 끝날 때까지 beat()하며 기다린다 (fn의 예외는 그대로 다시 던짐)"""
+        fut: "Future[Any]" = Future()
+
+        def run() -> None:
+            try:
+                fut.set_result(fn(*args))
+            except BaseException as e:
+                fut.set_exception(e)
+
+        thread = threading.Thread(target=run, name="submit-io", daemon=True)
+        ctx = get_script_run_ctx()
+        if ctx is not None:
+            add_script_run_ctx(thread, ctx)
+        thread.start()
+        while True:
+            try:
+                return fut.result(timeout=RERUN_POLL_SECONDS)
+            except FutureTimeoutError:
+                self.beat()
+
+
+def stop_run(deadline: Deadline) -> None:
+    """정상적인 조기 종료 - st.stop()이 거는 stop 요청을 취소로 세지 않도록 deadline을 먼저 닫는다"""
+    deadline.close()
+    st.stop()
 
 
 # ============================================================
@@ -458,7 +863,7 @@ def openai_pick_one_movie(
 selected_texts: List[str] = []
 selected_option_indices: List[int] = []
 
-for i, item in enumerate(questions, start=1):
+for i, item in enumerate(QUESTIONS, start=1):
     st.subheader(item["q"])
     choice = st.radio("", item["options"], key=f"q{i}")
     selected_texts.append(choice)
@@ -470,6 +875,13 @@ st.divider()
 # ============================================================
 # Submit
 # ============================================================
+# 로컬 최종 1편 카드의 설명 (engine.local_pick / LLM 생략의 source별)
+LOCAL_PICK_REASONS = {
+    "margin": "추천 후보 중 평점/인기도와 답변 유사도를 합친 점수가 다른 후보보다 확실히 높아요.",
+    "semantic": "추천 후보 중 답변 내용과 줄거리가 가장 비슷한 영화예요.",
+    "rank": "추천 후보 중 평점과 인기도를 합친 점수가 가장 높은 영화예요.",
+}
+
 if st.button("결과 보기", type="primary"):
     # --- TMDB Auth check ---
     headers, base_params = build_tmdb_auth(api_key_v3, read_access_token_v4)
@@ -477,129 +889,129 @@ if st.button("결과 보기", type="primary"):
         st.warning("사이드바에 TMDB 인증 정보를 입력해 주세요. - v4 토큰(Bearer) 또는 v3 API Key 중 하나면 됩니다.")
         st.stop()
 
-    st.session_state["tmdb_auth"] = (headers, base_params)
-    auth_fingerprint = "bearer" if "Authorization" in headers else "apikey"
-
-    # --- 1) 답변 분석 -> 장르 결정 ---
-    categories = [category_by_option_index[idx] for idx in selected_option_indices]
-    category_counts = Counter(categories)
-    final_genre_key = decide_final_genre(selected_texts, category_counts)
-    final_genre_id = TMDB_GENRE_IDS[final_genre_key]
-
-    # --- 2) TMDB Discover -> 후보 풀 ---
-    with st.spinner("분석 중..."):
-        try:
-            pool = discover_movies_cached(
-                auth_fingerprint=auth_fingerprint,
-                genre_id=final_genre_id,
-                language=language,
-                include_adult=include_adult,
-                min_vote_avg=min_vote_avg,
-                min_vote_count=min_vote_count,
-                pages=pages_to_pool,
-            )
-        except Exception as e:
-            st.error("TMDB Discover 요청에 실패했습니다. - 인증/네트워크 상태를 확인해 주세요.")
-            st.caption(str(e))
-            st.stop()
-
-    if not pool:
-        st.info("조건에 맞는 영화가 없습니다. - 최소 평점/투표수 필터를 낮춰보세요.")
+    tmdb_auth = (headers, base_params)
+    if get_auth_failure_cache().is_failed(tmdb_auth_fingerprint(headers, base_params)):
+        st.error("TMDB 인증에 실패한 키입니다. - 사이드바의 TMDB 인증 정보를 확인해 주세요.")
         st.stop()
 
-    # --- 3) 간단 재랭킹(고도화) ---
-    def blended_score(m: Dict[str, Any]) -> float:
-        pop = float(m.get("popularity") or 0.0)
-        vote = float(m.get("vote_average") or 0.0)
-        # popularity는 스케일이 커서 sqrt로 완화
-        return (vote * 2.0) + (0.6 * (pop ** 0.5))
-
-    pool.sort(key=blended_score, reverse=True)
-    pool.sort(key=lambda m: 0 if m.get("poster_path") else 1)  # 포스터 없는 건 뒤로
-
-    top5 = pool[:5]
+    # 이번 제출 전체의 시간 예산 - 아래 모든 외부 호출에 전달
+    deadline = Deadline(SUBMIT_DEADLINE_SECONDS)
+    # 위젯 변경으로 이 실행이 버려지면 기다리던 자리에서 끝나고, 남은 외부 호출/재시도/백오프도 취소된다
+    heartbeat = RunHeartbeat()
+    try:
+        timer = StageTimer()
+        # 단계 함수는 batch.py(engine.recommend)와 같은 것을 쓴다 - UI는 중간 결과를 그리는 일만 한다
+        options = RecommendOptions(
+            language=language,
+            include_adult=include_adult,
+            min_vote_avg=min_vote_avg,
+            min_vote_count=min_vote_count,
+            pages=pages_to_pool,
+            backend="local" if use_local_catalog else "tmdb",
+            use_semantic=use_semantic_rerank,
+            use_llm=use_llm_final_pick,
+        )
 
-    # --- 4) Top5 상세 조회 + 표시용 정리 ---
-    movies_for_display: List[Dict[str, Any]] = []
-    with st.spinner("추천 목록 가져오는 중..."):
-        for base_movie in top5:
-            movie_id = base_movie.get("id")
-            if not isinstance(movie_id, int):
-                continue
-            try:
-                details = movie_details_cached(
-                    auth_fingerprint=auth_fingerprint,
-                    movie_id=movie_id,
-                    language=language,
-                    with_trailer=show_trailer,
-                )
-            except Exception:
-                details = base_movie
-
-            movies_for_display.append(
-                {
-                    "id": movie_id,
-                    "title": details.get("title") or base_movie.get("title") or "제목 없음",
-                    "overview": (details.get("overview") or base_movie.get("overview") or "").strip(),
-                    "vote_average": details.get("vote_average", base_movie.get("vote_average")),
-                    "vote_count": details.get("vote_count", base_movie.get("vote_count")),
-                    "release_date": details.get("release_date", base_movie.get("release_date")),
-                    "poster_path": details.get("poster_path") or base_movie.get("poster_path"),
-                    "videos": details.get("videos") if isinstance(details.get("videos"), dict) else None,
-                }
+        # --- 1) 답변 분석 -> 장르 결정 ---
+        with timer.stage("genre"):
+            decision = analyze_answers(selected_option_indices)
+            category_counts = decision.category_counts
+            final_genre_key = decision.genre_key
+            genre_reason = decision.reason
+
+            # 기본 프로필이면 미리 계산된 답변 조합 테이블에서 상위 5편을 바로 꺼낸다
+            materialized = get_answer_table().lookup(
+                answer_profile(
+                    language, include_adult, min_vote_avg, min_vote_count, pages_to_pool, options.backend, use_semantic_rerank
+                ),
+                selected_option_indices,
             )
 
-    # --- 결과 헤더 ---
-    st.success(f"당신과 어울리는 장르: **{DISPLAY_LABEL.get(final_genre_key, final_genre_key)}**")
-    st.caption(build_reason(final_genre_key, selected_texts, category_counts))
-    st.write("")
-
-    # --- 5) LLM 최종 1편 선정(옵션) ---
-    llm_pick: Optional[Dict[str, Any]] = None
-    if use_llm_final_pick:
-        if not openai_api_key.strip():
-            st.warning("LLM 최종 추천을 켰습니다. - 사이드바에 OpenAI API Key를 입력해 주세요.")
+        if materialized is not None:
+            ranked = RankedCandidates(materialized["top5"], materialized["scores"], materialized["semantic"])
         else:
-            # LLM에 넘길 후보는 "표시용" 5편 그대로
-            candidates_payload = []
-            for m in movies_for_display:
-                candidates_payload.append(
-                    {
-                        "id": m["id"],
-                        "title": m["title"],
-                        "overview": m["overview"],
-                        "vote_average": float(m["vote_average"] or 0.0),
-                        "vote_count": int(m["vote_count"] or 0),
-                        "release_date": m.get("release_date") or "",
-                    }
-                )
-
-            with st.spinner("LLM이 최종 1편을 고르는 중..."):
+            # --- 2) TMDB Discover -> 후보 풀 ---
+            with st.spinner("분석 중..."), timer.stage("discover"):
                 try:
-                    llm_pick = openai_pick_one_movie(
-                        api_key=openai_api_key,
-                        model=openai_model,
-                        user_answers=selected_texts,
-                        inferred_genre_key=final_genre_key,
-                        candidates=candidates_payload,
-                    )
+                    pool = heartbeat.call(candidate_pool, final_genre_key, options, tmdb_auth, deadline)
+                except TmdbAuthError as e:
+                    st.error("TMDB 인증에 실패했습니다. - 사이드바의 TMDB 인증 정보를 확인해 주세요.")
+                    st.caption(str(e))
+                    stop_run(deadline)
+                except (DeadlineExceeded, CircuitOpenError) as e:
+                    st.error("TMDB 응답이 지연되고 있어 추천을 가져오지 못했습니다. - 잠시 후 다시 시도해 주세요.")
+                    st.caption(str(e))
+                    stop_run(deadline)
                 except Exception as e:
-                    st.error("LLM 최종 추천에 실패했습니다. - OpenAI API Key/요청 상태를 확인해 주세요.")
+                    st.error("TMDB Discover 요청에 실패했습니다. - 인증/네트워크 상태를 확인해 주세요.")
                     st.caption(str(e))
-                    llm_pick = None
+                    stop_run(deadline)
+
+            if not pool:
+                st.info("조건에 맞는 영화가 없습니다. - 최소 평점/투표수 필터를 낮춰보세요.")
+                stop_run(deadline)
+
+            # --- 3) 간단 재랭킹(고도화) ---
+            # 답변 문장과 줄거리의 로컬 유사도 (네트워크 없음) - 정렬에 반영하고, LLM이 없을 때 최종 1편 선정에 사용
+            with timer.stage("rerank"):
+                ranked = rank_candidates(pool, selected_texts, options)
+        top5 = ranked.top5
+        semantic_by_id = ranked.semantic_by_id
+
+        # 카드보다 먼저 썸네일 생성을 걸어 두면 상세 조회가 끝날 즈음엔 대부분 준비돼 있다
+        get_poster_cache().prefetch(m.get("poster_path") for m in top5)
+        # 썸네일 대기는 카드 전체가 한 예산을 나눠 쓴다 - 준비 안 된 카드는 바로 원격 URL로 그린다
+        poster_wait = Deadline(min(POSTER_WAIT_SECONDS, deadline.remaining()))
+
+        # --- 결과 헤더 ---
+        st.success(f"당신과 어울리는 장르: **{DISPLAY_LABEL.get(final_genre_key, final_genre_key)}**")
+        st.caption(genre_reason)
+        st.write("")
+
+        # LLM 카드는 후보 5편 위에 표시되므로 자리만 먼저 잡아둔다
+        llm_section = st.container()
+
+        def render_candidate_card(m: Dict[str, Any]) -> None:
+            img = poster_image(m.get("poster_path"), poster_wait)
+            title = m.get("title", "제목 없음")
+            rating = m.get("vote_average")
+            overview = m.get("overview") or ""
+            trailer_url = m.get("trailer_url") if show_trailer else None
 
-    # --- 6) 최종 추천 강조 카드 ---
-    if llm_pick and isinstance(llm_pick, dict):
-        picked_id = llm_pick.get("movie_id")
-        picked_movie = next((m for m in movies_for_display if m["id"] == picked_id), None)
+            cols = st.columns([1, 2], vertical_alignment="top")
+
+            with cols[0]:
+                if img:
+                    st.image(img, use_container_width=True)
+                else:
+                    st.caption("포스터 없음")
 
-        if picked_movie:
-            st.subheader("✅ LLM 최종 추천 - 딱 한 편")
+            with cols[1]:
+                st.markdown(f"### {title}")
+                if rating is not None:
+                    try:
+                        st.write(f"평점: **{float(rating):.1f} / 10**")
+                    except Exception:
+                        st.write(f"평점: **{rating} / 10**")
+                else:
+                    st.write("평점: 정보 없음")
+
+                st.write(overview if overview else "줄거리: 정보 없음")
+                st.markdown(f"**이 영화를 추천하는 이유** - {genre_reason}")
+
+                if trailer_url:
+                    st.link_button("예고편 보기 (YouTube)", trailer_url)
+
+        display_by_index: Dict[int, Dict[str, Any]] = {}
+
+        def render_llm_card(picked_movie: Dict[str, Any], heading: str) -> Tuple[Any, Any]:
+            """최종 추천 카드 틀을 그리고, 추천 이유/확신도를 채울 슬롯을 돌려준다"""
+            st.subheader(heading)
             with st.container(border=True):
                 cols = st.columns([1, 2], vertical_alignment="top")
 
                 with cols[0]:
-                    img = poster_url(picked_movie.get("poster_path"))
+                    img = poster_image(picked_movie.get("poster_path"), poster_wait)
                     if img:
                         st.image(img, use_container_width=True)
                     else:
@@ -616,57 +1028,180 @@ if st.button("결과 보기", type="primary"):
                             st.write(f"평점: **{va} / 10**")
                     st.write(picked_movie["overview"] if picked_movie["overview"] else "줄거리: 정보 없음")
 
-                    reason = (llm_pick.get("reason") or "").strip()
-                    conf = llm_pick.get("confidence", None)
-
-                    if reason:
-                        st.markdown("**추천 이유**")
-                        st.write(reason)
-
-                    if isinstance(conf, (int, float)):
-                        st.progress(min(max(float(conf), 0.0), 1.0))
+                    reason_slot = st.empty()
+                    conf_slot = st.empty()
 
                     # 예고편 버튼
-                    if show_trailer and isinstance(picked_movie.get("videos"), dict):
-                        trailer_url = extract_youtube_trailer(picked_movie["videos"])
-                        if trailer_url:
-                            st.link_button("예고편 보기 (YouTube)", trailer_url)
-
-            st.divider()
-
-    # --- 7) TMDB Top5 전체 표시 ---
-    st.subheader("🎞️ 추천 후보 5편")
-    for m in movies_for_display:
-        img = poster_url(m.get("poster_path"))
-        title = m.get("title", "제목 없음")
-        rating = m.get("vote_average")
-        overview = m.get("overview") or ""
-        trailer_url = extract_youtube_trailer(m["videos"]) if (show_trailer and isinstance(m.get("videos"), dict)) else None
-
-        with st.container(border=True):
-            cols = st.columns([1, 2], vertical_alignment="top")
-
-            with cols[0]:
-                if img:
-                    st.image(img, use_container_width=True)
-                else:
-                    st.caption("포스터 없음")
+                    if show_trailer and picked_movie.get("trailer_url"):
+                        st.link_button("예고편 보기 (YouTube)", picked_movie["trailer_url"])
+            return reason_slot, conf_slot
+
+        with llm_section:
+            # 카드가 spinner/에러 메시지보다 위에 오도록 자리를 먼저 잡는다 (최종 결과가 다르면 통째로 다시 그림)
+            llm_card_slot = st.empty()
+            llm_card_area = llm_card_slot.container()
+            llm_status_area = st.container()
+        llm_card: Dict[str, Any] = {}
+
+        # --- 6) 최종 추천 강조 카드 (movie_id가 확정되고 그 영화 상세가 도착하는 즉시 표시) ---
+        def show_llm_pick(partial: Optional[Dict[str, Any]] = None) -> None:
+            if partial:
+                llm_card["partial"] = partial
+            partial = llm_card.get("partial")
+            if not partial:
+                return
+            if "reason_slot" not in llm_card:
+                picked_id = partial.get("movie_id")
+                picked_movie = next((m for m in display_by_index.values() if m["id"] == picked_id), None)
+                if picked_movie is None:
+                    return
+                with llm_card_area:
+                    llm_card["reason_slot"], llm_card["conf_slot"] = render_llm_card(
+                        picked_movie, llm_card.get("heading", "✅ LLM 최종 추천 - 딱 한 편")
+                    )
+                llm_card["movie_id"] = picked_id
+
+            reason = (partial.get("reason") or "").strip()
+            conf = partial.get("confidence", None)
+            if (reason, conf) == llm_card.get("shown"):
+                return
+            llm_card["shown"] = (reason, conf)
+            if reason:
+                llm_card["reason_slot"].markdown(f"**추천 이유**\n\n{reason}")
+            if isinstance(conf, (int, float)):
+                llm_card["conf_slot"].progress(min(max(float(conf), 0.0), 1.0))
+
+        # --- 5) LLM 최종 1편 선정(옵션) ---
+        def start_llm_pick() -> BackgroundPick:
+            return BackgroundPick(
+                api_key=openai_api_key,
+                model=openai_model,
+                user_answers=selected_texts,
+                inferred_genre_key=final_genre_key,
+                # 프롬프트 후보는 파이프라인 여부와 상관없이 Discover 필드의 상위 5편 (batch와 같은 입력 = 같은 캐시 키)
+                candidates=llm_candidates_payload(top5),
+                deadline=deadline,
+                stream=stream_llm,
+            )
 
-            with cols[1]:
-                st.markdown(f"### {title}")
-                if rating is not None:
+        llm_job: Optional[BackgroundPick] = None
+        want_llm = use_llm_final_pick and bool(openai_api_key.strip())
+        if use_llm_final_pick and not want_llm:
+            with llm_status_area:
+                st.warning("LLM 최종 추천을 켰습니다. - 사이드바에 OpenAI API Key를 입력해 주세요.")
+
+        # 로컬 순위 1위가 2위보다 확실히 앞서면 LLM을 부르지 않고 1위를 최종 추천으로 쓴다
+        llm_skip_margin: Optional[float] = None
+        if want_llm:
+            llm_skip_margin = llm_skip_decision(selected_texts, final_genre_key, top5, ranked.scores, openai_model)
+            want_llm = llm_skip_margin is None
+
+        # 파이프라인 모드: 프롬프트에 필요한 필드는 Discover 결과에 이미 있으므로 상세 조회를 기다리지 않는다
+        if want_llm and pipeline_llm:
+            llm_job = start_llm_pick()
+
+        # --- 4) Top5 상세 조회(병렬) -> 도착하는 카드부터 바로 표시 ---
+        st.subheader("🎞️ 추천 후보 5편")
+        card_slots = [st.empty() for _ in top5]
+        for slot in card_slots:
+            slot.caption("불러오는 중...")
+
+        with st.spinner("추천 목록 가져오는 중..."), timer.stage("details"):
+            for i, m in iter_details_parallel(
+                    top5, tmdb_auth, language, show_trailer, deadline=deadline, on_idle=heartbeat.beat
+                ):
+                display_by_index[i] = m
+                with card_slots[i].container(border=True):
+                    render_candidate_card(m)
+                if llm_job is not None:
+                    show_llm_pick(llm_job.poll())
+
+        if want_llm and llm_job is None:
+            llm_job = start_llm_pick()
+
+        final_pick: Optional[Dict[str, Any]] = None
+        saved_s = 0.0
+        if llm_skip_margin is not None:
+            saved_s = get_llm_metrics().record_skip()
+            final_pick = {"movie_id": top5[0]["id"], "source": "margin"}
+        elif llm_job is not None:
+            llm_pick: Optional[Dict[str, Any]] = None
+            with llm_status_area:
+                with st.spinner("LLM이 최종 1편을 고르는 중..."), timer.stage("llm_wait"):
+                    while not llm_job.done():
+                        show_llm_pick(llm_job.wait(0.05))
+                        heartbeat.beat()
+                    show_llm_pick(llm_job.poll())
                     try:
-                        st.write(f"평점: **{float(rating):.1f} / 10**")
-                    except Exception:
-                        st.write(f"평점: **{rating} / 10**")
-                else:
-                    st.write("평점: 정보 없음")
-
-                st.write(overview if overview else "줄거리: 정보 없음")
-                st.markdown(f"**이 영화를 추천하는 이유** - {build_reason(final_genre_key, selected_texts, category_counts)}")
-
-                if trailer_url:
-                    st.link_button("예고편 보기 (YouTube)", trailer_url)
+                        llm_pick = llm_job.result()
+                    except (DeadlineExceeded, CircuitOpenError) as e:
+                        st.info("LLM 응답이 지연되어 최종 1편 선정은 건너뛰었습니다. - 아래 후보 5편을 참고해 주세요.")
+                        st.caption(str(e))
+                    except Exception as e:
+                        st.error("LLM 최종 추천에 실패했습니다. - OpenAI API Key/요청 상태를 확인해 주세요.")
+                        st.caption(str(e))
+            final_pick = accept_llm_pick(llm_pick, ranked, bool(llm_job.timings.get("cached")))
+        # LLM을 쓰지 않았거나 실패했으면 로컬 점수로 최종 1편 (OpenAI 장애와 무관)
+        if final_pick is None and top5:
+            final_pick = local_pick(ranked)
+
+        if final_pick and "reason_slot" in llm_card and (
+            final_pick["source"] in LOCAL_PICK_REASONS or final_pick["movie_id"] != llm_card.get("movie_id")
+        ):
+            # 스트리밍으로 먼저 그린 LLM 카드가 최종 결과와 다르다 (LLM 실패/후보 밖 선택 -> 로컬 선정) - 비우고 다시 그린다
+            llm_card.clear()
+            llm_card_slot.empty()
+            llm_card_area = llm_card_slot.container()
+
+        if final_pick and final_pick["source"] in LOCAL_PICK_REASONS:
+            if display_by_index:
+                llm_card["heading"] = "🧭 로컬 추천 - 딱 한 편"
+                show_llm_pick({"movie_id": final_pick["movie_id"], "reason": LOCAL_PICK_REASONS[final_pick["source"]]})
+                with llm_card_area:
+                    if final_pick["source"] == "margin":
+                        st.caption(
+                            f"1·2위 점수 차 {llm_skip_margin:.0%} ≥ {LLM_SKIP_MARGIN:.0%} - LLM 호출 생략"
+                            + (f" (약 {saved_s:.1f}s 절약)" if saved_s else "")
+                        )
+                    elif final_pick["source"] == "semantic":
+                        similarity = semantic_by_id.get(final_pick["movie_id"], 0.0)
+                        st.caption(f"답변-줄거리 유사도 {similarity:.3f} (오프라인 계산)")
+                    else:
+                        st.caption("평점/인기도 점수 1위 (의미 유사도 재랭킹 꺼짐)")
+                    st.divider()
+        elif final_pick:
+            # 최종 결과로 한 번 더 채운다 (비스트리밍/캐시 적중이면 여기서 처음 그려짐)
+            show_llm_pick(final_pick)
+            if "reason_slot" in llm_card:
+                llm_timings = llm_job.timings
+                with llm_card_area:
+                    if llm_timings.get("cached"):
+                        st.caption("LLM 결과 캐시 사용")
+                    elif "total_s" in llm_timings:
+                        st.caption(
+                            f"LLM 첫 토큰 {llm_timings.get('ttft_s', llm_timings['total_s']):.2f}s"
+                            f" · 전체 {llm_timings['total_s']:.2f}s"
+                            + (" (스트리밍)" if stream_llm else "")
+                            + (" · 상세 조회와 병렬" if pipeline_llm else "")
+                        )
+                    st.divider()
+
+        if llm_job is not None and "total_s" in llm_job.timings:
+            timer.add("llm", llm_job.timings["total_s"])
+        # 마지막 제출의 단계별 시간 (디버그 정보/벤치마크 하네스에서 읽음)
+        stage_timings = timer.finish()
+        record_submit_metrics(stage_timings)
+        st.session_state["stage_timings"] = stage_timings
+    except Exception:
+        cancel_run(deadline, "error")
+        raise
+    except BaseException:
+        # Streamlit이 rerun/stop을 처리하며 던진 예외 - 남은 백그라운드 작업(상세 조회/LLM 등)도 취소한다
+        # (정상 조기 종료는 stop_run이 먼저 닫아 두어 세지 않는다)
+        cancel_run(deadline, "interrupted")
+        raise
+    finally:
+        deadline.close()
 
 st.divider()
 with st.expander("🔍 (옵션) 디버그 정보 보기"):
@@ -677,5 +1212,27 @@ with st.expander("🔍 (옵션) 디버그 정보 보기"):
         st.write("최종 장르:", final_genre_key)
     except Exception:
         st.write("결과 버튼을 누르면 여기에 분석 정보가 표시됩니다.")
+    st.write("HTTP 커넥션 풀:", http_pool_stats())
+    st.write("TMDB 디스크 캐시:", get_tmdb_disk_cache().stats())
+    st.write("SWR 캐시:", swr_cache_stats())
+    st.write("LLM 결과 캐시:", get_llm_pick_cache().stats())
+    st.write("의미 유사도 벡터:", get_semantic_store().stats())
+    st.write("LLM 최종 선정 지표:", get_llm_metrics().stats())
+    st.write("답변 조합 테이블:", get_answer_table().stats())
+    st.write("포스터 썸네일 캐시:", get_poster_cache().stats())
+    st.write("마지막 제출 단계별 시간(초):", st.session_state.get("stage_timings"))
+    st.write("단계별 시간 분포(누적, 근사):", histogram_summary("submit_stage_seconds"))
+    st.write("외부 호출 지연(재시도 포함, 근사):", histogram_summary("upstream_call_seconds"))
+    st.write("최근 외부 호출:", get_span_log().recent(10))
+    st.write("카탈로그 워밍:", warmup_status.snapshot() if warmup_status else "비활성 (TMDB_WARMUP_* 미설정)")
+    st.write("TMDB rate limiter:", get_tmdb_rate_limiter().stats())
+    st.write("TMDB single-flight:", get_tmdb_single_flight().stats())
+    st.write("Circuit breaker:", {name: get_circuit_breaker(name).stats() for name in ("TMDB", "OpenAI")})
+    st.download_button(
+        "지표 내려받기 (Prometheus text)",
+        data=get_metrics().render(),
+        file_name="movie_app_metrics.prom",
+        mime="text/plain",
+    )
 
 
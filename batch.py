@@ -0,0 +1,415 @@
+"""
+퀴즈 응답 대량 추천 CLI - Streamlit 없이 engine.recommend()를 직접 호출한다.
+
+입력은 CSV 또는 JSONL(한 줄에 응답 1건):
+- id: 행 식별자 (없으면 입력 순번, 중복되면 실행 전에 거부)
+- answers: 질문별 선택지. 리스트(JSONL) 또는 "0,2,1,..." 문자열, 혹은 q1..qN 열
+  값은 선택지 인덱스(--index-base 기준) 또는 선택지 문장 그대로
+- 선택: language, include_adult, min_vote_avg, min_vote_count, pages (없으면 CLI 기본값)
+
+    python batch.py responses.csv --out results.jsonl
+    python batch.py responses.jsonl --out results.jsonl --workers 16 --no-llm
+    python batch.py responses.csv --out results.jsonl --retry-errors    # 실패한 행만 다시
+
+같은 (답변, 옵션) 조합은 한 번만 계산해 모든 행에 나눠 쓴다.
+워커 스레드는 engine의 공유 자원(디스크 캐시, SWR 캐시, rate limiter, circuit breaker)을 같이 쓴다.
+결과는 한 줄씩 --out에 append하고 바로 flush하므로 출력 파일이 곧 체크포인트다:
+다시 실행하면 이미 끝난 id는 건너뛰고, 끝난 조합의 결과는 재사용한다 (마지막 잘린 줄은 버림).
+--retry-errors로 다시 처리한 id는 줄이 하나 더 생기며, 같은 id는 마지막 줄이 유효하다.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from engine import (
+    DEFAULT_INCLUDE_ADULT,
+    DEFAULT_MIN_VOTE_AVG,
+    DEFAULT_MIN_VOTE_COUNT,
+    DEFAULT_PAGES_TO_POOL,
+    LANGUAGE_OPTIONS,
+    METRICS_TEXTFILE,
+    QUESTIONS,
+    SUBMIT_DEADLINE_SECONDS,
+    Deadline,
+    RecommendOptions,
+    TmdbAuthError,
+    build_tmdb_auth,
+    get_local_catalog,
+    get_metrics,
+    recommend,
+)
+from metrics import write_textfile
+
+TRUE_STRINGS = {"1", "true", "t", "yes", "y"}
+FALSE_STRINGS = {"0", "false", "f", "no", "n", ""}
+
+
+# ============================================================
+# Input
+# ============================================================
+def read_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """CSV(.csv) 또는 JSONL(그 외) -> dict 행. 빈 줄은 건너뛴다"""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".csv"):
+            yield from csv.DictReader(f)
+            return
+        for line_no, line in enumerate(f, start=1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{path}:{line_no}: JSON 형식 오류 ({e})") from e
+
+
+def row_ids(rows: List[Dict[str, Any]]) -> List[str]:
+    """행마다 id (없을 때만 1부터의 입력 순번). 중복 id는 체크포인트를 깨므로 ValueError"""
+    ids: List[str] = []
+    first_seen: Dict[str, int] = {}
+    for n, row in enumerate(rows, start=1):
+        value = row.get("id")
+        row_id = str(n if value is None else value)
+        if row_id in first_seen:
+            raise ValueError(f"중복 id {row_id!r}: {first_seen[row_id]}번째 행과 {n}번째 행")
+        first_seen[row_id] = n
+        ids.append(row_id)
+    return ids
+
+
+def _parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    s = str(value).strip().lower()
+    if s in TRUE_STRINGS:
+        return True
+    if s in FALSE_STRINGS:
+        return False
+    raise ValueError(f"참/거짓 값이 아닙니다: {value!r}")
+
+
+def _raw_answers(row: Dict[str, Any]) -> List[Any]:
+    answers = row.get("answers")
+    if answers is None:
+        cols = [f"q{n}" for n in range(1, len(QUESTIONS) + 1)]
+        return [row.get(c) for c in cols] if any(row.get(c) not in (None, "") for c in cols) else []
+    if isinstance(answers, list):
+        return answers
+    text = str(answers).strip()
+    for sep in (",", "|", ";"):
+        if sep in text:
+            return [part.strip() for part in text.split(sep)]
+    return text.split()
+
+
+def parse_answers(row: Dict[str, Any], index_base: int) -> List[int]:
+    """행의 답변 -> 0부터 시작하는 선택지 인덱스. 인덱스/선택지 문장 모두 허용"""
+    raw = _raw_answers(row)
+    if len(raw) != len(QUESTIONS):
+        raise ValueError(f"답변은 {len(QUESTIONS)}개여야 합니다: {len(raw)}개")
+    out = []
+    for n, (item, value) in enumerate(zip(QUESTIONS, raw), start=1):
+        if isinstance(value, str) and value.strip() in item["options"]:
+            out.append(item["options"].index(value.strip()))
+            continue
+        try:
+            idx = int(value) - index_base
+        except (TypeError, ValueError):
+            raise ValueError(f"Q{n} 답변을 알 수 없습니다: {value!r}") from None
+        if not 0 <= idx < len(item["options"]):
+            raise ValueError(f"Q{n} 선택지 인덱스 범위 밖: {value!r}")
+        out.append(idx)
+    return out
+
+
+def row_options(row: Dict[str, Any], defaults: RecommendOptions) -> RecommendOptions:
+    """행에 있는 필터 열로 기본 옵션을 덮어쓴다"""
+
+    def given(name: str) -> bool:
+        return row.get(name) not in (None, "")
+
+    language = str(row["language"]).strip() if given("language") else defaults.language
+    if language not in LANGUAGE_OPTIONS:
+        raise ValueError(f"지원하지 않는 language: {language!r}")
+    options = defaults._replace(
+        language=language,
+        include_adult=_parse_bool(row["include_adult"]) if given("include_adult") else defaults.include_adult,
+        min_vote_avg=float(row["min_vote_avg"]) if given("min_vote_avg") else defaults.min_vote_avg,
+        min_vote_count=int(row["min_vote_count"]) if given("min_vote_count") else defaults.min_vote_count,
+        pages=int(row["pages"]) if given("pages") else defaults.pages,
+    )
+    if options.backend == "auto":
+        # UI와 같은 규칙: 언어별 로컬 카탈로그가 있으면 그것을 쓴다
+        options = options._replace(backend="local" if get_local_catalog(language) is not None else "tmdb")
+    return options
+
+
+def result_key(option_indices: List[int], options: RecommendOptions) -> str:
+    """같은 답변 + 같은 옵션 -> 같은 키 (재실행 간에도 안정적)"""
+    payload = json.dumps([option_indices, options._asdict()], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+# ============================================================
+# Checkpoint (= output JSONL)
+# ============================================================
+def load_checkpoint(path: str, retry_errors: bool) -> Tuple[Set[str], Dict[str, Dict[str, Any]]]:
+    """
+    기존 출력에서 (끝난 id, 키 -> 성공 결과).
+    중간에 끊겨 잘린 마지막 줄은 파일에서 잘라낸다 (이어 쓸 때 줄이 붙지 않도록).
+    retry_errors면 오류로 끝난 id는 끝나지 않은 것으로 본다.
+    """
+    done_ids: Set[str] = set()
+    results: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(path):
+        return done_ids, results
+
+    with open(path, "rb") as f:
+        data = f.read()
+    complete = data[: data.rfind(b"\n") + 1]
+    if len(complete) != len(data):
+        with open(path, "r+b") as f:
+            f.truncate(len(complete))
+
+    for line in complete.decode("utf-8").splitlines():
+        try:
+            rec = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if rec.get("status") == "ok":
+            done_ids.add(str(rec["id"]))
+            if rec.get("key"):
+                results[rec["key"]] = rec["result"]
+        elif not retry_errors:
+            done_ids.add(str(rec["id"]))
+    return done_ids, results
+
+
+class ResultWriter:
+    """결과 1건 = JSONL 1줄. 줄 단위로 flush해 중단돼도 끝난 행은 남는다"""
+
+    def __init__(self, path: str, fsync_every: int = 200) -> None:
+        self._f = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._fsync_every = fsync_every
+        self._since_sync = 0
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._f.write(line + "\n")
+            self._f.flush()
+            self._since_sync += 1
+            if self._since_sync >= self._fsync_every:
+                os.fsync(self._f.fileno())
+                self._since_sync = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._f.close()
+
+
+# ============================================================
+# Runner
+# ============================================================
+class Progress:
+    """stderr 진행 상황 (interval초마다 한 줄)"""
+
+    def __init__(self, total: int, interval: float) -> None:
+        self.total = total
+        self.interval = interval
+        self.started = time.monotonic()
+        self._last = self.started
+        self.rows = {"ok": 0, "error": 0, "skipped": 0}
+        self.computed = 0
+        self.reused = 0
+
+    def report(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        elapsed = max(now - self.started, 1e-9)
+        written = self.rows["ok"] + self.rows["error"]
+        print(
+            f"[batch] {written + self.rows['skipped']}/{self.total}행 "
+            f"(ok {self.rows['ok']}, 오류 {self.rows['error']}, 건너뜀 {self.rows['skipped']}) "
+            f"계산 {self.computed}조합, 재사용 {self.reused}행, {written / elapsed:.1f}행/s",
+            file=sys.stderr,
+        )
+
+
+def run_batch(args: argparse.Namespace) -> int:
+    defaults = RecommendOptions(
+        language=args.language,
+        include_adult=args.include_adult,
+        min_vote_avg=args.min_vote_avg,
+        min_vote_count=args.min_vote_count,
+        pages=args.pages,
+        backend=args.backend,
+        use_semantic=args.semantic,
+        use_llm=not args.no_llm,
+    )
+    tmdb_api_key = args.tmdb_api_key or os.getenv("TMDB_API_KEY", "")
+    tmdb_bearer = args.tmdb_bearer or os.getenv("TMDB_BEARER", "")
+    openai_api_key = "" if args.no_llm else (args.openai_api_key or os.getenv("OPENAI_API_KEY", ""))
+    auth = build_tmdb_auth(tmdb_api_key, tmdb_bearer)
+
+    # 출력에 쓰기 전에 입력 전체를 검사한다 (형식 오류/중복 id면 아무것도 기록하지 않고 끝낸다)
+    try:
+        rows = list(read_rows(args.input))
+        ids = row_ids(rows)
+    except ValueError as e:
+        print(f"[batch] 입력 오류: {e}", file=sys.stderr)
+        return 2
+
+    done_ids, results = load_checkpoint(args.out, args.retry_errors)
+    writer = ResultWriter(args.out)
+
+    # 키별로 행을 묶는다 (입력 순서 유지)
+    groups: Dict[str, Dict[str, Any]] = {}
+    total = len(rows)
+    progress = Progress(total, args.progress_every)
+    for row_id, row in zip(ids, rows):
+        if row_id in done_ids:
+            progress.rows["skipped"] += 1
+            continue
+        try:
+            indices = parse_answers(row, args.index_base)
+            options = row_options(row, defaults)
+        except ValueError as e:
+            writer.write({"id": row_id, "status": "error", "error": f"입력 오류: {e}"})
+            progress.rows["error"] += 1
+            continue
+        key = result_key(indices, options)
+        group = groups.setdefault(key, {"indices": indices, "options": options, "ids": []})
+        group["ids"].append(row_id)
+
+    def emit(key: str, group: Dict[str, Any], result: Optional[Dict[str, Any]], error: str = "") -> None:
+        for row_id in group["ids"]:
+            record: Dict[str, Any] = {"id": row_id, "key": key, "answers": group["indices"]}
+            if result is not None:
+                record.update(status="ok", result=result)
+            else:
+                record.update(status="error", error=error)
+            writer.write(record)
+            progress.rows["ok" if result is not None else "error"] += 1
+
+    # 이전 실행에서 끝난 조합은 호출 없이 결과만 다시 쓴다
+    pending: List[Tuple[str, Dict[str, Any]]] = []
+    for key, group in groups.items():
+        if key in results:
+            emit(key, group, results[key])
+            progress.reused += len(group["ids"])
+        else:
+            pending.append((key, group))
+
+    def work(group: Dict[str, Any], deadline: Deadline) -> Dict[str, Any]:
+        try:
+            return recommend(
+                group["indices"],
+                group["options"],
+                auth,
+                openai_api_key=openai_api_key,
+                openai_model=args.openai_model,
+                deadline=deadline,
+            )
+        finally:
+            deadline.close()
+
+    exit_code = 0
+    inflight: Dict["Future[Dict[str, Any]]", Tuple[str, Dict[str, Any], Deadline]] = {}
+    queue_iter = iter(pending)
+    # 제출은 워커 수의 몇 배까지만 - 수만 건을 한꺼번에 만들지 않는다
+    max_inflight = max(1, args.workers) * 4
+
+    def abort() -> None:
+        # 진행 중인 호출은 백오프/재시도 없이 바로 끝내고, 그 행은 기록하지 않는다 (다음 실행에서 처리)
+        nonlocal queue_iter
+        queue_iter = iter(())
+        for _, _, d in inflight.values():
+            d.cancel()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers), thread_name_prefix="batch") as ex:
+            try:
+                while True:
+                    while exit_code == 0 and len(inflight) < max_inflight:
+                        nxt = next(queue_iter, None)
+                        if nxt is None:
+                            break
+                        deadline = Deadline(args.row_timeout)
+                        inflight[ex.submit(work, nxt[1], deadline)] = (nxt[0], nxt[1], deadline)
+                    if not inflight:
+                        break
+                    finished, _ = wait(inflight, timeout=args.progress_every, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        key, group, _ = inflight.pop(fut)
+                        if exit_code:
+                            continue
+                        try:
+                            emit(key, group, fut.result())
+                        except TmdbAuthError as e:
+                            # 모든 행이 같은 이유로 실패하므로 더 보내지 않는다
+                            print(f"[batch] 중단: {e}", file=sys.stderr)
+                            exit_code = 2
+                            abort()
+                        except Exception as e:
+                            emit(key, group, None, f"{type(e).__name__}: {e}")
+                        progress.computed += 1
+                    progress.report()
+            except KeyboardInterrupt:
+                print("[batch] 중단됨 - 다시 실행하면 이어서 처리합니다.", file=sys.stderr)
+                exit_code = 130
+                abort()
+    finally:
+        writer.close()
+        progress.report(force=True)
+        if METRICS_TEXTFILE:
+            write_textfile(get_metrics(), METRICS_TEXTFILE)
+
+    if exit_code == 0 and progress.rows["error"]:
+        exit_code = 1
+    return exit_code
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="퀴즈 응답 CSV/JSONL -> 추천 결과 JSONL")
+    parser.add_argument("input", help="응답 파일 (.csv 또는 JSONL)")
+    parser.add_argument("--out", required=True, help="결과 JSONL (이어 쓰기 = 체크포인트)")
+    parser.add_argument("--workers", type=int, default=8, help="동시에 처리할 조합 수")
+    parser.add_argument(
+        "--row-timeout", type=float, default=SUBMIT_DEADLINE_SECONDS, help="조합 1개의 시간 예산(초)"
+    )
+    parser.add_argument("--retry-errors", action="store_true", help="이전 실행에서 오류로 끝난 행 다시 처리")
+    parser.add_argument("--index-base", type=int, choices=(0, 1), default=0, help="답변 인덱스 시작 번호")
+    parser.add_argument("--language", choices=LANGUAGE_OPTIONS, default=LANGUAGE_OPTIONS[0])
+    parser.add_argument(
+        "--include-adult", action="store_true", default=DEFAULT_INCLUDE_ADULT, help="행에 값이 없을 때 기본값"
+    )
+    parser.add_argument("--min-vote-avg", type=float, default=DEFAULT_MIN_VOTE_AVG)
+    parser.add_argument("--min-vote-count", type=int, default=DEFAULT_MIN_VOTE_COUNT)
+    parser.add_argument("--pages", type=int, default=DEFAULT_PAGES_TO_POOL)
+    parser.add_argument(
+        "--backend", choices=("auto", "tmdb", "local"), default="auto", help="auto: 로컬 카탈로그가 있으면 사용"
+    )
+    parser.add_argument("--semantic", action="store_true", help="의미 유사도 재랭킹 켜기 (기본은 UI와 같이 꺼짐)")
+    parser.add_argument("--no-llm", action="store_true", help="LLM 없이 로컬 점수로 최종 1편")
+    parser.add_argument("--openai-model", default="gpt-5-mini")
+    parser.add_argument("--tmdb-api-key", default="", help="없으면 TMDB_API_KEY 환경변수")
+    parser.add_argument("--tmdb-bearer", default="", help="없으면 TMDB_BEARER 환경변수")
+    parser.add_argument("--openai-api-key", default="", help="없으면 OPENAI_API_KEY 환경변수")
+    parser.add_argument("--progress-every", type=float, default=5.0, help="진행 상황 출력 간격(초)")
+    args = parser.parse_args()
+    sys.exit(run_batch(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,451 @@
+"""
+오프라인 벤치마크 하네스.
+
+로컬 대역 서버(TMDB /discover/movie, /movie/{id}, 포스터 이미지 / OpenAI /responses)를 띄우고
+Streamlit AppTest로 제출 경로를 헤드리스로 반복 실행해 단계별 p50/p95/p99를 JSON으로 남긴다.
+단계 이름은 app.py의 StageTimer 기준: genre, discover, rerank, details, llm_wait, llm, render, total
+
+    python benchmark.py --runs 30 --out bench.json
+    python benchmark.py --runs 30 --latency-ms 120 --error-rate 0.05 --rate-429 0.05 --llm --out bench.json
+    python benchmark.py --runs 30 --baseline bench_prev.json    # 이전 결과와 단계별 비교
+
+픽스처: --fixtures DIR 이면 DIR/discover/<genre_id>-<page>.json, DIR/movie/<id>.json,
+DIR/responses.json(LLM 출력 JSON)을 우선 사용하고, 없는 것은 seed 기반 합성 데이터로 응답한다.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+STAGES = ["genre", "discover", "rerank", "details", "llm_wait", "llm", "render", "total"]
+PERCENTILES = (50, 95, 99)
+
+OVERVIEW_WORDS = [
+    "평범한", "대학생", "비밀", "우정", "사랑", "도시", "여름", "가족", "모험", "우주",
+    "전설", "마법", "추격", "사건", "기억", "성장", "웃음", "이별", "재회", "운명",
+]
+
+
+class FaultConfig(NamedTuple):
+    latency_ms: float
+    jitter_ms: float
+    error_rate: float
+    rate_429: float
+    retry_after: float
+
+
+# ============================================================
+# Stand-in servers
+# ============================================================
+class StandInServer:
+    """
+    경로별 핸들러를 가진 로컬 HTTP 서버. 요청마다 지연/500/429를 주입하고 경로별 요청 수를 센다.
+    handler(method, path, query, body) -> (status, headers, body bytes 또는 bytes 조각 iterator)
+    """
+
+    def __init__(self, name: str, routes: List[Tuple[str, Callable[..., Any]]], faults: FaultConfig, seed: int) -> None:
+        self.name = name
+        self.routes = [(re.compile(pattern), handler) for pattern, handler in routes]
+        self.faults = faults
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self.injected = {"429": 0, "500": 0}
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    def _roll(self) -> Tuple[float, Optional[int]]:
+        with self._lock:
+            delay = max(0.0, self.faults.latency_ms + self._rng.uniform(-1, 1) * self.faults.jitter_ms) / 1000
+            r = self._rng.random()
+        if r < self.faults.rate_429:
+            return delay, 429
+        if r < self.faults.rate_429 + self.faults.error_rate:
+            return delay, 500
+        return delay, None
+
+    def start(self) -> str:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _dispatch(self, method: str) -> None:
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                for pattern, handler in server.routes:
+                    m = pattern.fullmatch(url.path)
+                    if m:
+                        break
+                else:
+                    self._send(404, {}, b"{}")
+                    return
+
+                route = pattern.pattern
+                with server._lock:
+                    server.counts[route] = server.counts.get(route, 0) + 1
+                delay, fault = server._roll()
+                time.sleep(delay)
+                # 이미지는 CDN이라 장애 주입 대상에서 제외
+                if fault and not route.startswith("/t/p/"):
+                    with server._lock:
+                        server.injected[str(fault)] += 1
+                    headers = {"Retry-After": str(server.faults.retry_after)} if fault == 429 else {}
+                    self._send(fault, headers, b'{"status_message": "injected"}')
+                    return
+                status, headers, payload = handler(method, m, parse_qs(url.query), body)
+                self._send(status, headers, payload)
+
+            def _send(self, status: int, headers: Dict[str, str], payload: Any) -> None:
+                self.send_response(status)
+                headers = {"Content-Type": "application/json", **headers}
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                if isinstance(payload, bytes):
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+                # 스트리밍 응답은 chunked로 조각마다 flush
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in payload:
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self) -> None:
+                self._dispatch("GET")
+
+            def do_POST(self) -> None:
+                self._dispatch("POST")
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, name=f"standin-{self.name}", daemon=True).start()
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"requests": dict(self.counts), "injected": dict(self.injected)}
+
+
+class Fixtures:
+    """기록된 응답(있으면) + seed 기반 합성 데이터"""
+
+    def __init__(self, directory: Optional[str], seed: int, total_pages: int) -> None:
+        self.directory = directory
+        self.seed = seed
+        self.total_pages = total_pages
+
+    def _load(self, *parts: str) -> Optional[Any]:
+        if not self.directory:
+            return None
+        path = os.path.join(self.directory, *parts)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def movie(self, movie_id: int, genre_id: int = 18) -> Dict[str, Any]:
+        rng = random.Random(self.seed * 1_000_003 + movie_id)
+        words = rng.sample(OVERVIEW_WORDS, 8)
+        return {
+            "id": movie_id,
+            "title": f"영화 {movie_id}",
+            "overview": " ".join(words[:4]) + "의 이야기. " + " ".join(words[4:]) + "을 그린다.",
+            "vote_average": round(rng.uniform(6.0, 9.0), 1),
+            "vote_count": rng.randint(200, 20000),
+            "release_date": f"{rng.randint(1990, 2025)}-{rng.randint(1, 12):02d}-01",
+            "poster_path": f"/p{movie_id}.jpg" if rng.random() > 0.1 else None,
+            "popularity": round(rng.expovariate(1 / 40), 3),
+            "genre_ids": [genre_id],
+            "adult": False,
+        }
+
+    def discover(self, genre_id: int, page: int) -> Dict[str, Any]:
+        recorded = self._load("discover", f"{genre_id}-{page}.json")
+        if recorded is not None:
+            return recorded
+        results = [self.movie(genre_id * 10_000 + page * 20 + k, genre_id) for k in range(20)] if page <= self.total_pages else []
+        return {"page": page, "total_pages": self.total_pages, "total_results": self.total_pages * 20, "results": results}
+
+    def details(self, movie_id: int) -> Dict[str, Any]:
+        recorded = self._load("movie", f"{movie_id}.json")
+        if recorded is not None:
+            return recorded
+        body = self.movie(movie_id, movie_id // 10_000 or 18)
+        body["videos"] = {"results": [{"site": "YouTube", "type": "Trailer", "official": True, "key": f"bench{movie_id}"}]}
+        return body
+
+    def llm_output(self, candidate_ids: List[int]) -> Dict[str, Any]:
+        recorded = self._load("responses.json")
+        if recorded is not None:
+            return recorded
+        rng = random.Random(self.seed + sum(candidate_ids))
+        return {
+            "movie_id": rng.choice(candidate_ids) if candidate_ids else 0,
+            "title": "",
+            "reason": "답변에서 드러난 취향과 줄거리의 분위기가 가장 잘 맞는 작품입니다. 부담 없이 몰입할 수 있어요.",
+            "confidence": round(rng.uniform(0.5, 0.95), 2),
+        }
+
+
+def _poster_bytes() -> bytes:
+    try:
+        from PIL import Image
+    except ImportError:
+        return b""
+    out = io.BytesIO()
+    Image.new("RGB", (500, 750), (40, 70, 110)).save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+def tmdb_routes(fx: Fixtures) -> List[Tuple[str, Callable[..., Any]]]:
+    poster = _poster_bytes()
+
+    def discover(method: str, m: Any, query: Dict[str, List[str]], body: bytes) -> Any:
+        genre_id = int((query.get("with_genres") or ["18"])[0])
+        page = int((query.get("page") or ["1"])[0])
+        return 200, {}, json.dumps(fx.discover(genre_id, page), ensure_ascii=False).encode("utf-8")
+
+    def details(method: str, m: Any, query: Dict[str, List[str]], body: bytes) -> Any:
+        return 200, {}, json.dumps(fx.details(int(m.group(1))), ensure_ascii=False).encode("utf-8")
+
+    def image(method: str, m: Any, query: Dict[str, List[str]], body: bytes) -> Any:
+        return 200, {"Content-Type": "image/jpeg"}, poster
+
+    return [
+        (r"/3/discover/movie", discover),
+        (r"/3/movie/(\d+)", details),
+        (r"/t/p/[^/]+/.+", image),
+    ]
+
+
+def openai_routes(fx: Fixtures, token_ms: float) -> List[Tuple[str, Callable[..., Any]]]:
+    def responses(method: str, m: Any, query: Dict[str, List[str]], body: bytes) -> Any:
+        req = json.loads(body or b"{}")
+        prompt = "".join(part.get("content", "") for part in req.get("input", []) if isinstance(part, dict))
+        ids = [int(x) for x in re.findall(r"id=(\d+)", prompt)]
+        text = json.dumps(fx.llm_output(ids), ensure_ascii=False)
+        usage = {"input_tokens": len(prompt) // 2, "output_tokens": len(text) // 2}
+        final = {"output": [{"type": "message", "content": [{"type": "output_text", "text": text}]}], "usage": usage}
+        if not req.get("stream"):
+            return 200, {}, json.dumps(final, ensure_ascii=False).encode("utf-8")
+
+        def events() -> Any:
+            for i in range(0, len(text), 8):
+                time.sleep(token_ms / 1000)
+                ev = {"type": "response.output_text.delta", "delta": text[i : i + 8]}
+                yield f"event: {ev['type']}\ndata: {json.dumps(ev, ensure_ascii=False)}\n\n".encode("utf-8")
+            done = {"type": "response.completed", "response": final}
+            yield f"event: response.completed\ndata: {json.dumps(done, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        return 200, {"Content-Type": "text/event-stream; charset=utf-8"}, events()
+
+    return [(r"/v1/responses", responses)]
+
+
+# ============================================================
+# Driver
+# ============================================================
+def percentile(sorted_values: List[float], p: float) -> float:
+    """nearest-rank 백분위수"""
+    if not sorted_values:
+        return float("nan")
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def summarize(runs: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    out = {}
+    names = [s for s in STAGES if any(s in r for r in runs)] + sorted({k for r in runs for k in r} - set(STAGES))
+    for name in names:
+        values = sorted(r[name] for r in runs if name in r)
+        out[name] = {
+            "n": len(values),
+            "mean": sum(values) / len(values),
+            **{f"p{p}": percentile(values, p) for p in PERCENTILES},
+            "max": values[-1],
+        }
+    return out
+
+
+def _set_checkbox(at: Any, label_part: str, value: bool) -> None:
+    for cb in at.sidebar.checkbox:
+        if label_part in cb.label:
+            cb.check() if value else cb.uncheck()
+            return
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    fx = Fixtures(args.fixtures, args.seed, args.total_pages)
+    tmdb_faults = FaultConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_429, args.retry_after)
+    llm_faults = FaultConfig(args.llm_latency_ms, args.jitter_ms, args.llm_error_rate, args.llm_rate_429, args.retry_after)
+    tmdb = StandInServer("tmdb", tmdb_routes(fx), tmdb_faults, args.seed)
+    openai = StandInServer("openai", openai_routes(fx, args.llm_token_ms), llm_faults, args.seed + 1)
+    tmdb_url, openai_url = tmdb.start(), openai.start()
+
+    workdir = tempfile.mkdtemp(prefix="movie-bench-")
+    os.environ.update(
+        {
+            "TMDB_API_BASE": f"{tmdb_url}/3",
+            "POSTER_BASE": f"{tmdb_url}/t/p/w500",
+            "OPENAI_API_BASE": f"{openai_url}/v1",
+            "TMDB_CACHE_PATH": os.path.join(workdir, "tmdb_cache.sqlite3"),
+            "LLM_PICK_CACHE_PATH": os.path.join(workdir, "llm_picks.sqlite3"),
+            "POSTER_CACHE_DIR": os.path.join(workdir, "posters"),
+            "ANSWER_TABLE_DIR": os.path.join(workdir, "answer_tables"),
+            "LOCAL_CATALOG_DIR": args.catalog_dir or os.path.join(workdir, "no-catalog"),
+            "STREAMLIT_LOGGER_LEVEL": "error",
+        }
+    )
+
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    import engine
+
+    rng = random.Random(args.seed)
+    runs: List[Dict[str, float]] = []
+    failures: List[str] = []
+    at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+    at.run()
+    try:
+        at.sidebar.text_input[0].input("bench-key")
+        if args.llm:
+            at.sidebar.text_input[-1].input("sk-bench")
+        else:
+            _set_checkbox(at, "LLM으로 최종 1편", False)
+        _set_checkbox(at, "스트리밍", not args.no_stream)
+        _set_checkbox(at, "동시에 실행", not args.no_pipeline)
+        _set_checkbox(at, "의미 유사도", args.semantic)
+        at.run()
+
+        for i in range(args.warmup + args.runs):
+            if args.cold:
+                st.cache_data.clear()
+                st.cache_resource.clear()
+                engine.clear_shared_resources()
+                for name in os.listdir(workdir):
+                    path = os.path.join(workdir, name)
+                    shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+            for radio in at.radio:
+                radio.set_value(rng.choice(radio.options))
+            at.button[0].click().run()
+
+            problems = [str(e.value) for e in at.exception] + [str(e.value) for e in at.error]
+            timings = at.session_state["stage_timings"] if "stage_timings" in at.session_state else None
+            if problems or timings is None:
+                failures.append("; ".join(problems) or "stage_timings 없음")
+            if i >= args.warmup and timings is not None:
+                runs.append(dict(timings))
+            # 다음 제출이 이전 값을 읽지 않도록
+            if "stage_timings" in at.session_state:
+                del at.session_state["stage_timings"]
+    finally:
+        tmdb.stop()
+        openai.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(APP_PATH)
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "meta": {"commit": commit, "created_at": time.time(), "python": sys.version.split()[0]},
+        "config": vars(args),
+        "stages": summarize(runs),
+        "servers": {"tmdb": tmdb.stats(), "openai": openai.stats()},
+        "failures": failures,
+        "runs": runs,
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """p50/p95가 baseline보다 threshold배 이상 느려진 단계 목록"""
+    regressions = []
+    print(f"\n{'stage':>10} {'p50 old':>9} {'p50 new':>9} {'p95 old':>9} {'p95 new':>9}  (ms)")
+    for name, new in result["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if not old:
+            continue
+        print(f"{name:>10} {old['p50']*1000:>9.1f} {new['p50']*1000:>9.1f} {old['p95']*1000:>9.1f} {new['p95']*1000:>9.1f}")
+        for key in ("p50", "p95"):
+            # 1ms 미만 단계는 잡음이라 비교하지 않는다
+            if old[key] > 0.001 and new[key] > old[key] * threshold:
+                regressions.append(f"{name} {key}: {old[key]*1000:.1f}ms -> {new[key]*1000:.1f}ms")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="로컬 대역 서버로 제출 경로 단계별 지연 측정")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2, help="집계에서 빼는 첫 실행 수")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cold", action="store_true", help="실행마다 메모리/디스크 캐시 비우기")
+    parser.add_argument("--latency-ms", type=float, default=60.0, help="TMDB 대역 서버 평균 지연")
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="TMDB 500 비율")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="TMDB 429 비율")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="429 응답의 Retry-After(초)")
+    parser.add_argument("--llm", action="store_true", help="LLM 최종 선정 포함")
+    parser.add_argument("--llm-latency-ms", type=float, default=400.0)
+    parser.add_argument("--llm-token-ms", type=float, default=15.0, help="스트리밍 조각 간 지연")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-rate-429", type=float, default=0.0)
+    parser.add_argument("--no-stream", action="store_true")
+    parser.add_argument("--no-pipeline", action="store_true")
+    parser.add_argument("--semantic", action="store_true")
+    parser.add_argument("--total-pages", type=int, default=5, help="합성 Discover 응답의 total_pages")
+    parser.add_argument("--fixtures", help="기록된 응답 디렉터리")
+    parser.add_argument("--catalog-dir", help="로컬 카탈로그 디렉터리 (지정하면 local backend 사용 가능)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="AppTest 실행 1회 타임아웃")
+    parser.add_argument("--out", help="결과 JSON 경로")
+    parser.add_argument("--baseline", help="비교할 이전 결과 JSON")
+    parser.add_argument("--threshold", type=float, default=1.2, help="회귀로 볼 배율")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+
+    print(f"{'stage':>10} {'n':>4} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9}")
+    for name, s in result["stages"].items():
+        print(f"{name:>10} {s['n']:>4} {s['p50']*1000:>9.1f} {s['p95']*1000:>9.1f} {s['p99']*1000:>9.1f}")
+    if result["failures"]:
+        print(f"\n실패/오류 표시 {len(result['failures'])}회: {result['failures'][:3]}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        if regressions:
+            print("\n회귀:", *regressions, sep="\n  ")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+로컬 컬럼형 영화 카탈로그.
+
+TMDB 덤프(JSONL)를 NumPy 컬럼 파일로 변환해 두고, /discover/movie 와 같은 필터
+(장르, 평점, 투표 수, 성인 여부) + popularity 정렬을 네트워크 없이 벡터 연산으로 처리한다.
+
+빌드:
+    python catalog.py build --input dump_ko.jsonl --out .catalog/ko-KR
+
+입력 JSONL 한 줄은 다음 중 하나:
+- 영화 1편 (TMDB Discover/movie 결과 객체)
+- Discover 응답 페이지 ({"results": [...]}) - results를 펼쳐서 사용
+- TMDB daily export 행 (id/popularity/adult만 있음 - 평점/장르 필터에는 걸리지 않음)
+
+제목+줄거리의 hashed n-gram tf 행렬(semantic_tf.npy)과 카탈로그 전체 idf(semantic_idf.npy)도
+함께 저장해, 로컬 의미 유사도 재랭킹이 후보 벡터를 다시 계산하지 않게 한다.
+"""
+import argparse
+import gzip
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from semantic import doc_text, fit_idf, hashed_tf
+
+# TMDB 영화 장르 id -> genre_mask 비트 위치
+TMDB_MOVIE_GENRES = [28, 12, 16, 35, 80, 99, 18, 10751, 14, 36, 27, 10402, 9648, 10749, 878, 10770, 53, 10752, 37]
+GENRE_BIT = {gid: i for i, gid in enumerate(TMDB_MOVIE_GENRES)}
+
+NUMERIC_COLUMNS = {
+    "id": np.int64,
+    "genre_mask": np.uint32,
+    "vote_average": np.float32,
+    "vote_count": np.int32,
+    "popularity": np.float32,
+    "adult": np.bool_,
+}
+TEXT_COLUMNS = ["title", "overview", "poster_path", "release_date"]
+
+MOVIE_RECORD_FIELDS = (
+    "id",
+    "title",
+    "overview",
+    "vote_average",
+    "vote_count",
+    "release_date",
+    "poster_path",
+    "popularity",
+    "trailer_url",
+)
+
+
+class MovieRecord:
+    """
+    앱이 실제로 쓰는 필드만 담은 영화 레코드.
+    TMDB 원본 dict(genre_ids, videos 목록 등)를 통째로 캐시하지 않도록 조회 시점에 투영한다.
+    - __slots__로 인스턴스 크기를 줄이고, pickle은 필드 값 튜플만 저장
+    - get()/[]로 dict처럼 읽을 수 있어 기존 m.get("...") 코드와 호환 (None은 값 없음으로 취급)
+    """
+
+    __slots__ = MOVIE_RECORD_FIELDS
+
+    def __init__(
+        self,
+        id: int,
+        title: str = "",
+        overview: str = "",
+        vote_average: Optional[float] = None,
+        vote_count: Optional[int] = None,
+        release_date: Optional[str] = None,
+        poster_path: Optional[str] = None,
+        popularity: Optional[float] = None,
+        trailer_url: Optional[str] = None,
+    ) -> None:
+        self.id = id
+        self.title = title
+        self.overview = overview
+        self.vote_average = vote_average
+        self.vote_count = vote_count
+        self.release_date = release_date
+        self.poster_path = poster_path
+        self.popularity = popularity
+        self.trailer_url = trailer_url
+
+    @classmethod
+    def from_tmdb(cls, obj: Dict[str, Any], trailer_url: Optional[str] = None) -> "MovieRecord":
+        return cls(
+            id=obj.get("id"),
+            title=obj.get("title") or "",
+            overview=obj.get("overview") or "",
+            vote_average=obj.get("vote_average"),
+            vote_count=obj.get("vote_count"),
+            release_date=obj.get("release_date"),
+            poster_path=obj.get("poster_path"),
+            popularity=obj.get("popularity"),
+            trailer_url=trailer_url,
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __reduce__(self) -> Any:
+        return (MovieRecord, tuple(getattr(self, f) for f in MOVIE_RECORD_FIELDS))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, MovieRecord):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in MOVIE_RECORD_FIELDS)
+
+    def __repr__(self) -> str:
+        return f"MovieRecord(id={self.id!r}, title={self.title!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {f: getattr(self, f) for f in MOVIE_RECORD_FIELDS}
+
+
+def genre_mask(genre_ids: Iterable[int]) -> int:
+    mask = 0
+    for gid in genre_ids or []:
+        bit = GENRE_BIT.get(gid)
+        if bit is not None:
+            mask |= 1 << bit
+    return mask
+
+
+def iter_dump_records(path: str) -> Iterator[Dict[str, Any]]:
+    """JSONL(.gz 가능) 덤프에서 영화 객체를 하나씩 꺼낸다"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            if isinstance(obj.get("results"), list):
+                yield from obj["results"]
+            else:
+                yield obj
+
+
+def build_catalog(records: Iterable[Dict[str, Any]], out_dir: str) -> int:
+    """
+    id 기준으로 중복을 제거(나중 레코드 우선)한 뒤 컬럼별 .npy 파일로 저장.
+    문자열 컬럼은 UTF-8 blob 하나 + offsets 배열로 저장해 mmap으로 바로 읽을 수 있게 한다.
+    반환값: 저장한 영화 수
+    """
+    by_id: Dict[int, Dict[str, Any]] = {}
+    for m in records:
+        mid = m.get("id")
+        if isinstance(mid, int):
+            by_id[mid] = m
+    rows = list(by_id.values())
+
+    os.makedirs(out_dir, exist_ok=True)
+    cols = {
+        "id": [m["id"] for m in rows],
+        "genre_mask": [genre_mask(m.get("genre_ids") or [g.get("id") for g in m.get("genres") or []]) for m in rows],
+        "vote_average": [float(m.get("vote_average") or 0.0) for m in rows],
+        "vote_count": [int(m.get("vote_count") or 0) for m in rows],
+        "popularity": [float(m.get("popularity") or 0.0) for m in rows],
+        "adult": [bool(m.get("adult")) for m in rows],
+    }
+    for name, dtype in NUMERIC_COLUMNS.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), np.asarray(cols[name], dtype=dtype))
+
+    for name in TEXT_COLUMNS:
+        encoded = [str(m.get(name) or "").encode("utf-8") for m in rows]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        np.save(os.path.join(out_dir, f"{name}.offsets.npy"), offsets)
+        with open(os.path.join(out_dir, f"{name}.bin"), "wb") as f:
+            f.write(b"".join(encoded))
+
+    tf = hashed_tf([doc_text(m) for m in rows])
+    np.save(os.path.join(out_dir, "semantic_tf.npy"), tf.astype(np.float16))
+    np.save(os.path.join(out_dir, "semantic_idf.npy"), fit_idf(tf))
+
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"count": len(rows), "genres": TMDB_MOVIE_GENRES}, f)
+    return len(rows)
+
+
+def _load_blob(path: str) -> np.ndarray:
+    # 빈 파일은 mmap할 수 없다
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+class LocalCatalog:
+    """memory-mapped 컬럼 카탈로그. 필터/정렬은 NumPy 벡터 연산으로 처리한다."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.cols = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in NUMERIC_COLUMNS}
+        self._offsets = {name: np.load(os.path.join(path, f"{name}.offsets.npy"), mmap_mode="r") for name in TEXT_COLUMNS}
+        self._blobs = {name: _load_blob(os.path.join(path, f"{name}.bin")) for name in TEXT_COLUMNS}
+        # 의미 유사도 벡터는 이전 버전 카탈로그에는 없을 수 있다
+        tf_path = os.path.join(path, "semantic_tf.npy")
+        self.semantic_tf: Optional[np.ndarray] = np.load(tf_path, mmap_mode="r") if os.path.exists(tf_path) else None
+        self.semantic_idf: Optional[np.ndarray] = (
+            np.load(os.path.join(path, "semantic_idf.npy")) if self.semantic_tf is not None else None
+        )
+        self._id_order: Optional[np.ndarray] = None
+        self._sorted_ids: Optional[np.ndarray] = None
+
+    @classmethod
+    def open(cls, path: str) -> Optional["LocalCatalog"]:
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        return cls(path)
+
+    def __len__(self) -> int:
+        return int(self.cols["id"].shape[0])
+
+    def _text(self, name: str, row: int) -> str:
+        offsets = self._offsets[name]
+        return bytes(self._blobs[name][offsets[row] : offsets[row + 1]]).decode("utf-8")
+
+    def row(self, row: int) -> MovieRecord:
+        c = self.cols
+        return MovieRecord(
+            id=int(c["id"][row]),
+            title=self._text("title", row),
+            overview=self._text("overview", row),
+            # float32 컬럼 값을 그대로 float로 바꾸면 8.8 -> 8.800000190734863 (TMDB 값은 소수 셋째 자리까지)
+            vote_average=round(float(c["vote_average"][row]), 3),
+            vote_count=int(c["vote_count"][row]),
+            release_date=self._text("release_date", row),
+            poster_path=self._text("poster_path", row) or None,
+            popularity=round(float(c["popularity"][row]), 3),
+        )
+
+    def rows_for_ids(self, ids: Iterable[int]) -> np.ndarray:
+        """영화 id -> 행 번호 (없으면 -1). id 정렬 인덱스는 처음 호출 때 한 번만 만든다"""
+        ids_arr = np.fromiter(ids, dtype=np.int64)
+        if len(self) == 0:
+            return np.full(ids_arr.shape, -1, dtype=np.int64)
+        if self._id_order is None:
+            self._id_order = np.argsort(self.cols["id"], kind="stable")
+            self._sorted_ids = np.asarray(self.cols["id"])[self._id_order]
+        pos = np.minimum(np.searchsorted(self._sorted_ids, ids_arr), len(self) - 1)
+        rows = self._id_order[pos]
+        return np.where(self._sorted_ids[pos] == ids_arr, rows, -1)
+
+    def genre_ids(self, row: int) -> List[int]:
+        mask = int(self.cols["genre_mask"][row])
+        return [gid for gid, bit in GENRE_BIT.items() if mask >> bit & 1]
+
+    def filter_rows(
+        self,
+        genre_id: int,
+        include_adult: bool,
+        min_vote_avg: float,
+        min_vote_count: int,
+        limit: int,
+    ) -> np.ndarray:
+        """조건을 만족하는 행 번호를 popularity 내림차순으로 최대 limit개"""
+        c = self.cols
+        bit = GENRE_BIT.get(genre_id)
+        if bit is None:
+            return np.zeros(0, dtype=np.int64)
+        mask = (c["genre_mask"] & np.uint32(1 << bit)) != 0
+        mask &= c["vote_average"] >= np.float32(min_vote_avg)
+        mask &= c["vote_count"] >= min_vote_count
+        if not include_adult:
+            mask &= ~c["adult"]
+
+        rows = np.flatnonzero(mask)
+        if rows.size == 0 or limit <= 0:
+            return rows[:0]
+        pop = c["popularity"][rows]
+        if rows.size > limit:
+            # 상위 limit개만 부분 선택 후 정렬
+            top = np.argpartition(-pop, limit - 1)[:limit]
+            rows, pop = rows[top], pop[top]
+        return rows[np.argsort(-pop, kind="stable")]
+
+    def discover(
+        self,
+        genre_id: int,
+        include_adult: bool,
+        min_vote_avg: float,
+        min_vote_count: int,
+        limit: int,
+    ) -> List[MovieRecord]:
+        rows = self.filter_rows(genre_id, include_adult, min_vote_avg, min_vote_count, limit)
+        return [self.row(int(r)) for r in rows]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="로컬 영화 카탈로그 빌드")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="TMDB JSONL 덤프를 컬럼형 카탈로그로 변환")
+    build.add_argument("--input", required=True, nargs="+", help="JSONL(.gz) 덤프 파일")
+    build.add_argument("--out", required=True, help="출력 디렉터리 (예: .catalog/ko-KR)")
+    args = parser.parse_args()
+
+    if args.command == "build":
+
+        def records() -> Iterator[Dict[str, Any]]:
+            for path in args.input:
+                yield from iter_dump_records(path)
+
+        n = build_catalog(records(), args.out)
+        print(f"{n}편 -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
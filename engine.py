@@ -0,0 +1,2189 @@
+"""
+추천 엔진 - Streamlit 없이 import해서 쓰는 추천 파이프라인.
+
+app.py(UI)와 batch.py(대량 처리 CLI)가 같은 코드를 공유한다.
+- 설정 상수, 질문/카테고리 정의
+- TMDB 요청 계층: 디스크 캐시, rate limiter, circuit breaker, single-flight, 시간 예산(Deadline)
+- Discover/상세 조회 SWR 캐시, 장르 결정, 재랭킹(평점/인기도 + 의미 유사도), LLM 최종 1편 선정
+- recommend(): 답변 -> 장르 -> 후보 풀 -> 상위 5편 -> 최종 1편을 한 번에
+
+캐시/limiter 같은 공유 자원은 shared_resource로 프로세스당 하나만 만든다
+(Streamlit의 st.cache_resource와 같은 역할 - 모든 세션/워커 스레드가 공유).
+"""
+import functools
+import hashlib
+import hmac
+import inspect
+import json
+import math
+import os
+import pickle
+import random
+import re
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Type
+from urllib.parse import urlencode
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from catalog import LocalCatalog, MovieRecord
+from metrics import Registry, SpanLog, UpstreamSpan, serve
+from rerank import DEFAULT_TERMS, POSTER_PENALTY, ScoreTerm, rerank_scored
+from semantic import VectorStore, score_pool
+
+# ============================================================
+# Config
+# ============================================================
+# 벤치마크/테스트에서는 로컬 대역 서버로 바꿔 끼운다 (benchmark.py)
+TMDB_API_BASE = os.getenv("TMDB_API_BASE", "https://api.themoviedb.org/3")
+POSTER_BASE = os.getenv("POSTER_BASE", "https://image.tmdb.org/t/p/w500")
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+
+# Discover 페이지 동시 조회 워커 수 (1이면 순차 조회)
+DISCOVER_MAX_WORKERS = 5
+# Top5 상세 조회 동시 워커 수
+DETAILS_MAX_WORKERS = 5
+# TMDB Discover 한 페이지당 결과 수 (로컬 카탈로그도 같은 단위로 풀 크기를 정한다)
+DISCOVER_PAGE_SIZE = 20
+# 인메모리 앱 캐시(SWR) 바이트 예산 - 넘으면 LRU로 내보낸다
+APP_CACHE_DEFAULT_MAX_BYTES = int(os.getenv("APP_CACHE_DEFAULT_MAX_BYTES", str(16 * 1024 * 1024)))
+# Discover 풀 SWR 정책: ttl 동안 신선, 이후 max_stale까지는 즉시 반환하면서 백그라운드 재검증
+DISCOVER_CACHE_TTL = 60 * 30
+DISCOVER_CACHE_MAX_STALE = 60 * 60 * 6
+DISCOVER_CACHE_MAX_BYTES = int(os.getenv("DISCOVER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+DETAILS_CACHE_MAX_BYTES = int(os.getenv("DETAILS_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# 로컬 컬럼형 카탈로그 위치: {LOCAL_CATALOG_DIR}/{language}/ (catalog.py build 로 생성)
+LOCAL_CATALOG_DIR = os.getenv("LOCAL_CATALOG_DIR", ".catalog")
+
+# 공유 HTTP 커넥션 풀 (환경변수로 조정 가능)
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))  # 호스트별 풀 개수
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))  # 호스트당 유지할 커넥션 수
+HTTP_TCP_KEEPALIVE = os.getenv("HTTP_TCP_KEEPALIVE", "1") != "0"
+TMDB_TIMEOUT = (float(os.getenv("TMDB_CONNECT_TIMEOUT", "3.05")), float(os.getenv("TMDB_READ_TIMEOUT", "15")))
+OPENAI_TIMEOUT = (float(os.getenv("OPENAI_CONNECT_TIMEOUT", "3.05")), float(os.getenv("OPENAI_READ_TIMEOUT", "30")))
+
+# 디스크 TMDB 응답 캐시 (같은 호스트의 여러 레플리카/재시작 간 공유)
+TMDB_CACHE_PATH = os.getenv("TMDB_CACHE_PATH", os.path.join(".cache", "tmdb_cache.sqlite3"))
+TMDB_CACHE_MAX_BYTES = int(os.getenv("TMDB_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# path prefix -> TTL(초). 먼저 매칭되는 항목 사용
+TMDB_CACHE_TTLS: List[Tuple[str, int]] = [
+    ("/discover/movie", 60 * 30),
+    ("/movie/", 60 * 60 * 24),
+]
+TMDB_CACHE_DEFAULT_TTL = 60 * 30
+# LLM 최종 1편 결과 캐시 (답변/장르/후보/모델/프롬프트 버전이 같으면 재사용)
+LLM_PICK_CACHE_PATH = os.getenv("LLM_PICK_CACHE_PATH", os.path.join(".cache", "llm_picks.sqlite3"))
+LLM_PICK_CACHE_TTL = int(os.getenv("LLM_PICK_CACHE_TTL", str(60 * 60 * 24 * 7)))
+LLM_PICK_CACHE_MAX_ENTRIES = int(os.getenv("LLM_PICK_CACHE_MAX_ENTRIES", "50000"))
+# 로컬 의미 유사도 재랭킹: cosine 유사도 가중치 (유사도 0.1 차이 = 평점 0.5 차이)
+SEMANTIC_WEIGHT = float(os.getenv("SEMANTIC_WEIGHT", "10.0"))
+SEMANTIC_STORE_MAX_ENTRIES = int(os.getenv("SEMANTIC_STORE_MAX_ENTRIES", "20000"))
+# LLM 프롬프트 입력 토큰 예산 (instructions 포함, 추정치). 넘으면 줄거리부터 줄인다
+OPENAI_PROMPT_TOKEN_BUDGET = int(os.getenv("OPENAI_PROMPT_TOKEN_BUDGET", "1000"))
+OPENAI_OVERVIEW_MIN_CHARS = 60
+# 로컬 순위 1위가 2위보다 이 비율 이상 앞서면 LLM 호출을 생략 ((1위-2위)/1위, 포스터 패널티 제외, 0이면 항상 호출)
+# 0.25면 평점 6~9/인기도 로그정규 분포 후보 풀에서 제출의 약 5%만 생략된다
+LLM_SKIP_MARGIN = float(os.getenv("LLM_SKIP_MARGIN", "0.25"))
+# 캐시 키에서 제외할 인증 파라미터 (응답 내용과 무관)
+TMDB_CACHE_IGNORED_PARAMS = {"api_key"}
+# 인증 실패한 자격증명(fingerprint)을 기억하는 시간(초)
+TMDB_AUTH_FAILURE_TTL = 60 * 10
+# fingerprint 솔트. 비워두면 프로세스마다 랜덤 생성
+TMDB_FINGERPRINT_SALT = os.getenv("TMDB_FINGERPRINT_SALT", "")
+
+# TMDB 공용 rate limiter (프로세스 내 모든 세션이 공유하는 token bucket)
+TMDB_RATE_LIMIT_RPS = float(os.getenv("TMDB_RATE_LIMIT_RPS", "20"))
+TMDB_RATE_LIMIT_BURST = int(os.getenv("TMDB_RATE_LIMIT_BURST", "40"))
+TMDB_RETRY_JITTER = 0.5  # Retry-After 이후 재개 시점을 흩뜨리는 최대 지터(초)
+
+# "결과 보기" 한 번에 허용하는 전체 시간 예산(초) - 모든 외부 호출이 이 안에서 끝나야 한다
+SUBMIT_DEADLINE_SECONDS = float(os.getenv("SUBMIT_DEADLINE_SECONDS", "20"))
+# upstream별 circuit breaker: 연속 실패 N회면 open, reset_timeout 뒤 probe 1회 허용
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+# probe가 결과를 남기지 못한 채 사라져도 이 시간(초)이 지나면 다른 호출이 probe를 맡는다 (가장 긴 호출 1회보다 길게)
+CIRCUIT_PROBE_TIMEOUT = float(os.getenv("CIRCUIT_PROBE_TIMEOUT", "45"))
+
+# TMDB 장르 ID
+TMDB_GENRE_IDS = {
+    "action": 28,
+    "comedy": 35,
+    "drama": 18,
+    "scifi": 878,
+    "romance": 10749,
+    "fantasy": 14,
+}
+
+DISPLAY_LABEL = {
+    "action": "액션",
+    "comedy": "코미디",
+    "drama": "드라마",
+    "scifi": "SF",
+    "romance": "로맨스",
+    "fantasy": "판타지",
+}
+
+LANGUAGE_OPTIONS = ["ko-KR", "en-US", "ja-JP"]
+
+# 사이드바 기본값 (캐시 워밍도 같은 값으로 미리 채운다)
+DEFAULT_INCLUDE_ADULT = False
+DEFAULT_MIN_VOTE_AVG = 6.0
+DEFAULT_MIN_VOTE_COUNT = 200
+DEFAULT_PAGES_TO_POOL = 2
+DEFAULT_SHOW_TRAILER = True
+# 의미 유사도 재랭킹은 켜는 사람만 (끄면 후보 5편이 기존 평점/인기도 순 그대로)
+DEFAULT_SEMANTIC_RERANK = False
+
+# 지표 내보내기 (Prometheus text format)
+# METRICS_PORT: 0이 아니면 METRICS_HOST:METRICS_PORT/metrics 로 제공
+# METRICS_TEXTFILE: 지정하면 제출마다 파일로 기록 (node_exporter textfile collector 등)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE", "")
+METRICS_PREFIX = "movie_app_"
+METRICS_RECENT_SPANS = 50
+
+# ============================================================
+# Shared resources
+# ============================================================
+_shared_lock = threading.RLock()
+_shared_instances: Dict[Tuple[str, Tuple[Any, ...]], Any] = {}
+
+
+def shared_resource(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """인자별로 한 번만 만들어 프로세스 전체가 공유하는 자원 (st.cache_resource 대용)"""
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any) -> Any:
+        key = (fn.__qualname__, args)
+        with _shared_lock:
+            if key not in _shared_instances:
+                _shared_instances[key] = fn(*args)
+            return _shared_instances[key]
+
+    return wrapper
+
+
+def clear_shared_resources() -> None:
+    """공유 자원을 모두 버린다 (다음 호출 때 새로 생성) - 벤치마크 cold 실행 등"""
+    with _shared_lock:
+        _shared_instances.clear()
+
+
+@shared_resource
+def get_local_catalog(language: str) -> Optional[LocalCatalog]:
+    return LocalCatalog.open(os.path.join(LOCAL_CATALOG_DIR, language))
+
+
+# ============================================================
+# Questions
+# 선택지 순서(중요): 1) 로맨스/드라마, 2) 액션/어드벤처, 3) SF/판타지, 4) 코미디
+# ============================================================
+QUESTIONS = [
+    {
+        "q": "Q1. 시험이 끝난 날, 가장 하고 싶은 일은?",
+        "options": [
+            "조용한 카페에 가서 음악 들으며 하루를 정리한다",
+            "친구들이랑 즉흥적으로 여행이나 액티비티를 간다",
+            "집에서 몰입감 있는 세계관의 작품을 정주행한다",
+            "아무 생각 없이 웃긴 영상이나 예능을 본다",
+        ],
+    },
+    {
+        "q": "Q2. 영화 볼 때 가장 중요하게 보는 요소는?",
+        "options": [
+            "인물 간의 감정선과 관계 변화",
+            "긴장감 넘치는 전개와 시원한 장면",
+            "설정의 참신함과 세계관의 완성도",
+            "대사나 상황에서 나오는 웃음 포인트",
+        ],
+    },
+    {
+        "q": "Q3. 친구가 영화를 추천해달라고 하면?",
+        "options": [
+            "여운이 오래 남는 작품을 추천한다",
+            "같이 보면서 감탄할 수 있는 영화를 추천한다",
+            "“이건 설정이 미쳤다” 싶은 영화를 추천한다",
+            "같이 웃으면서 볼 수 있는 영화를 추천한다",
+        ],
+    },
+    {
+        "q": "Q4. 당신이 더 끌리는 영화 속 주인공은?",
+        "options": [
+            "현실적인 고민을 안고 성장하는 인물",
+            "위험한 상황에서도 몸부터 움직이는 인물",
+            "특별한 능력이나 운명을 지닌 인물",
+            "실수 많고 인간적인 매력의 인물",
+        ],
+    },
+    {
+        "q": "Q5. 주말에 혼자 영화 한 편을 본다면?",
+        "options": [
+            "감정이입하며 천천히 몰입할 수 있는 영화",
+            "스트레스가 확 풀리는 영화",
+            "현실을 잠시 잊게 해주는 영화",
+            "가볍게 웃고 끝낼 수 있는 영화",
+        ],
+    },
+]
+
+CATEGORY_BY_OPTION_INDEX = {
+    0: "romance_drama",
+    1: "action_adventure",
+    2: "sf_fantasy",
+    3: "comedy",
+}
+
+# ============================================================
+# Helpers - Metrics
+# ============================================================
+@shared_resource
+def get_metrics() -> Registry:
+    registry = Registry(METRICS_PREFIX)
+    # 컴포넌트 카운터(캐시/limiter/breaker)는 수집 시점에 stats()에서 읽는다
+    registry.add_collector(collect_engine_stats)
+    if METRICS_PORT:
+        try:
+            serve(registry, METRICS_PORT, METRICS_HOST)
+        except OSError:
+            # 같은 포트를 다른 워커 프로세스가 이미 쓰는 경우 - 파일 내보내기/디버그 화면은 그대로 동작
+            pass
+    return registry
+
+
+@shared_resource
+def get_span_log() -> SpanLog:
+    return SpanLog(METRICS_RECENT_SPANS)
+
+
+def upstream_span(service: str, path: str) -> UpstreamSpan:
+    """외부 호출 span. endpoint 라벨은 id를 지워 카디널리티를 묶는다 (/movie/123 -> /movie/{id})"""
+    return UpstreamSpan(get_metrics(), get_span_log(), service, re.sub(r"/\d+", "/{id}", path))
+
+
+def histogram_summary(name: str) -> Dict[str, Dict[str, Any]]:
+    metric = get_metrics().get(name)
+    return metric.summary() if metric is not None else {}
+
+
+# ============================================================
+# Helpers - TMDB Auth & Requests
+# ============================================================
+def build_tmdb_auth(api_key: str, bearer: str) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    headers: Dict[str, str] = {"accept": "application/json"}
+    base_params: Dict[str, Any] = {}
+
+    bearer = (bearer or "").strip()
+    api_key = (api_key or "").strip()
+
+    if bearer:
+        headers["Authorization"] = f"Bearer {bearer}"
+    elif api_key:
+        base_params["api_key"] = api_key
+
+    return headers, base_params
+
+
+@shared_resource
+def get_fingerprint_salt() -> bytes:
+    # 스크립트는 rerun마다 다시 실행되므로 랜덤 솔트는 프로세스 단위 리소스로 고정
+    return TMDB_FINGERPRINT_SALT.encode("utf-8") or secrets.token_bytes(16)
+
+
+def tmdb_auth_fingerprint(headers: Dict[str, str], base_params: Dict[str, Any]) -> str:
+    """자격증명 자체의 salted hash. 인증 실패 기록에만 사용하고 카탈로그 캐시 키에는 쓰지 않는다."""
+    if headers.get("Authorization"):
+        cred = "bearer:" + headers["Authorization"]
+    else:
+        cred = "apikey:" + str(base_params.get("api_key") or "")
+    return hmac.new(get_fingerprint_salt(), cred.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+
+class TmdbAuthError(RuntimeError):
+    """TMDB 401/403 - 재시도해도 소용없는 인증 실패"""
+
+
+class AuthFailureCache:
+    """인증에 실패한 fingerprint -> 만료 시각. 같은 잘못된 키로 TMDB를 반복 호출하지 않도록 한다."""
+
+    def __init__(self, ttl: int) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._failed: Dict[str, float] = {}
+
+    def record(self, fingerprint: str) -> None:
+        now = time.time()
+        with self._lock:
+            # 만료된 기록은 여기서 정리해 dict가 계속 커지지 않게 한다
+            for fp in [fp for fp, expires_at in self._failed.items() if expires_at <= now]:
+                del self._failed[fp]
+            self._failed[fingerprint] = now + self.ttl
+
+    def is_failed(self, fingerprint: str) -> bool:
+        with self._lock:
+            expires_at = self._failed.get(fingerprint)
+            if expires_at is None:
+                return False
+            if expires_at <= time.time():
+                del self._failed[fingerprint]
+                return False
+            return True
+
+
+@shared_resource
+def get_auth_failure_cache() -> AuthFailureCache:
+    return AuthFailureCache(TMDB_AUTH_FAILURE_TTL)
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """keep-alive 커넥션 풀 + 요청/신규 커넥션 카운터"""
+
+    def __init__(self, pool_connections: int, pool_maxsize: int, tcp_keepalive: bool) -> None:
+        self._tcp_keepalive = tcp_keepalive
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=False)
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        if self._tcp_keepalive:
+            from urllib3.connection import HTTPConnection
+
+            kwargs["socket_options"] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+            ]
+        super().init_poolmanager(*args, **kwargs)
+
+    def pool_stats(self) -> Dict[str, Dict[str, int]]:
+        """host별 {requests, new_connections, reused}"""
+        stats: Dict[str, Dict[str, int]] = {}
+        pools = self.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            n_req = int(getattr(pool, "num_requests", 0))
+            n_conn = int(getattr(pool, "num_connections", 0))
+            stats[f"{pool.scheme}://{pool.host}"] = {
+                "requests": n_req,
+                "new_connections": n_conn,
+                "reused": max(0, n_req - n_conn),
+            }
+        return stats
+
+
+@shared_resource
+def get_http_session() -> requests.Session:
+    """
+    모든 세션/스레드가 공유하는 프로세스 단위 requests.Session.
+    TMDB/OpenAI 호출이 매번 TCP+TLS 핸드셰이크를 하지 않도록 커넥션을 재사용한다.
+    """
+    session = requests.Session()
+    adapter = PooledHTTPAdapter(HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_TCP_KEEPALIVE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def http_pool_stats() -> Dict[str, Dict[str, int]]:
+    adapter = get_http_session().get_adapter("https://")
+    return adapter.pool_stats() if isinstance(adapter, PooledHTTPAdapter) else {}
+
+
+class TmdbDiskCache:
+    """
+    SQLite 기반 TMDB 응답 캐시.
+    - key: path + 정규화된 params (인증 파라미터 제외)
+    - endpoint별 TTL, 만료 후에는 ETag/Last-Modified로 조건부 재검증
+    - 전체 크기가 max_bytes를 넘으면 last_access 기준 LRU로 삭제
+    WAL 모드라 같은 파일을 여러 프로세스가 동시에 읽고 쓸 수 있다.
+    """
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "revalidated": 0, "stores": 0, "evictions": 0}
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    body TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    size INTEGER NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    @staticmethod
+    def make_key(path: str, params: Dict[str, Any]) -> str:
+        items = sorted((k, str(v)) for k, v in params.items() if k not in TMDB_CACHE_IGNORED_PARAMS)
+        return f"{path}?{urlencode(items)}"
+
+    @staticmethod
+    def ttl_for(path: str) -> int:
+        for prefix, ttl in TMDB_CACHE_TTLS:
+            if path.startswith(prefix):
+                return ttl
+        return TMDB_CACHE_DEFAULT_TTL
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """만료 여부와 상관없이 저장된 항목 반환 (fresh 여부는 expires_at으로 판단)"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT body, etag, last_modified, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        body, etag, last_modified, expires_at = row
+        self._count("hits" if expires_at > time.time() else "misses")
+        return {"body": json.loads(body), "etag": etag, "last_modified": last_modified, "expires_at": expires_at}
+
+    def put(self, key: str, path: str, body: Dict[str, Any], etag: Optional[str], last_modified: Optional[str]) -> None:
+        raw = json.dumps(body, ensure_ascii=False)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, body, etag, last_modified, expires_at, last_access, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, raw, etag, last_modified, now + self.ttl_for(path), now, len(raw.encode("utf-8"))),
+            )
+        self._count("stores")
+        self._evict_if_needed()
+
+    def refresh(self, key: str, path: str) -> None:
+        """304 Not Modified -> 만료 시각만 연장"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE responses SET expires_at = ?, last_access = ? WHERE key = ?",
+                (now + self.ttl_for(path), now, key),
+            )
+        self._count("revalidated")
+
+    def _evict_if_needed(self) -> None:
+        with self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            # 여유를 두고 90%까지 줄인다
+            target = int(self.max_bytes * 0.9)
+            evicted = 0
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+                if total <= target:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        self._count("evictions", evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        with self._lock:
+            counters = dict(self.counters)
+        return {"entries": entries, "bytes": total, **counters}
+
+
+class TokenBucket:
+    """
+    스레드 안전 token bucket (GCRA 방식 예약).
+    - acquire(): 토큰이 생길 때까지 대기하고 대기 시간을 반환 (timeout 초과 예정이면 None)
+    - pause(seconds): 429 Retry-After를 받으면 모든 호출자를 그 시점까지 멈춘다
+    각 호출자는 예약된 시각에 깨어나므로 동시에 몰린 요청도 rate에 맞춰 순서대로 나간다.
+    """
+
+    def __init__(self, rate: float, burst: int, jitter: float) -> None:
+        self.rate = max(rate, 0.001)
+        self.burst = max(burst, 1)
+        self.jitter = jitter
+        self._interval = 1.0 / self.rate
+        self._tolerance = (self.burst - 1) * self._interval
+        self._tat = 0.0  # theoretical arrival time
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.metrics = {
+            "acquired": 0,
+            "waited": 0,
+            "waiting_now": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "pauses": 0,
+        }
+
+    def acquire(self, timeout: Optional[float] = None, sleep: Callable[[float], Any] = time.sleep) -> Optional[float]:
+        """
+        timeout 안에 토큰을 받을 수 없으면 예약하지 않고 None 반환.
+        sleep을 바꾸면 대기를 중간에 끊을 수 있다 (예: Deadline.sleep - 취소 시 바로 반환)
+        """
+        with self._lock:
+            now = time.monotonic()
+            tat = max(self._tat, now)
+            allow_at = tat - self._tolerance
+            if self._paused_until > allow_at:
+                # Retry-After로 멈춘 구간: 재개 시점이 한꺼번에 몰리지 않게 지터 추가
+                allow_at = self._paused_until + random.uniform(0, self.jitter)
+            wait = max(0.0, allow_at - now)
+            if timeout is not None and wait > timeout:
+                return None
+            self._tat = max(tat, allow_at) + self._interval
+            self.metrics["acquired"] += 1
+            if wait > 0:
+                self.metrics["waited"] += 1
+                self.metrics["waiting_now"] += 1
+                self.metrics["wait_seconds_total"] += wait
+                self.metrics["wait_seconds_max"] = max(self.metrics["wait_seconds_max"], wait)
+
+        if wait > 0:
+            try:
+                sleep(wait)
+            finally:
+                with self._lock:
+                    self.metrics["waiting_now"] -= 1
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.metrics["pauses"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            m = dict(self.metrics)
+        m["wait_seconds_avg"] = m["wait_seconds_total"] / m["acquired"] if m["acquired"] else 0.0
+        return m
+
+
+@shared_resource
+def get_tmdb_rate_limiter() -> TokenBucket:
+    return TokenBucket(TMDB_RATE_LIMIT_RPS, TMDB_RATE_LIMIT_BURST, TMDB_RETRY_JITTER)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After: 초(숫자) 또는 HTTP-date"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """full jitter 지수 백오프 - 여러 세션이 같은 박자로 재시도하지 않도록"""
+    return random.uniform(0, min(8, 1.2 * (2**attempt)))
+
+
+class DeadlineExceeded(RuntimeError):
+    """요청 전체 시간 예산 소진"""
+
+
+class RunCancelled(DeadlineExceeded):
+    """새 실행(rerun)이 시작돼 이전 실행의 외부 호출을 중단 - 예산 소진과 똑같이 처리한다"""
+
+
+class CircuitOpenError(RuntimeError):
+    """upstream circuit이 열려 있어 호출하지 않고 바로 실패"""
+
+
+class Deadline:
+    """
+    "결과 보기" 한 번의 전체 시간 예산. 핸들러에서 만들어 모든 외부 호출까지 전달한다.
+    각 호출은 남은 시간으로 timeout/백오프를 줄이고, 예산이 없으면 재시도하지 않는다.
+    cancel()되면 남은 예산이 0이 되고 sleep() 중인 백오프도 바로 깨어난다 (실행이 버려졌을 때)
+    """
+
+    def __init__(self, seconds: float) -> None:
+        self.expires_at = time.monotonic() + seconds
+        self._cancelled = threading.Event()
+        self.closed = False
+
+    def remaining(self) -> float:
+        if self._cancelled.is_set():
+            return 0.0
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def cap(self, seconds: float) -> float:
+        return min(seconds, self.remaining())
+
+    def check(self, what: str) -> None:
+        if self._cancelled.is_set():
+            raise RunCancelled(f"{what}: 새 실행이 시작돼 중단했습니다.")
+        if self.expired():
+            raise DeadlineExceeded(f"{what}: 시간 예산을 모두 사용했습니다.")
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def sleep(self, seconds: float) -> None:
+        """백오프/대기용 sleep. 남은 예산만큼만 자고, 취소되면 바로 돌아온다"""
+        self._cancelled.wait(self.cap(seconds))
+
+    def close(self) -> None:
+        """실행이 정상적으로 끝남 (이후 rerun이 와도 취소할 것이 없음)"""
+        self.closed = True
+
+
+class CircuitBreaker:
+    """
+    upstream 하나에 대한 circuit breaker.
+    closed -> (연속 실패 failure_threshold회) -> open -> (reset_timeout 경과) -> half_open(probe 1개)
+    probe 성공이면 closed, 실패면 다시 open. probe가 probe_timeout 안에 결과를 남기지 않으면 자리를 다시 연다.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, probe_timeout: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started_at = 0.0
+        self.metrics = {"rejected": 0, "opened": 0}
+
+    def before_call(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self._state == "open" and now - self._opened_at >= self.reset_timeout:
+                self._state = "half_open"
+                self._probe_in_flight = False
+            if self._state == "closed":
+                return
+            if self._state == "half_open" and (
+                not self._probe_in_flight or now - self._probe_started_at >= self.probe_timeout
+            ):
+                self._probe_in_flight = True
+                self._probe_started_at = now
+                return
+            self.metrics["rejected"] += 1
+        raise CircuitOpenError(f"{self.name} 서비스가 불안정해 잠시 호출을 중단했습니다.")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    self.metrics["opened"] += 1
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def record_inconclusive(self) -> None:
+        """성공/실패를 판단할 수 없는 호출 (예: 시간 예산 때문에 끊김) - probe 자리만 반납"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self._state, "consecutive_failures": self._failures, **self.metrics}
+
+
+@shared_resource
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(name, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, CIRCUIT_PROBE_TIMEOUT)
+
+
+class SingleFlight:
+    """
+    같은 key의 동시 호출을 하나로 합친다.
+    첫 호출자(leader)만 fn을 실행하고, 나머지는 leader의 Future를 기다려 같은 결과/예외를 받는다.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        self.metrics = {"executed": 0, "coalesced": 0}
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        timeout: Optional[float] = None,
+        retry_on: Tuple[Type[BaseException], ...] = (),
+    ) -> Any:
+        with self._lock:
+            fut = self._in_flight.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._in_flight[key] = fut
+                self.metrics["executed"] += 1
+            else:
+                self.metrics["coalesced"] += 1
+
+        if not leader:
+            try:
+                return fut.result(timeout=timeout)
+            except retry_on:
+                return fn()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.metrics, "in_flight": len(self._in_flight)}
+
+
+@shared_resource
+def get_tmdb_single_flight() -> SingleFlight:
+    return SingleFlight()
+
+
+@shared_resource
+def get_tmdb_disk_cache() -> TmdbDiskCache:
+    return TmdbDiskCache(TMDB_CACHE_PATH, TMDB_CACHE_MAX_BYTES)
+
+
+def tmdb_get(
+    path: str,
+    headers: Dict[str, str],
+    base_params: Dict[str, Any],
+    params: Optional[Dict[str, Any]] = None,
+    max_retries: int = 4,
+    use_cache: bool = True,
+    deadline: Optional[Deadline] = None,
+) -> Dict[str, Any]:
+    url = f"{TMDB_API_BASE}{path}"
+    merged = dict(base_params)
+    if params:
+        merged.update(params)
+    deadline = deadline or Deadline(math.inf)
+
+    # 디스크 캐시: fresh면 바로 반환, 만료됐으면 validator로 조건부 요청
+    cache = get_tmdb_disk_cache() if use_cache else None
+    cache_key = TmdbDiskCache.make_key(path, merged)
+    cached = cache.get(cache_key) if cache else None
+    if cached and cached["expires_at"] > time.time():
+        return cached["body"]
+
+    # 인증 실패로 기록된 자격증명이면 TMDB를 다시 부르지 않는다
+    fingerprint = tmdb_auth_fingerprint(headers, base_params)
+    if get_auth_failure_cache().is_failed(fingerprint):
+        raise TmdbAuthError("TMDB 인증 실패: API Key/토큰을 확인해 주세요.")
+
+    # 같은 키로 이미 진행 중인 요청이 있으면 그 결과를 같이 기다린다 (single-flight)
+    def fetch() -> Dict[str, Any]:
+        span = upstream_span("TMDB", path)
+        try:
+            return fetch_with_retries(span)
+        finally:
+            span.finish()
+
+    def fetch_with_retries(span: UpstreamSpan) -> Dict[str, Any]:
+        req_headers = dict(headers)
+        if cached and cached["etag"]:
+            req_headers["If-None-Match"] = cached["etag"]
+        if cached and cached["last_modified"]:
+            req_headers["If-Modified-Since"] = cached["last_modified"]
+
+        limiter = get_tmdb_rate_limiter()
+        breaker = get_circuit_breaker("TMDB")
+        last_err: Optional[Exception] = None
+        try:
+            for attempt in range(max_retries):
+                deadline.check("TMDB")
+                if limiter.acquire(timeout=deadline.remaining(), sleep=deadline.sleep) is None:
+                    raise DeadlineExceeded("TMDB: rate limit 대기가 시간 예산을 넘습니다.")
+                # 대기하는 동안 실행이 취소됐을 수 있다
+                deadline.check("TMDB")
+                breaker.before_call()
+                settled = False
+                try:
+                    # 예산 때문에 줄어든 timeout으로 끊긴 건 upstream 장애로 세지 않는다
+                    budget_limited = deadline.remaining() < TMDB_TIMEOUT[1]
+                    timeout = (deadline.cap(TMDB_TIMEOUT[0]), deadline.cap(TMDB_TIMEOUT[1]))
+                    if min(timeout) <= 0:
+                        # check() 이후 예산이 바닥났거나 취소됨 - timeout 0으로 보내면 requests가 ValueError
+                        deadline.check("TMDB")
+                        raise DeadlineExceeded("TMDB: 시간 예산을 모두 사용했습니다.")
+                    sent_at = time.perf_counter()
+                    try:
+                        r = get_http_session().get(url, headers=req_headers, params=merged, timeout=timeout)
+                    except requests.RequestException as e:
+                        span.attempt("timeout" if isinstance(e, requests.Timeout) else "error", time.perf_counter() - sent_at)
+                        if budget_limited and isinstance(e, requests.Timeout):
+                            breaker.record_inconclusive()
+                        else:
+                            breaker.record_failure()
+                        settled = True
+                        last_err = e
+                        delay = deadline.cap(backoff_delay(attempt))
+                        span.retry("network", delay)
+                        deadline.sleep(delay)
+                        continue
+                    span.attempt(str(r.status_code), time.perf_counter() - sent_at)
+
+                    if r.status_code == 429:
+                        # 공용 limiter를 멈춰 다른 세션도 같이 물러나게 한다 (다음 acquire에서 대기)
+                        breaker.record_success()
+                        settled = True
+                        delay = parse_retry_after(r.headers.get("Retry-After")) or backoff_delay(attempt)
+                        limiter.pause(delay)
+                        span.retry("429", delay)
+                        last_err = RuntimeError("429 Too Many Requests")
+                        continue
+
+                    if r.status_code in (500, 502, 503, 504):
+                        breaker.record_failure()
+                        settled = True
+                        last_err = RuntimeError(f"{r.status_code} Server Error")
+                        delay = deadline.cap(backoff_delay(attempt))
+                        span.retry("5xx", delay)
+                        deadline.sleep(delay)
+                        continue
+
+                    breaker.record_success()
+                    settled = True
+
+                    if r.status_code in (401, 403):
+                        get_auth_failure_cache().record(fingerprint)
+                        span.outcome = "auth_error"
+                        raise TmdbAuthError("TMDB 인증 실패: API Key/토큰을 확인해 주세요.")
+
+                    if r.status_code == 304 and cached:
+                        cache.refresh(cache_key, path)
+                        span.outcome = "not_modified"
+                        return cached["body"]
+
+                    try:
+                        r.raise_for_status()
+                        data = r.json()
+                    except (requests.RequestException, ValueError) as e:
+                        last_err = e
+                        delay = deadline.cap(backoff_delay(attempt))
+                        span.retry("bad_response", delay)
+                        deadline.sleep(delay)
+                        continue
+                    if cache:
+                        cache.put(cache_key, path, data, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+                    span.outcome = "ok"
+                    return data
+                finally:
+                    if not settled:
+                        # 결과를 기록하지 못하고 빠져나감 (예산 소진/취소/예상 못 한 예외) - probe 자리만 반납
+                        breaker.record_inconclusive()
+
+        except (DeadlineExceeded, CircuitOpenError) as e:
+            # 만료된 디스크 캐시라도 있으면 degraded 응답으로 사용
+            if cached:
+                span.outcome = "degraded"
+                return cached["body"]
+            if isinstance(e, RunCancelled):
+                span.outcome = "cancelled"
+            else:
+                span.outcome = "deadline" if isinstance(e, DeadlineExceeded) else "circuit_open"
+            raise
+
+        if cached:
+            span.outcome = "degraded"
+            return cached["body"]
+        raise RuntimeError(f"TMDB 요청 실패: {last_err}")
+
+    remaining = deadline.remaining()
+    try:
+        return get_tmdb_single_flight().do(
+            cache_key,
+            fetch,
+            timeout=None if math.isinf(remaining) else remaining,
+            # 인증 실패/leader의 예산 소진은 호출자마다 다르므로 대기하던 쪽은 직접 다시 시도
+            retry_on=(TmdbAuthError, DeadlineExceeded),
+        )
+    except FutureTimeoutError:
+        raise DeadlineExceeded("TMDB: 진행 중인 동일 요청을 기다리다 시간 예산을 넘었습니다.")
+
+
+def fetch_discover_pages(
+    headers: Dict[str, str],
+    base_params: Dict[str, Any],
+    params: Dict[str, Any],
+    pages: int,
+    max_workers: int = DISCOVER_MAX_WORKERS,
+    deadline: Optional[Deadline] = None,
+) -> List[MovieRecord]:
+    """
+    /discover/movie 1..pages 페이지를 가져온다.
+    - 1페이지를 먼저 받아 total_pages를 확인하고, 실제로 있는 2..N 페이지만 bounded 워커 풀로 동시에 요청
+    - 도착한 페이지는 페이지 순서가 이어지는 만큼만 바로 합치면서 id 기준으로 중복 제거
+    - 결과는 앱이 쓰는 필드만 남긴 MovieRecord로 투영
+    """
+
+    def fetch(page: int) -> Dict[str, Any]:
+        return tmdb_get(
+            "/discover/movie",
+            headers=headers,
+            base_params=base_params,
+            params={**params, "page": page},
+            deadline=deadline,
+        )
+
+    uniq: Dict[int, MovieRecord] = {}
+    arrived: Dict[int, List[Dict[str, Any]]] = {}
+    next_page = 1
+
+    def flush() -> None:
+        nonlocal next_page
+        while next_page in arrived:
+            for m in arrived.pop(next_page):
+                mid = m.get("id")
+                if isinstance(mid, int) and mid not in uniq:
+                    uniq[mid] = MovieRecord.from_tmdb(m)
+            next_page += 1
+
+    first = fetch(1)
+    last_page = max(1, min(pages, int(first.get("total_pages") or pages)))
+    arrived[1] = first.get("results") or []
+    flush()
+    if last_page == 1:
+        return list(uniq.values())
+
+    workers = max(1, min(max_workers, last_page - 1))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tmdb-discover") as ex:
+        futures = {ex.submit(fetch, page): page for page in range(2, last_page + 1)}
+        for fut in as_completed(futures):
+            arrived[futures[fut]] = fut.result().get("results") or []
+            flush()
+
+    return list(uniq.values())
+
+
+class SwrCache:
+    """
+    stale-while-revalidate 인메모리 캐시 (프로세스 공유).
+    - age <= ttl: 그대로 반환 (hit)
+    - ttl < age <= ttl + max_stale: 오래된 값을 즉시 반환하고 백그라운드에서 갱신 (stale)
+    - 그보다 오래됐거나 없음: 동기 계산 (miss)
+    값은 st.cache_data처럼 pickle로 저장해 호출자마다 독립된 복사본을 돌려준다.
+    pickle 크기로 항목별 바이트를 세고, max_bytes를 넘으면 가장 오래 안 쓴 항목부터 내보낸다(LRU).
+    """
+
+    # dict 슬롯/튜플/타임스탬프 등 항목당 대략적인 고정 오버헤드(바이트)
+    ENTRY_OVERHEAD = 200
+
+    def __init__(self, name: str, ttl: float, max_stale: float, max_bytes: int) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._bytes = 0
+        self._refreshing: set = set()
+        self.metrics = {"hits": 0, "stale": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0, "evictions": 0}
+
+    def _entry_size(self, key: str, blob: bytes) -> int:
+        return len(key) + len(blob) + self.ENTRY_OVERHEAD
+
+    def _store(self, key: str, value: Any) -> None:
+        blob = pickle.dumps(value)
+        size = self._entry_size(key, blob)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= self._entry_size(key, old[0])
+            if size > self.max_bytes:
+                # 예산보다 큰 항목 하나는 저장하지 않는다
+                return
+            self._entries[key] = (blob, time.time())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key, (old_blob, _) = self._entries.popitem(last=False)
+                self._bytes -= self._entry_size(old_key, old_blob)
+                self.metrics["evictions"] += 1
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], refresh: Callable[[], Any]) -> Any:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            age = now - entry[1] if entry else math.inf
+            if age <= self.ttl:
+                self.metrics["hits"] += 1
+                return pickle.loads(entry[0])
+            if age <= self.ttl + self.max_stale:
+                self.metrics["stale"] += 1
+                start_refresh = key not in self._refreshing
+                if start_refresh:
+                    self._refreshing.add(key)
+                stale_value = entry[0]
+            else:
+                self.metrics["misses"] += 1
+                stale_value = None
+
+        if stale_value is None:
+            value = compute()
+            self._store(key, value)
+            return value
+
+        if start_refresh:
+            get_background_executor().submit(self._refresh, key, refresh)
+        return pickle.loads(stale_value)
+
+    def _refresh(self, key: str, refresh: Callable[[], Any]) -> None:
+        try:
+            value = refresh()
+        except Exception:
+            with self._lock:
+                self.metrics["refresh_errors"] += 1
+        else:
+            self._store(key, value)
+            with self._lock:
+                self.metrics["refreshes"] += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            m = dict(self.metrics)
+            entries, used = len(self._entries), self._bytes
+        lookups = m["hits"] + m["stale"] + m["misses"]
+        return {
+            "entries": entries,
+            "bytes": used,
+            "max_bytes": self.max_bytes,
+            "hit_ratio": round((m["hits"] + m["stale"]) / lookups, 4) if lookups else None,
+            **m,
+        }
+
+
+@shared_resource
+def get_background_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="swr-refresh")
+
+
+@shared_resource
+def get_swr_cache(name: str, ttl: float, max_stale: float, max_bytes: int) -> SwrCache:
+    return SwrCache(name, ttl, max_stale, max_bytes)
+
+
+SWR_CACHE_NAMES: List[Tuple[str, float, float, int]] = []
+
+
+def swr_cache(
+    ttl: float, max_stale: float, max_bytes: int = APP_CACHE_DEFAULT_MAX_BYTES
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    @st.cache_data 대신 쓰는 stale-while-revalidate 데코레이터.
+    st.cache_data와 같이 밑줄로 시작하는 인자는 캐시 키에서 제외한다.
+    _deadline은 요청 단위 예산이라 백그라운드 갱신에는 넘기지 않는다.
+    """
+
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        sig = inspect.signature(fn)
+        SWR_CACHE_NAMES.append((fn.__name__, ttl, max_stale, max_bytes))
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = repr(tuple((k, v) for k, v in bound.arguments.items() if not k.startswith("_")))
+            refresh_kwargs = {k: (None if k == "_deadline" else v) for k, v in bound.arguments.items()}
+            return get_swr_cache(fn.__name__, ttl, max_stale, max_bytes).get_or_compute(
+                key,
+                compute=lambda: fn(**bound.arguments),
+                refresh=lambda: fn(**refresh_kwargs),
+            )
+
+        return wrapper
+
+    return decorator
+
+
+def swr_cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: get_swr_cache(name, *policy).stats() for name, *policy in SWR_CACHE_NAMES}
+
+
+@swr_cache(ttl=DISCOVER_CACHE_TTL, max_stale=DISCOVER_CACHE_MAX_STALE, max_bytes=DISCOVER_CACHE_MAX_BYTES)
+def discover_movies_cached(
+    _auth: Tuple[Dict[str, str], Dict[str, Any]],
+    genre_id: int,
+    language: str,
+    include_adult: bool,
+    min_vote_avg: float,
+    min_vote_count: int,
+    pages: int,
+    backend: str = "tmdb",
+    _deadline: Optional[Deadline] = None,
+) -> List[MovieRecord]:
+    """
+    공용 카탈로그 캐시: 키는 요청 의미(장르/언어/필터/페이지)만으로 정해지고 모든 세션이 공유한다.
+    _auth/_deadline은 밑줄 인자라 캐시 키에서 빠지며, miss일 때 실제 호출에만 쓰인다.
+    backend="local"이면 TMDB 대신 로컬 컬럼형 카탈로그에서 같은 조건으로 조회한다.
+    """
+    if backend == "local":
+        catalog = get_local_catalog(language)
+        if catalog is None:
+            raise RuntimeError(f"로컬 카탈로그가 없습니다: {os.path.join(LOCAL_CATALOG_DIR, language)}")
+        return catalog.discover(
+            genre_id=genre_id,
+            include_adult=include_adult,
+            min_vote_avg=min_vote_avg,
+            min_vote_count=min_vote_count,
+            limit=pages * DISCOVER_PAGE_SIZE,
+        )
+
+    headers, base_params = _auth
+
+    return fetch_discover_pages(
+        headers=headers,
+        base_params=base_params,
+        params={
+            "with_genres": genre_id,
+            "language": language,
+            "sort_by": "popularity.desc",
+            "include_adult": str(include_adult).lower(),
+            "vote_average.gte": min_vote_avg,
+            "vote_count.gte": min_vote_count,
+        },
+        pages=pages,
+        deadline=_deadline,
+    )
+
+
+@swr_cache(ttl=60 * 60, max_stale=60 * 60 * 24, max_bytes=DETAILS_CACHE_MAX_BYTES)
+def movie_details_cached(
+    _auth: Tuple[Dict[str, str], Dict[str, Any]],
+    movie_id: int,
+    language: str,
+    with_trailer: bool,
+    _deadline: Optional[Deadline] = None,
+) -> MovieRecord:
+    """상세 조회 후 필요한 필드만 투영 - videos 목록 대신 고른 예고편 URL만 저장"""
+    headers, base_params = _auth
+
+    params: Dict[str, Any] = {"language": language}
+    if with_trailer:
+        params["append_to_response"] = "videos"
+
+    data = tmdb_get(
+        f"/movie/{movie_id}", headers=headers, base_params=base_params, params=params, deadline=_deadline
+    )
+    trailer_url = extract_youtube_trailer(data.get("videos")) if with_trailer else None
+    return MovieRecord.from_tmdb(data, trailer_url=trailer_url)
+
+
+def to_display_movie(base_movie: MovieRecord, details: MovieRecord) -> Dict[str, Any]:
+    """상세 응답(실패 시 Discover 결과)을 카드 표시용 dict로 정리"""
+    return {
+        "id": base_movie.get("id"),
+        "title": details.get("title") or base_movie.get("title") or "제목 없음",
+        "overview": (details.get("overview") or base_movie.get("overview") or "").strip(),
+        "vote_average": details.get("vote_average", base_movie.get("vote_average")),
+        "vote_count": details.get("vote_count", base_movie.get("vote_count")),
+        "release_date": details.get("release_date", base_movie.get("release_date")),
+        "poster_path": details.get("poster_path") or base_movie.get("poster_path"),
+        "trailer_url": details.get("trailer_url"),
+    }
+
+
+def extract_youtube_trailer(videos_obj: Optional[Dict[str, Any]]) -> Optional[str]:
+    results = (videos_obj or {}).get("results") or []
+    youtube = [v for v in results if v.get("site") == "YouTube" and v.get("key")]
+
+    if not youtube:
+        return None
+
+    def score(v: Dict[str, Any]) -> int:
+        t = (v.get("type") or "").lower()
+        official = v.get("official") is True
+        s = 0
+        if t == "trailer":
+            s += 20
+        elif t == "teaser":
+            s += 10
+        if official:
+            s += 5
+        return s
+
+    youtube.sort(key=score, reverse=True)
+    return f"https://www.youtube.com/watch?v={youtube[0]['key']}"
+
+
+# ============================================================
+# Helpers - Genre decision & reasons
+# ============================================================
+def decide_final_genre(selected_texts: List[str], category_counts: Counter) -> str:
+    top_category = category_counts.most_common(1)[0][0]
+
+    if top_category == "action_adventure":
+        return "action"
+    if top_category == "comedy":
+        return "comedy"
+
+    if top_category == "romance_drama":
+        romance_keywords = ["관계", "감정선", "감정이입", "로맨스", "설렘"]
+        drama_keywords = ["여운", "성장", "현실", "고민", "정리", "천천히"]
+        romance_score = sum(any(k in t for k in romance_keywords) for t in selected_texts)
+        drama_score = sum(any(k in t for k in drama_keywords) for t in selected_texts)
+        return "romance" if romance_score > drama_score else "drama"
+
+    if top_category == "sf_fantasy":
+        scifi_keywords = ["설정", "참신", "미래", "과학", "우주", "AI", "시간"]
+        fantasy_keywords = ["능력", "운명", "마법", "전설", "왕국", "드래곤", "특별한"]
+        scifi_score = sum(any(k in t for k in scifi_keywords) for t in selected_texts)
+        fantasy_score = sum(any(k in t for k in fantasy_keywords) for t in selected_texts)
+        return "fantasy" if fantasy_score > scifi_score else "scifi"
+
+    return "drama"
+
+
+def build_reason(genre_key: str, selected_texts: List[str], category_counts: Counter) -> str:
+    label = DISPLAY_LABEL.get(genre_key, genre_key)
+    top_cat, top_cnt = category_counts.most_common(1)[0]
+    cat_kor = {
+        "romance_drama": "로맨스/드라마",
+        "action_adventure": "액션/어드벤처",
+        "sf_fantasy": "SF/판타지",
+        "comedy": "코미디",
+    }.get(top_cat, top_cat)
+
+    picks = []
+    for t in selected_texts:
+        if len(picks) >= 2:
+            break
+        picks.append(t if len(t) <= 28 else t[:28] + "…")
+
+    base = f"답변에서 **{cat_kor} 성향**이 가장 강했어요({top_cnt}/5). - 그래서 **{label}** 장르가 잘 맞습니다."
+    if picks:
+        base += f" - 취향 포인트: “{picks[0]}”" + (f", “{picks[1]}”" if len(picks) > 1 else "")
+    return base
+
+
+# ============================================================
+# Helpers - Ranking
+# ============================================================
+SEMANTIC_TERMS: List[ScoreTerm] = DEFAULT_TERMS + [ScoreTerm("semantic", SEMANTIC_WEIGHT, lambda c: c["semantic"])]
+
+
+@shared_resource
+def get_semantic_store() -> VectorStore:
+    return VectorStore(SEMANTIC_STORE_MAX_ENTRIES)
+
+
+def semantic_scores(pool: List[MovieRecord], query_texts: List[str], language: str) -> np.ndarray:
+    """
+    후보 풀 전체의 답변-줄거리 유사도 (pool 순서).
+    로컬 카탈로그에 미리 계산된 벡터/idf가 있으면 그대로 쓰고, 없는 영화만 계산해 메모리에 보관.
+    """
+    store = get_semantic_store()
+    catalog = get_local_catalog(language)
+    if catalog is None or catalog.semantic_tf is None or catalog.semantic_tf.shape[1] != store.dim:
+        return score_pool(pool, query_texts, store.tf_for(language, pool))
+
+    rows = catalog.rows_for_ids(m["id"] for m in pool)
+    found = rows >= 0
+    tf = np.zeros((len(pool), store.dim), dtype=np.float32)
+    tf[found] = catalog.semantic_tf[rows[found]]
+    missing = np.flatnonzero(~found)
+    if missing.size:
+        tf[missing] = store.tf_for(language, [pool[i] for i in missing])
+    return score_pool(pool, query_texts, tf, catalog.semantic_idf)
+
+
+def rank_pool_scored(
+    pool: List[MovieRecord],
+    k: Optional[int] = None,
+    semantic: Optional[np.ndarray] = None,
+) -> Tuple[List[MovieRecord], np.ndarray]:
+    """
+    blended score(평점/인기도, 포스터 없으면 뒤로) 상위 k편과 점수 - rerank 모듈에서 한 번에 계산
+    semantic(유사도 컬럼)을 주면 SEMANTIC_WEIGHT만큼 점수에 더한다.
+    """
+    if semantic is None:
+        return rerank_scored(pool, k)
+    return rerank_scored(pool, k, SEMANTIC_TERMS, extra_columns={"semantic": semantic})
+
+
+def rank_pool(
+    pool: List[MovieRecord],
+    k: Optional[int] = None,
+    semantic: Optional[np.ndarray] = None,
+) -> List[MovieRecord]:
+    return rank_pool_scored(pool, k, semantic)[0]
+
+
+# ============================================================
+# Helpers - OpenAI Responses API
+# ============================================================
+# 프롬프트의 고정 부분. 바뀌면 OPENAI_PICK_PROMPT_VERSION이 자동으로 바뀌어 결과 캐시가 무효화된다.
+# (후보/답변을 끼워 넣는 템플릿 문장을 고치면 OPENAI_PICK_PROMPT_REVISION을 올린다)
+OPENAI_PICK_PROMPT_REVISION = 2
+OPENAI_PICK_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "properties": {
+        "movie_id": {"type": "integer", "description": "최종 추천 영화의 TMDB movie id"},
+        "title": {"type": "string", "description": "최종 추천 영화 제목"},
+        "reason": {"type": "string", "description": "사용자의 답변과 후보 영화 정보에 근거한 추천 이유 (2~4문장)"},
+        "confidence": {"type": "number", "minimum": 0, "maximum": 1, "description": "추천 확신도 (0~1)"},
+    },
+    "required": ["movie_id", "title", "reason", "confidence"],
+}
+OPENAI_PICK_INSTRUCTIONS = (
+    "너는 개인화 추천 전문가다. "
+    "사용자의 답변을 근거로, 후보 5편 중 최적 1편을 고른다. "
+    "반드시 주어진 JSON 스키마로만 출력한다."
+)
+OPENAI_PICK_CRITERIA = (
+    "선정 기준:\n"
+    "1) 답변에서 드러난 ‘시청 동기’(힐링/자극/몰입/웃음)와 톤이 잘 맞는가\n"
+    "2) 줄거리가 너무 무겁거나 난해한 경우는 감점(단, 답변이 몰입/세계관을 강하게 원하면 예외)\n"
+    "3) 후보 중 중복된 결(비슷한 톤)이면, 더 접근성이 좋고 만족도가 높을 것으로 보이는 쪽을 선택\n\n"
+    "출력은 반드시 JSON만."
+)
+OPENAI_PICK_PARAMS = {"temperature": 0.4, "max_output_tokens": 400}
+OPENAI_PICK_PROMPT_VERSION = f"r{OPENAI_PICK_PROMPT_REVISION}-" + hashlib.sha256(
+    json.dumps(
+        [
+            OPENAI_PICK_SCHEMA,
+            OPENAI_PICK_INSTRUCTIONS,
+            OPENAI_PICK_CRITERIA,
+            OPENAI_PICK_PARAMS,
+            OPENAI_PROMPT_TOKEN_BUDGET,
+        ],
+        ensure_ascii=False,
+        sort_keys=True,
+    ).encode("utf-8")
+).hexdigest()[:10]
+
+
+class LlmPickCache:
+    """
+    LLM 최종 1편 결과의 SQLite 캐시 (재시작/레플리카 간 공유).
+    키는 (답변, 추정 장르, 후보 id, 모델, 프롬프트 버전)의 해시. TTL이 지나면 무시하고,
+    max_entries를 넘으면 last_access 기준 LRU로 지운다.
+    """
+
+    def __init__(self, path: str, ttl: int, max_entries: int) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS picks (
+                    key TEXT PRIMARY KEY,
+                    body TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_picks_last_access ON picks(last_access)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    @staticmethod
+    def make_key(
+        user_answers: List[str], inferred_genre_key: str, candidate_ids: List[int], model: str
+    ) -> str:
+        raw = json.dumps(
+            [user_answers, inferred_genre_key, candidate_ids, model, OPENAI_PICK_PROMPT_VERSION], ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT body FROM picks WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE picks SET last_access = ? WHERE key = ?", (now, key))
+        self._count("hits" if row else "misses")
+        return json.loads(row[0]) if row else None
+
+    def contains(self, key: str) -> bool:
+        """get()과 달리 hit/miss나 접근 시각을 기록하지 않는 존재 확인 (LLM 생략 여부 판단용)"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT 1 FROM picks WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return row is not None
+
+    def put(self, key: str, pick: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO picks (key, body, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(pick, ensure_ascii=False), now + self.ttl, now),
+            )
+            conn.execute("DELETE FROM picks WHERE expires_at <= ?", (now,))
+            over = conn.execute("SELECT COUNT(*) FROM picks").fetchone()[0] - self.max_entries
+            if over > 0:
+                conn.execute(
+                    "DELETE FROM picks WHERE key IN (SELECT key FROM picks ORDER BY last_access ASC LIMIT ?)", (over,)
+                )
+        self._count("stores")
+        if over > 0:
+            self._count("evictions", over)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM picks").fetchone()[0]
+        with self._lock:
+            return {"entries": entries, "prompt_version": OPENAI_PICK_PROMPT_VERSION, **self.counters}
+
+
+@shared_resource
+def get_llm_pick_cache() -> LlmPickCache:
+    return LlmPickCache(LLM_PICK_CACHE_PATH, LLM_PICK_CACHE_TTL, LLM_PICK_CACHE_MAX_ENTRIES)
+
+
+class LlmPickMetrics:
+    """
+    LLM 최종 선정 지표 (디버그 정보에 표시).
+    - 프롬프트 토큰: 추정치와 API usage의 실제 input_tokens
+    - 생략(skip): 로컬 순위가 확실해서 호출하지 않은 횟수, 절약 시간은 최근 호출 지연의 EWMA로 추정
+    """
+
+    LATENCY_EWMA_ALPHA = 0.2
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.cache_hits = 0
+        self.skips = 0
+        self.prompt_tokens_est_total = 0
+        self.input_tokens_total = 0
+        self.usage_reported = 0
+        self.overviews_truncated = 0
+        self.latency_ewma: Optional[float] = None
+        self.latency_saved_s = 0.0
+
+    def record_call(self, prompt_tokens_est: int, input_tokens: Optional[int], truncated: int, latency_s: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens_est_total += prompt_tokens_est
+            if input_tokens is not None:
+                self.input_tokens_total += input_tokens
+                self.usage_reported += 1
+            self.overviews_truncated += truncated
+            if self.latency_ewma is None:
+                self.latency_ewma = latency_s
+            else:
+                self.latency_ewma += self.LATENCY_EWMA_ALPHA * (latency_s - self.latency_ewma)
+
+    def record_cache_hit(self) -> None:
+        with self._lock:
+            self.cache_hits += 1
+
+    def record_skip(self) -> float:
+        """생략 1회 기록, 이번에 절약한 시간(추정, 호출 이력이 없으면 0) 반환"""
+        with self._lock:
+            self.skips += 1
+            saved = self.latency_ewma or 0.0
+            self.latency_saved_s += saved
+            return saved
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            decisions = self.calls + self.cache_hits + self.skips
+            return {
+                "calls": self.calls,
+                "cache_hits": self.cache_hits,
+                "skips": self.skips,
+                "skip_ratio": round(self.skips / decisions, 3) if decisions else None,
+                "avg_prompt_tokens_est": round(self.prompt_tokens_est_total / self.calls, 1) if self.calls else None,
+                "avg_input_tokens": round(self.input_tokens_total / self.usage_reported, 1) if self.usage_reported else None,
+                "overviews_truncated": self.overviews_truncated,
+                "latency_ewma_s": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+                "latency_saved_s": round(self.latency_saved_s, 2),
+            }
+
+
+@shared_resource
+def get_llm_metrics() -> LlmPickMetrics:
+    return LlmPickMetrics()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    토크나이저 없이 쓰는 보수적 추정: ASCII는 4자당 1토큰, 한글 등 비ASCII는 1자당 1토큰.
+    (예산 판단용이라 실제보다 약간 크게 나오는 편이 안전하다)
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+def truncate_overview(text: str, max_chars: int) -> str:
+    """max_chars 안에서 가능한 한 문장 경계로 자른다"""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    end = max(cut.rfind(p) for p in (".", "!", "?", "。"))
+    if end >= max_chars // 2:
+        return cut[: end + 1]
+    space = cut.rfind(" ")
+    return (cut[:space] if space >= max_chars // 2 else cut).rstrip() + "…"
+
+
+def build_pick_prompt(
+    user_answers: List[str],
+    inferred_genre_key: str,
+    candidates: List[Dict[str, Any]],
+    token_budget: int = OPENAI_PROMPT_TOKEN_BUDGET,
+) -> Tuple[str, int, int]:
+    """
+    토큰 예산 안에 들어오도록 LLM 프롬프트(user 메시지)를 만든다.
+    - 후보 줄은 필요한 필드만 짧게 (개봉일은 연도만, 필드 이름 생략)
+    - 예산을 넘으면 모든 후보의 줄거리 길이 상한을 같이 줄여 나간다 (OPENAI_OVERVIEW_MIN_CHARS까지)
+    returns: (content, 추정 토큰 수(instructions 포함), 잘린 줄거리 수)
+    """
+    inferred = DISPLAY_LABEL.get(inferred_genre_key, inferred_genre_key)
+    overviews = [" ".join((m.get("overview") or "").split()) for m in candidates]
+    fixed_tokens = estimate_tokens(OPENAI_PICK_INSTRUCTIONS)
+
+    def render(limit: Optional[int]) -> Tuple[str, int]:
+        lines = []
+        truncated = 0
+        for m, overview in zip(candidates, overviews):
+            if limit is not None and len(overview) > limit:
+                overview = truncate_overview(overview, limit)
+                truncated += 1
+            lines.append(
+                f"- id={m['id']} | {m.get('title', '')} | 평점 {float(m.get('vote_average') or 0.0):.1f}"
+                f" ({int(m.get('vote_count') or 0)}표) | {(m.get('release_date') or '')[:4] or '연도 미상'}\n"
+                f"  {overview or '줄거리 없음'}"
+            )
+        content = (
+            f"아래는 대학생 사용자의 심리테스트 답변과, TMDB에서 뽑은 후보 영화 {len(candidates)}편이다.\n"
+            "목표: ‘사용자가 실제로 가장 좋아할 가능성이 높은 단 한 편’을 고른다.\n\n"
+            "[사용자 답변]\n- " + "\n- ".join(user_answers) + "\n\n"
+            f"[시스템이 추정한 선호 장르]\n- {inferred} ({inferred_genre_key})\n\n"
+            "[후보 영화] id | 제목 | 평점(투표 수) | 개봉 연도 / 줄거리\n" + "\n".join(lines) + "\n\n" + OPENAI_PICK_CRITERIA
+        )
+        return content, truncated
+
+    limit: Optional[int] = None
+    content, truncated = render(limit)
+    tokens = fixed_tokens + estimate_tokens(content)
+    longest = max((len(o) for o in overviews), default=0)
+    while tokens > token_budget and (limit is None or limit > OPENAI_OVERVIEW_MIN_CHARS):
+        limit = max(OPENAI_OVERVIEW_MIN_CHARS, int((longest if limit is None else limit) * 0.75))
+        content, truncated = render(limit)
+        tokens = fixed_tokens + estimate_tokens(content)
+    return content, tokens, truncated
+
+
+def openai_extract_output_text(resp_json: Dict[str, Any]) -> str:
+    """
+    Responses API: output[] -> message -> content[] -> output_text.text
+    """
+    out = resp_json.get("output") or []
+    chunks: List[str] = []
+    for item in out:
+        if item.get("type") == "message":
+            for c in item.get("content") or []:
+                if c.get("type") == "output_text" and isinstance(c.get("text"), str):
+                    chunks.append(c["text"])
+    return "\n".join(chunks).strip()
+
+
+def _partial_json_string(text: str, field: str) -> Optional[str]:
+    """아직 닫히지 않았을 수 있는 JSON 문자열 필드 값을 지금까지 받은 만큼 디코드"""
+    m = re.search(r'"%s"\s*:\s*"' % re.escape(field), text)
+    if not m:
+        return None
+    out: List[str] = []
+    i = m.end()
+    while i < len(text):
+        ch = text[i]
+        if ch == '"':
+            break
+        if ch == "\\":
+            if i + 1 >= len(text):
+                break
+            esc = text[i + 1]
+            if esc == "u":
+                if i + 6 > len(text):
+                    break
+                out.append(chr(int(text[i + 2 : i + 6], 16)))
+                i += 6
+                continue
+            out.append({"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}.get(esc, esc))
+            i += 2
+            continue
+        out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def parse_partial_pick(text: str) -> Dict[str, Any]:
+    """
+    스트리밍 중인 JSON 텍스트에서 지금까지 확정된 필드만 뽑는다.
+    strict json_schema 출력은 스키마 순서(movie_id -> title -> reason -> confidence)로 나온다.
+    """
+    partial: Dict[str, Any] = {}
+    m = re.search(r'"movie_id"\s*:\s*(-?\d+)\s*[,}]', text)
+    if m:
+        partial["movie_id"] = int(m.group(1))
+    for field in ("title", "reason"):
+        value = _partial_json_string(text, field)
+        if value is not None:
+            partial[field] = value
+    m = re.search(r'"confidence"\s*:\s*(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)\s*[,}]', text)
+    if m:
+        partial["confidence"] = float(m.group(1))
+    return partial
+
+
+def openai_consume_stream(
+    r: requests.Response,
+    on_partial: Optional[Callable[[Dict[str, Any]], None]],
+    started_at: float,
+    timings: Dict[str, Any],
+    deadline: Optional[Deadline] = None,
+) -> str:
+    """
+    Responses API SSE 스트림을 읽어 output_text를 모은다.
+    델타가 올 때마다 부분 파싱 결과가 바뀌면 on_partial 호출, 첫 델타 시점을 ttft_s로 기록.
+    deadline이 취소되면 연결을 닫고 RunCancelled (남은 토큰 생성을 기다리지 않는다).
+    """
+    chunks: List[str] = []
+    final_text = ""
+    last_partial: Dict[str, Any] = {}
+    data_lines: List[str] = []
+
+    def handle(event: Dict[str, Any]) -> None:
+        nonlocal final_text, last_partial
+        etype = event.get("type")
+        if etype == "response.output_text.delta":
+            if "ttft_s" not in timings:
+                timings["ttft_s"] = time.perf_counter() - started_at
+            chunks.append(event.get("delta") or "")
+            partial = parse_partial_pick("".join(chunks))
+            if on_partial and partial != last_partial:
+                on_partial(partial)
+            last_partial = partial
+        elif etype == "response.completed":
+            final_text = openai_extract_output_text(event.get("response") or {})
+            timings["input_tokens"] = ((event.get("response") or {}).get("usage") or {}).get("input_tokens")
+        elif etype in ("response.failed", "response.incomplete", "error"):
+            detail = (event.get("response") or {}).get("error") or event.get("message") or etype
+            raise RuntimeError(f"OpenAI 스트리밍 실패: {detail}")
+
+    # SSE는 항상 UTF-8 (헤더에 charset이 없으면 requests가 latin-1로 추정함)
+    r.encoding = "utf-8"
+    for line in r.iter_lines(decode_unicode=True):
+        if deadline is not None and deadline.cancelled():
+            r.close()
+            raise RunCancelled("OpenAI: 새 실행이 시작돼 스트리밍을 중단했습니다.")
+        if line is None:
+            continue
+        if line.startswith("data:"):
+            data_lines.append(line[5:].strip())
+        elif line == "" and data_lines:
+            payload = "\n".join(data_lines)
+            data_lines = []
+            if payload != "[DONE]":
+                handle(json.loads(payload))
+    if data_lines and data_lines[0] != "[DONE]":
+        handle(json.loads("\n".join(data_lines)))
+
+    return final_text or "".join(chunks).strip()
+
+
+def openai_pick_one_movie(
+    api_key: str,
+    model: str,
+    user_answers: List[str],
+    inferred_genre_key: str,
+    candidates: List[Dict[str, Any]],
+    deadline: Optional[Deadline] = None,
+    stream: bool = False,
+    on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+    timings: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    candidates: list of dicts with fields: id, title, overview, vote_average, vote_count, release_date
+    returns: {"movie_id": int, "title": str, "reason": str, "confidence": float}
+    stream=True면 SSE로 받으면서 확정된 필드를 on_partial로 먼저 넘긴다.
+    timings에는 ttft_s(첫 토큰), total_s(전체), cached, prompt_tokens_est, input_tokens를 기록한다.
+    """
+    timings = timings if timings is not None else {}
+    started_at = time.perf_counter()
+    api_key = (api_key or "").strip()
+    if not api_key:
+        raise ValueError("OpenAI API Key가 비어있습니다.")
+
+    # 같은 입력/모델/프롬프트 버전으로 고른 결과가 있으면 LLM을 다시 부르지 않는다
+    pick_cache = get_llm_pick_cache()
+    candidate_ids = [m["id"] for m in candidates]
+    cache_key = LlmPickCache.make_key(user_answers, inferred_genre_key, candidate_ids, model)
+    cached_pick = pick_cache.get(cache_key)
+    timings["cached"] = cached_pick is not None
+    metrics = get_llm_metrics()
+    if cached_pick is not None:
+        metrics.record_cache_hit()
+        timings["total_s"] = time.perf_counter() - started_at
+        return cached_pick
+
+    content, prompt_tokens_est, truncated = build_pick_prompt(user_answers, inferred_genre_key, candidates)
+    timings["prompt_tokens_est"] = prompt_tokens_est
+    prompt_user = {"role": "user", "content": content}
+
+    body = {
+        "model": model,
+        "instructions": OPENAI_PICK_INSTRUCTIONS,
+        "input": [prompt_user],
+        "stream": stream,
+        **OPENAI_PICK_PARAMS,
+        "text": {
+            "format": {
+                "type": "json_schema",
+                "strict": True,
+                "schema": OPENAI_PICK_SCHEMA,
+            }
+        },
+    }
+
+    deadline = deadline or Deadline(math.inf)
+    deadline.check("OpenAI")
+    breaker = get_circuit_breaker("OpenAI")
+    span = upstream_span("OpenAI", "/responses")
+    try:
+        text = openai_request_text(api_key, body, deadline, breaker, span, stream, on_partial, started_at, timings)
+    except CircuitOpenError:
+        span.outcome = "circuit_open"
+        raise
+    except RunCancelled:
+        span.outcome = "cancelled"
+        raise
+    finally:
+        span.finish()
+    metrics.record_call(prompt_tokens_est, timings.get("input_tokens"), truncated, timings["total_s"])
+    if not text:
+        raise RuntimeError("OpenAI 응답에서 텍스트를 추출하지 못했습니다.")
+
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        # 마지막 보험: 텍스트에서 JSON 구간만 잘라 파싱
+        start = text.find("{")
+        end = text.rfind("}")
+        if start == -1 or end == -1 or end <= start:
+            raise RuntimeError("OpenAI JSON 파싱 실패: 유효한 JSON을 찾지 못했습니다.")
+        parsed = json.loads(text[start : end + 1])
+
+    # 후보 안에서 고른 정상 결과만 캐시
+    if isinstance(parsed, dict) and parsed.get("movie_id") in candidate_ids:
+        pick_cache.put(cache_key, parsed)
+    return parsed
+
+
+def openai_request_text(
+    api_key: str,
+    body: Dict[str, Any],
+    deadline: Deadline,
+    breaker: CircuitBreaker,
+    span: UpstreamSpan,
+    stream: bool,
+    on_partial: Optional[Callable[[Dict[str, Any]], None]],
+    started_at: float,
+    timings: Dict[str, Any],
+) -> str:
+    """/responses 호출 1회 -> output_text. 시도/상태 코드는 span에, ttft_s/total_s/input_tokens는 timings에 기록"""
+    breaker.before_call()
+    settled = False
+    try:
+        budget_limited = deadline.remaining() < OPENAI_TIMEOUT[1]
+        timeout = (deadline.cap(OPENAI_TIMEOUT[0]), deadline.cap(OPENAI_TIMEOUT[1]))
+        if min(timeout) <= 0:
+            # check() 이후 예산이 바닥났거나 취소됨 - timeout 0으로 보내면 requests가 ValueError
+            deadline.check("OpenAI")
+            raise DeadlineExceeded("OpenAI: 시간 예산을 모두 사용했습니다.")
+        sent_at = time.perf_counter()
+        try:
+            r = get_http_session().post(
+                f"{OPENAI_API_BASE}/responses",
+                headers={
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {api_key}",
+                },
+                data=json.dumps(body),
+                timeout=timeout,
+                stream=stream,
+            )
+        except requests.RequestException as e:
+            span.attempt("timeout" if isinstance(e, requests.Timeout) else "error", time.perf_counter() - sent_at)
+            if budget_limited and isinstance(e, requests.Timeout):
+                breaker.record_inconclusive()
+            else:
+                breaker.record_failure()
+            settled = True
+            raise
+        span.attempt(str(r.status_code), time.perf_counter() - sent_at)
+        if r.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        settled = True
+    finally:
+        if not settled:
+            # 결과를 기록하지 못하고 빠져나감 (예산 소진/취소/예상 못 한 예외) - probe 자리만 반납
+            breaker.record_inconclusive()
+
+    # 스트리밍 응답은 본문을 다 읽지 않고 빠져나가면(에러 상태/스트림 중 실패) 커넥션이 풀로 돌아가지 않는다 - 항상 닫는다
+    with r:
+        # 에러 처리
+        if r.status_code in (401, 403):
+            span.outcome = "auth_error"
+            raise RuntimeError("OpenAI 인증 실패: API Key를 확인해 주세요.")
+        if r.status_code == 429:
+            span.outcome = "rate_limited"
+            raise RuntimeError("OpenAI 요청이 너무 많습니다(429). 잠시 후 다시 시도해 주세요.")
+        if r.status_code >= 400:
+            raise RuntimeError(f"OpenAI 요청 실패({r.status_code}): {r.text[:400]}")
+
+        if stream:
+            text = openai_consume_stream(r, on_partial, started_at, timings, deadline)
+        else:
+            resp_json = r.json()
+            text = openai_extract_output_text(resp_json)
+            timings["input_tokens"] = (resp_json.get("usage") or {}).get("input_tokens")
+            timings["ttft_s"] = time.perf_counter() - started_at
+        timings["total_s"] = time.perf_counter() - started_at
+        span.outcome = "ok"
+        return text
+
+
+def llm_candidates_payload(movies: List[Any]) -> List[Dict[str, Any]]:
+    """LLM 프롬프트에 넣을 후보 필드 (Discover 결과에 이미 있는 값만 사용)"""
+    return [
+        {
+            "id": m["id"],
+            "title": m["title"],
+            "overview": m["overview"],
+            "vote_average": float(m.get("vote_average") or 0.0),
+            "vote_count": int(m.get("vote_count") or 0),
+            "release_date": m.get("release_date") or "",
+        }
+        for m in movies
+    ]
+
+
+def llm_skip_gap(movies: List[Any], scores: Sequence[float]) -> float:
+    """
+    로컬 1위와 2위의 상대 점수 차 (q1 - q2) / q1.
+    q는 포스터 패널티를 뺀 점수 - 2위에 포스터가 없으면 패널티(1e6) 때문에 차이가 항상 커 보인다.
+    """
+    if len(movies) < 2 or len(scores) < 2:
+        return 0.0
+    q1, q2 = (
+        float(sc) + (0.0 if m.get("poster_path") else POSTER_PENALTY) for m, sc in zip(movies[:2], scores[:2])
+    )
+    return (q1 - q2) / q1 if q1 > 0 else 0.0
+
+
+def llm_skip_decision(
+    user_answers: List[str], inferred_genre_key: str, movies: List[Any], scores: Sequence[float], model: str
+) -> Optional[float]:
+    """
+    LLM 호출을 생략하면 그 근거인 상대 점수 차, 호출해야 하면 None.
+    같은 후보로 고른 결과가 캐시에 있으면 비용이 없으므로 점수 차와 상관없이 LLM 결과를 쓴다.
+    """
+    if LLM_SKIP_MARGIN <= 0:
+        return None
+    gap = llm_skip_gap(movies, scores)
+    if gap < LLM_SKIP_MARGIN:
+        return None
+    key = LlmPickCache.make_key(user_answers, inferred_genre_key, [m["id"] for m in movies], model)
+    if get_llm_pick_cache().contains(key):
+        return None
+    return gap
+
+
+# ============================================================
+# Helpers - Metrics export
+# ============================================================
+CACHE_EVENT_KEYS = ("hits", "stale", "misses", "revalidated", "stores", "evictions", "refreshes", "refresh_errors", "errors")
+
+
+def cache_samples(cache: str, stats: Dict[str, Any]) -> Iterator[Tuple[str, str, str, Dict[str, str], float]]:
+    """캐시 stats() -> cache_events_total{cache,event} / cache_entries / cache_bytes 샘플"""
+    for event in CACHE_EVENT_KEYS:
+        if event in stats:
+            labels = {"cache": cache, "event": event}
+            yield ("cache_events_total", "counter", "캐시 이벤트 수 (hit/miss/eviction 등)", labels, stats[event])
+    if "entries" in stats:
+        yield ("cache_entries", "gauge", "캐시 항목 수", {"cache": cache}, stats["entries"])
+    size = stats.get("bytes", stats.get("disk_bytes"))
+    if size is not None:
+        yield ("cache_bytes", "gauge", "캐시 사용량(바이트)", {"cache": cache}, size)
+
+
+def collect_engine_stats() -> Iterator[Tuple[str, str, str, Dict[str, str], float]]:
+    """캐시/limiter/breaker/LLM 지표를 수집 시점의 stats()로 내보낸다 (get_metrics()의 collector)"""
+    yield from cache_samples("tmdb_disk", get_tmdb_disk_cache().stats())
+    for name, stats in swr_cache_stats().items():
+        yield from cache_samples(name, stats)
+    yield from cache_samples("llm_pick", get_llm_pick_cache().stats())
+    yield from cache_samples("semantic_vectors", get_semantic_store().stats())
+
+    limiter = get_tmdb_rate_limiter().stats()
+    yield ("tmdb_rate_limiter_acquired_total", "counter", "TMDB rate limiter 토큰 획득 수", {}, limiter["acquired"])
+    yield ("tmdb_rate_limiter_wait_seconds_total", "counter", "TMDB rate limiter 대기 시간 합", {}, limiter["wait_seconds_total"])
+    yield ("tmdb_rate_limiter_pauses_total", "counter", "429 Retry-After로 limiter를 멈춘 횟수", {}, limiter["pauses"])
+    yield ("tmdb_rate_limiter_waiting", "gauge", "지금 토큰을 기다리는 호출 수", {}, limiter["waiting_now"])
+
+    flight = get_tmdb_single_flight().stats()
+    for result in ("executed", "coalesced"):
+        yield ("tmdb_single_flight_total", "counter", "single-flight 실행/합류 수", {"result": result}, flight[result])
+
+    for service in ("TMDB", "OpenAI"):
+        breaker = get_circuit_breaker(service).stats()
+        for state in ("closed", "open", "half_open"):
+            labels = {"service": service, "state": state}
+            yield ("circuit_state", "gauge", "circuit breaker 상태 (현재 상태면 1)", labels, float(breaker["state"] == state))
+        yield ("circuit_rejected_total", "counter", "circuit이 열려 거절한 호출 수", {"service": service}, breaker["rejected"])
+
+    llm = get_llm_metrics().stats()
+    for decision in ("calls", "cache_hits", "skips"):
+        yield ("llm_pick_decisions_total", "counter", "LLM 최종 선정 처리 방식별 횟수", {"decision": decision}, llm[decision])
+
+
+# ============================================================
+# Recommendation pipeline
+# ============================================================
+class RecommendOptions(NamedTuple):
+    """사이드바 필터와 같은 의미의 추천 옵션 (같은 답변 + 같은 옵션이면 결과도 같다)"""
+
+    language: str = LANGUAGE_OPTIONS[0]
+    include_adult: bool = DEFAULT_INCLUDE_ADULT
+    min_vote_avg: float = DEFAULT_MIN_VOTE_AVG
+    min_vote_count: int = DEFAULT_MIN_VOTE_COUNT
+    pages: int = DEFAULT_PAGES_TO_POOL
+    backend: str = "tmdb"
+    use_semantic: bool = DEFAULT_SEMANTIC_RERANK
+    use_llm: bool = True
+
+
+def answer_texts(option_indices: List[int]) -> List[str]:
+    """질문별 선택지 인덱스 -> 답변 문장. 개수나 범위가 맞지 않으면 ValueError"""
+    if len(option_indices) != len(QUESTIONS):
+        raise ValueError(f"답변은 {len(QUESTIONS)}개여야 합니다: {len(option_indices)}개")
+    texts = []
+    for n, (item, idx) in enumerate(zip(QUESTIONS, option_indices), start=1):
+        if not 0 <= idx < len(item["options"]):
+            raise ValueError(f"Q{n} 선택지 인덱스 범위 밖: {idx}")
+        texts.append(item["options"][idx])
+    return texts
+
+
+class GenreDecision(NamedTuple):
+    texts: List[str]
+    category_counts: Counter
+    genre_key: str
+    reason: str
+
+
+class RankedCandidates(NamedTuple):
+    """재랭킹 상위 5편과 각 점수(같은 순서), 후보 풀 전체의 답변 유사도 (의미 재랭킹을 끄면 빈 dict)"""
+
+    top5: List[MovieRecord]
+    scores: List[float]
+    semantic_by_id: Dict[int, float]
+
+
+def analyze_answers(option_indices: List[int]) -> GenreDecision:
+    """1) 답변 -> 카테고리 집계 -> 장르와 이유 문장"""
+    texts = answer_texts(option_indices)
+    category_counts = Counter(CATEGORY_BY_OPTION_INDEX[idx] for idx in option_indices)
+    genre_key = decide_final_genre(texts, category_counts)
+    return GenreDecision(texts, category_counts, genre_key, build_reason(genre_key, texts, category_counts))
+
+
+def candidate_pool(
+    genre_key: str,
+    options: RecommendOptions,
+    auth: Optional[Tuple[Dict[str, str], Dict[str, Any]]],
+    deadline: Optional[Deadline] = None,
+) -> List[MovieRecord]:
+    """2) 장르 + 필터 -> Discover 후보 풀 (모든 세션/워커가 공유하는 SWR 캐시 경유)"""
+    return discover_movies_cached(
+        _auth=auth,
+        genre_id=TMDB_GENRE_IDS[genre_key],
+        language=options.language,
+        include_adult=options.include_adult,
+        min_vote_avg=options.min_vote_avg,
+        min_vote_count=options.min_vote_count,
+        pages=options.pages,
+        backend=options.backend,
+        _deadline=deadline,
+    )
+
+
+def rank_candidates(pool: List[MovieRecord], texts: List[str], options: RecommendOptions) -> RankedCandidates:
+    """3) 후보 풀 -> 상위 5편. 의미 재랭킹이 켜져 있으면 답변-줄거리 유사도를 점수에 더한다"""
+    semantic = semantic_scores(pool, texts, options.language) if options.use_semantic and pool else None
+    ranked, scores = rank_pool_scored(pool, 5, semantic=semantic)
+    top = [(m, float(sc)) for m, sc in zip(ranked, scores) if isinstance(m.get("id"), int)]
+    semantic_by_id = {m.get("id"): float(sc) for m, sc in zip(pool, semantic)} if semantic is not None else {}
+    return RankedCandidates([m for m, _ in top], [sc for _, sc in top], semantic_by_id)
+
+
+def accept_llm_pick(llm_pick: Any, ranked: RankedCandidates, cached: bool) -> Optional[Dict[str, Any]]:
+    """LLM 결과가 후보 5편 안에서 고른 것이면 최종 선정으로, 아니면 None (로컬 선정으로 대체)"""
+    if not isinstance(llm_pick, dict) or llm_pick.get("movie_id") not in {m["id"] for m in ranked.top5}:
+        return None
+    return {
+        "movie_id": llm_pick["movie_id"],
+        "reason": llm_pick.get("reason", ""),
+        "confidence": llm_pick.get("confidence"),
+        "source": "llm_cache" if cached else "llm",
+    }
+
+
+def local_pick(ranked: RankedCandidates) -> Dict[str, Any]:
+    """LLM을 안 쓰거나 실패했을 때의 최종 1편: 답변 유사도 최고, 유사도가 없으면 재랭킹 1위"""
+    if ranked.semantic_by_id:
+        best = max(ranked.top5, key=lambda m: ranked.semantic_by_id.get(m["id"], 0.0))
+        return {"movie_id": best["id"], "source": "semantic"}
+    return {"movie_id": ranked.top5[0]["id"], "source": "rank"}
+
+
+def recommend(
+    option_indices: List[int],
+    options: RecommendOptions,
+    auth: Tuple[Dict[str, str], Dict[str, Any]],
+    openai_api_key: str = "",
+    openai_model: str = "gpt-5-mini",
+    deadline: Optional[Deadline] = None,
+) -> Dict[str, Any]:
+    """
+    답변 1세트의 추천 결과. UI 제출과 같은 단계 함수를 같은 순서로 호출한다:
+    장르 결정 -> Discover 후보 풀 -> 재랭킹 상위 5편 -> 최종 1편(LLM, 생략/실패 시 로컬 점수)
+    상세 조회(예고편 등)는 하지 않고 Discover 필드만으로 결과를 만든다.
+    TMDB 인증/시간 예산 오류는 그대로 올린다 - LLM 오류만 로컬 선정으로 대체.
+    """
+    decision = analyze_answers(option_indices)
+    result: Dict[str, Any] = {
+        "genre": decision.genre_key,
+        "genre_label": DISPLAY_LABEL.get(decision.genre_key, decision.genre_key),
+        "reason": decision.reason,
+        "top5": [],
+        "pick": None,
+    }
+
+    pool = candidate_pool(decision.genre_key, options, auth, deadline)
+    ranked = rank_candidates(pool, decision.texts, options)
+    if not ranked.top5:
+        return result
+    result["top5"] = [
+        {
+            "id": m["id"],
+            "title": m.get("title") or "",
+            "vote_average": m.get("vote_average"),
+            "vote_count": m.get("vote_count"),
+            "release_date": m.get("release_date"),
+            "score": round(sc, 4),
+            **({"semantic": round(ranked.semantic_by_id.get(m["id"], 0.0), 4)} if ranked.semantic_by_id else {}),
+        }
+        for m, sc in zip(ranked.top5, ranked.scores)
+    ]
+
+    pick: Optional[Dict[str, Any]] = None
+    if options.use_llm and openai_api_key.strip():
+        if llm_skip_decision(decision.texts, decision.genre_key, ranked.top5, ranked.scores, openai_model) is not None:
+            get_llm_metrics().record_skip()
+            pick = {"movie_id": ranked.top5[0]["id"], "source": "margin"}
+        else:
+            timings: Dict[str, Any] = {}
+            try:
+                llm_pick = openai_pick_one_movie(
+                    api_key=openai_api_key,
+                    model=openai_model,
+                    user_answers=decision.texts,
+                    inferred_genre_key=decision.genre_key,
+                    candidates=llm_candidates_payload(ranked.top5),
+                    deadline=deadline,
+                    timings=timings,
+                )
+            except Exception as e:
+                result["llm_error"] = str(e)
+                llm_pick = None
+            pick = accept_llm_pick(llm_pick, ranked, bool(timings.get("cached")))
+
+    if pick is None:
+        pick = local_pick(ranked)
+
+    picked = next(m for m in ranked.top5 if m["id"] == pick["movie_id"])
+    result["pick"] = {"title": picked.get("title") or "", **pick}
+    return result
@@ -0,0 +1,311 @@
+"""
+프로세스 내 지표 레지스트리와 Prometheus text exposition.
+
+- Counter / Histogram: 라벨별 값을 스레드 안전하게 누적
+- collector: 수집 시점에 다른 객체의 stats()를 읽어 샘플로 바꾸는 함수
+  (캐시 hit/miss처럼 이미 각 객체가 세고 있는 카운터를 한 곳으로 모으는 용도)
+- UpstreamSpan: 외부 호출 1건(재시도 포함)의 시도 수/상태 코드/백오프 시간을 기록
+- render(): Prometheus text format 0.0.4, serve()/write_textfile()로 내보낸다
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 초 단위 지연 버킷 (캐시 적중 수 ms ~ LLM 호출 수십 초)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# collector가 돌려주는 샘플: (이름, 타입 "counter"|"gauge", help, 라벨, 값)
+Sample = Tuple[str, str, str, Dict[str, str], float]
+LabelKey = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self) -> Dict[LabelKey, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # key -> [버킷별 개수..., +Inf 개수, 합계]
+        self._values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            else:
+                row[len(self.buckets)] += 1
+            row[-1] += value
+
+    def _quantile(self, counts: List[float], total: float, q: float) -> float:
+        """버킷 안에서 선형 보간한 근사 분위수 (Prometheus histogram_quantile과 같은 방식)"""
+        rank = q * total
+        seen = 0.0
+        lower = 0.0
+        for bound, n in zip(self.buckets, counts):
+            if seen + n >= rank and n > 0:
+                return lower + (bound - lower) * (rank - seen) / n
+            seen += n
+            lower = bound
+        return self.buckets[-1] if self.buckets else 0.0
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """디버그 표시용: 라벨 -> count/mean/p50/p95 (근사)"""
+        with self._lock:
+            values = {k: list(v) for k, v in self._values.items()}
+        out = {}
+        for key, row in sorted(values.items()):
+            counts, total_sum = row[:-1], row[-1]
+            total = sum(counts)
+            if not total:
+                continue
+            out["/".join(key) or self.name] = {
+                "count": int(total),
+                "mean_s": round(total_sum / total, 4),
+                "p50_s": round(self._quantile(counts, total, 0.5), 4),
+                "p95_s": round(self._quantile(counts, total, 0.95), 4),
+            }
+        return out
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = {k: list(v) for k, v in self._values.items()}
+        for key, row in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0.0
+            for bound, n in zip(self.buckets + (math.inf,), row[:-1]):
+                cumulative += n
+                le = "+Inf" if math.isinf(bound) else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': le})} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(row[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {_format_value(cumulative)}")
+        return lines
+
+
+class Registry:
+    def __init__(self, prefix: str = "") -> None:
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Any] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def _get(self, cls: Any, name: str, *args: Any, **kwargs: Any) -> Any:
+        full = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(full)
+            if metric is None:
+                metric = self._metrics[full] = cls(full, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, help_text, labelnames)
+
+    def histogram(
+        self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get(Histogram, name, help_text, labelnames, buckets)
+
+    def get(self, name: str) -> Optional[Any]:
+        """등록된 지표 (prefix 제외한 이름), 아직 한 번도 기록되지 않았으면 None"""
+        with self._lock:
+            return self._metrics.get(self.prefix + name)
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        # collector 샘플은 이름별로 모아 HELP/TYPE를 한 번만 쓴다
+        grouped: Dict[str, Tuple[str, str, List[Tuple[Dict[str, str], float]]]] = {}
+        for collector in collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                samples = [("collector_errors", "gauge", "collector 실행 실패", {"error": type(e).__name__}, 1.0)]
+            for name, kind, help_text, labels, value in samples:
+                full = self.prefix + name
+                grouped.setdefault(full, (kind, help_text, []))[2].append((labels, value))
+        for full, (kind, help_text, samples) in grouped.items():
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            for labels, value in samples:
+                lines.append(f"{full}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class UpstreamSpan:
+    """
+    외부 호출 1건(재시도 포함)의 span.
+    시도마다 attempt(status, seconds), 재시도 사유는 retry(reason, backoff_s)를 부르고
+    결과는 outcome에 적어 둔다(기본 "error"). finish()에서 레지스트리와 최근 호출 로그에 남긴다.
+    """
+
+    def __init__(self, registry: Registry, log: "SpanLog", service: str, endpoint: str) -> None:
+        self.registry = registry
+        self.log = log
+        self.service = service
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.attempts = 0
+        self.statuses: List[str] = []
+        self.retries = 0
+        self.backoff_s = 0.0
+        self.outcome = "error"
+
+    def attempt(self, status: str, seconds: float) -> None:
+        self.attempts += 1
+        self.statuses.append(status)
+        self.registry.counter(
+            "upstream_requests_total", "외부 HTTP 요청 시도 수 (상태 코드별)", ("service", "endpoint", "status")
+        ).inc(service=self.service, endpoint=self.endpoint, status=status)
+        self.registry.histogram(
+            "upstream_request_seconds", "외부 HTTP 요청 시도 1회 지연", ("service", "endpoint")
+        ).observe(seconds, service=self.service, endpoint=self.endpoint)
+
+    def retry(self, reason: str, backoff_s: float = 0.0) -> None:
+        self.retries += 1
+        self.backoff_s += backoff_s
+        labels = {"service": self.service, "endpoint": self.endpoint}
+        self.registry.counter("upstream_retries_total", "외부 호출 재시도 수 (사유별)", ("service", "endpoint", "reason")).inc(
+            reason=reason, **labels
+        )
+        if backoff_s:
+            self.registry.counter(
+                "upstream_backoff_seconds_total", "재시도 전 백오프로 잠든 시간", ("service", "endpoint")
+            ).inc(backoff_s, **labels)
+
+    def finish(self, outcome: Optional[str] = None) -> float:
+        outcome = outcome or self.outcome
+        seconds = time.perf_counter() - self.started
+        labels = {"service": self.service, "endpoint": self.endpoint}
+        self.registry.counter("upstream_calls_total", "외부 호출 수 (재시도 포함 1건, 결과별)", ("service", "endpoint", "outcome")).inc(
+            outcome=outcome, **labels
+        )
+        self.registry.histogram("upstream_call_seconds", "외부 호출 1건의 전체 지연 (재시도/백오프 포함)", ("service", "endpoint")).observe(
+            seconds, **labels
+        )
+        self.log.record(
+            {
+                "service": self.service,
+                "endpoint": self.endpoint,
+                "outcome": outcome,
+                "seconds": round(seconds, 4),
+                "attempts": self.attempts,
+                "statuses": self.statuses,
+                "backoff_s": round(self.backoff_s, 3),
+            }
+        )
+        return seconds
+
+
+class SpanLog:
+    """최근 외부 호출 span 링버퍼 (디버그 정보에 표시)"""
+
+    def __init__(self, maxlen: int = 50) -> None:
+        self._lock = threading.Lock()
+        self._spans: Deque[Dict[str, Any]] = deque(maxlen=maxlen)
+
+    def record(self, span: Dict[str, Any]) -> None:
+        span["at"] = time.strftime("%H:%M:%S")
+        with self._lock:
+            self._spans.append(span)
+
+    def recent(self, n: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            spans = list(self._spans)
+        return spans[-n:][::-1] if n else spans[::-1]
+
+
+def write_textfile(registry: Registry, path: str) -> None:
+    """node_exporter textfile collector용 파일 (원자적 교체)"""
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(tmp, path)
+
+
+def serve(registry: Registry, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """GET /metrics 로 registry.render()를 내주는 데몬 HTTP 서버"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+    return httpd
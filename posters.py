@@ -0,0 +1,306 @@
+"""
+포스터 썸네일 디스크 캐시.
+
+TMDB 포스터(w500)를 poster_path마다 한 번만 받아 내용 해시(sha256)로 저장하고,
+카드 레이아웃(st.columns([1, 2])의 왼쪽 칸)에 맞는 크기의 JPEG 썸네일을 만들어 둔다.
+- 디렉터리 구조: index/<sha1(poster_path)> -> 내용 해시, orig/<hash>, thumbs/<hash>-w<폭>.jpg
+  (같은 이미지가 여러 path로 쓰여도 원본/썸네일은 하나)
+- 생성은 백그라운드 스레드 풀에서, 같은 path의 동시 요청은 하나로 합친다
+- 전체 크기가 max_bytes를 넘으면 오래 안 쓴 이미지(mtime 기준)부터 원본, 썸네일, 그 이미지를 가리키는
+  index 파일을 함께 지운다 (메모리 index도 같이 비워 디스크에 남은 이미지만 가리킨다)
+"""
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _content_hash_of(path: str) -> str:
+    """orig/<hash> 또는 thumbs/<hash>-w<폭>.jpg 경로의 내용 해시"""
+    return os.path.basename(path).split("-w", 1)[0]
+
+
+def make_thumbnail(data: bytes, width: int, quality: int = 82) -> bytes:
+    """원본 이미지 bytes -> 폭 width(원본보다 크게 키우지 않음) progressive JPEG"""
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert("RGB")
+        if img.width > width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+        return out.getvalue()
+
+
+class PosterCache:
+    """poster_path -> 로컬 썸네일 파일. fetch(poster_path)는 원본 이미지 bytes를 돌려주는 함수"""
+
+    def __init__(
+        self,
+        directory: str,
+        fetch: Callable[[str], bytes],
+        thumb_width: int = 342,
+        max_bytes: int = 512 * 1024 * 1024,
+        max_workers: int = 4,
+        quality: int = 82,
+    ) -> None:
+        self.directory = directory
+        self.fetch = fetch
+        self.thumb_width = thumb_width
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="poster-thumb")
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, "Future[str]"] = {}
+        # poster_path -> 내용 해시. 디스크 index 파일의 사본이라 축출 때 함께 지워 크기가 디스크에 묶인다
+        self._index: Dict[str, str] = {}
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "fetches": 0,
+            "fetch_bytes": 0,
+            "thumbs_built": 0,
+            "served_bytes": 0,
+            "saved_bytes": 0,
+            "errors": 0,
+            "evictions": 0,
+        }
+        self._disk_bytes = self._scan_bytes()
+
+    # ---------- 경로 ----------
+    def _index_path(self, poster_path: str) -> str:
+        name = hashlib.sha1(poster_path.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, "index", name[:2], name)
+
+    def _orig_path(self, content_hash: str) -> str:
+        return os.path.join(self.directory, "orig", content_hash[:2], content_hash)
+
+    def _thumb_path(self, content_hash: str) -> str:
+        return os.path.join(self.directory, "thumbs", content_hash[:2], f"{content_hash}-w{self.thumb_width}.jpg")
+
+    def _content_hash(self, poster_path: str) -> Optional[str]:
+        with self._lock:
+            cached = self._index.get(poster_path)
+        if cached:
+            return cached
+        try:
+            with open(self._index_path(poster_path), encoding="ascii") as f:
+                content_hash = f.read().strip()
+        except OSError:
+            return None
+        with self._lock:
+            self._index[poster_path] = content_hash
+        return content_hash
+
+    # ---------- 조회 ----------
+    def ready(self, poster_path: str) -> Optional[str]:
+        """썸네일이 이미 디스크에 있으면 경로 (LRU를 위해 mtime 갱신)"""
+        content_hash = self._content_hash(poster_path)
+        if not content_hash:
+            return None
+        thumb = self._thumb_path(content_hash)
+        try:
+            os.utime(thumb)
+        except OSError:
+            return None
+        return thumb
+
+    def prefetch(self, poster_paths: Iterable[Optional[str]]) -> None:
+        """준비 안 된 포스터의 썸네일 생성을 백그라운드로 예약 (기다리지 않음)"""
+        for poster_path in poster_paths:
+            if poster_path and self.ready(poster_path) is None:
+                self._submit(poster_path)
+
+    def get(self, poster_path: str, timeout: float = 0.0) -> Optional[str]:
+        """
+        썸네일 파일 경로. 없으면 생성을 예약하고 최대 timeout초 기다린다.
+        그래도 없으면 None (호출 측은 원격 URL로 대체)
+        """
+        thumb = self.ready(poster_path)
+        if thumb is None:
+            with self._lock:
+                self.counters["misses"] += 1
+            fut = self._submit(poster_path)
+            try:
+                thumb = fut.result(timeout=max(0.0, timeout))
+            except FutureTimeoutError:
+                return None
+            except Exception:
+                return None
+        else:
+            with self._lock:
+                self.counters["hits"] += 1
+        self._record_served(thumb)
+        return thumb
+
+    def _record_served(self, thumb: str) -> None:
+        try:
+            size = os.path.getsize(thumb)
+        except OSError:
+            return
+        try:
+            orig: Optional[int] = os.path.getsize(self._orig_path(_content_hash_of(thumb)))
+        except OSError:
+            orig = None
+        with self._lock:
+            self.counters["served_bytes"] += size
+            if orig is not None:
+                self.counters["saved_bytes"] += max(0, orig - size)
+
+    # ---------- 생성 ----------
+    def _submit(self, poster_path: str) -> "Future[str]":
+        with self._lock:
+            fut = self._inflight.get(poster_path)
+            if fut is None:
+                fut = self._executor.submit(self._build, poster_path)
+                self._inflight[poster_path] = fut
+                fut.add_done_callback(lambda _f, p=poster_path: self._done(p))
+            return fut
+
+    def _done(self, poster_path: str) -> None:
+        with self._lock:
+            self._inflight.pop(poster_path, None)
+
+    def _build(self, poster_path: str) -> str:
+        try:
+            content_hash = self._content_hash(poster_path)
+            data = None
+            if content_hash:
+                try:
+                    with open(self._orig_path(content_hash), "rb") as f:
+                        data = f.read()
+                except OSError:
+                    data = None
+            if data is None:
+                data = self.fetch(poster_path)
+                content_hash = hashlib.sha256(data).hexdigest()
+                with self._lock:
+                    self.counters["fetches"] += 1
+                    self.counters["fetch_bytes"] += len(data)
+                if not os.path.exists(self._orig_path(content_hash)):
+                    _atomic_write(self._orig_path(content_hash), data)
+                    self._add_bytes(len(data))
+
+            thumb = self._thumb_path(content_hash)
+            if not os.path.exists(thumb):
+                thumb_bytes = make_thumbnail(data, self.thumb_width, self.quality)
+                _atomic_write(thumb, thumb_bytes)
+                self._add_bytes(len(thumb_bytes))
+                with self._lock:
+                    self.counters["thumbs_built"] += 1
+
+            self._write_index(poster_path, content_hash)
+            with self._lock:
+                self._index[poster_path] = content_hash
+            self._evict_if_needed()
+            return thumb
+        except Exception:
+            with self._lock:
+                self.counters["errors"] += 1
+            raise
+
+    def _write_index(self, poster_path: str, content_hash: str) -> None:
+        path = self._index_path(poster_path)
+        data = content_hash.encode("ascii")
+        try:
+            old = os.path.getsize(path)
+        except OSError:
+            old = 0
+        _atomic_write(path, data)
+        self._add_bytes(len(data) - old)
+
+    # ---------- 용량 관리 ----------
+    def _files(self) -> Iterable[str]:
+        for sub in ("index", "orig", "thumbs"):
+            for root, _, files in os.walk(os.path.join(self.directory, sub)):
+                for name in files:
+                    if not name.endswith(".tmp"):
+                        yield os.path.join(root, name)
+
+    def _scan_bytes(self) -> int:
+        total = 0
+        for path in self._files():
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def _add_bytes(self, n: int) -> None:
+        with self._lock:
+            self._disk_bytes += n
+
+    def _group_of(self, path: str) -> Optional[str]:
+        """파일이 속한 내용 해시 (index 파일은 내용을 읽는다)"""
+        if os.path.relpath(path, self.directory).split(os.sep, 1)[0] != "index":
+            return _content_hash_of(path)
+        try:
+            with open(path, encoding="ascii") as f:
+                return f.read().strip() or None
+        except (OSError, ValueError):
+            return None
+
+    def _evict_if_needed(self) -> None:
+        """
+        내용 해시 단위(원본 + 썸네일 + 그 해시를 가리키는 index 파일)로 지운다 - 썸네일만 남으면 원본 크기를
+        몰라 절약량을 셀 수 없고, 원본이나 index만 남으면 다시 쓰이지 않는 파일이 용량을 차지한다.
+        썸네일은 제공할 때 mtime이 갱신되므로 묶음의 최근 사용 시각은 그중 가장 늦은 mtime.
+        """
+        with self._lock:
+            if self._disk_bytes <= self.max_bytes:
+                return
+        groups: Dict[str, List[Tuple[int, str]]] = {}
+        last_used: Dict[str, float] = {}
+        for path in self._files():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            content_hash = self._group_of(path) or ""
+            groups.setdefault(content_hash, []).append((st.st_size, path))
+            last_used[content_hash] = max(last_used.get(content_hash, 0.0), st.st_mtime)
+        total = sum(size for files in groups.values() for size, _ in files)
+        # 매번 경계에서 다시 지우지 않도록 90%까지 비운다
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        evicted_hashes = set()
+        for content_hash in sorted(groups, key=last_used.__getitem__):
+            if total <= target:
+                break
+            evicted_hashes.add(content_hash)
+            for size, path in groups[content_hash]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self.counters["evictions"] += evicted
+            for poster_path in [p for p, h in self._index.items() if h in evicted_hashes]:
+                del self._index[poster_path]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_ratio": round(self.counters["hits"] / lookups, 3) if lookups else None,
+                "inflight": len(self._inflight),
+                "disk_bytes": self._disk_bytes,
+                "max_bytes": self.max_bytes,
+                "thumb_width": self.thumb_width,
+            }
@@ -0,0 +1,151 @@
+"""
+오프라인 의미 유사도 재랭커.
+
+네트워크/모델 파일 없이 CPU에서 동작하는 hashed character n-gram TF-IDF.
+- 문서(제목 + 줄거리)를 문자 2~3-gram으로 쪼개 crc32로 SEMANTIC_DIM 차원에 해싱(부호 포함)
+- tf(log1p 카운트)만 저장해 두고, idf 곱하기 + L2 정규화는 점수 계산 시점에 한 번에 처리
+  (idf를 카탈로그 전체로 구하든 후보 풀로 구하든 같은 tf 벡터를 재사용할 수 있도록)
+- 점수 = 정규화된 문서 행렬 @ 질의 벡터 (배치 행렬곱 1번)
+
+한국어는 띄어쓰기/조사 변화가 많아 단어 단위보다 문자 n-gram이 더 잘 맞는다.
+crc32는 프로세스마다 값이 바뀌지 않으므로 카탈로그에 미리 계산해 둔 벡터와 호환된다.
+"""
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+SEMANTIC_DIM = 2048
+NGRAM_SIZES = (2, 3)
+# 문서가 너무 길면 앞부분만 사용 (줄거리 요약이 앞에 오는 경우가 대부분)
+MAX_DOC_CHARS = 1000
+
+
+def doc_text(m: Any) -> str:
+    """영화 1편의 임베딩 대상 텍스트"""
+    return f"{m.get('title') or ''} {m.get('overview') or ''}"
+
+
+def _normalize_text(text: str) -> str:
+    return " ".join(text.lower().split())[:MAX_DOC_CHARS]
+
+
+def _ngrams(text: str) -> Iterator[str]:
+    padded = f" {_normalize_text(text)} "
+    for n in NGRAM_SIZES:
+        for i in range(len(padded) - n + 1):
+            gram = padded[i : i + n]
+            # 공백만으로 된 n-gram은 의미가 없다
+            if not gram.isspace():
+                yield gram
+
+
+def hashed_tf(texts: Sequence[str], dim: int = SEMANTIC_DIM) -> np.ndarray:
+    """texts -> (N, dim) float32 부호 있는 해시 tf 행렬 (log1p 스케일)"""
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in _ngrams(text)), dtype=np.uint32)
+        if hashes.size:
+            # 상위 비트로 부호를 정해 해시 충돌이 한쪽으로 쌓이지 않게 한다
+            signs = np.where(hashes & np.uint32(0x80000000), 1.0, -1.0)
+            out[row] = np.bincount(hashes % dim, weights=signs, minlength=dim)
+    return np.sign(out) * np.log1p(np.abs(out))
+
+
+def fit_idf(tf: np.ndarray) -> np.ndarray:
+    """smooth idf: log((1 + n) / (1 + df)) + 1"""
+    n = tf.shape[0]
+    df = np.count_nonzero(tf, axis=0)
+    return (np.log((1.0 + n) / (1.0 + df)) + 1.0).astype(np.float32)
+
+
+def _l2_normalize(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    return m / np.maximum(norms, 1e-12)
+
+
+def similarity(doc_tf: np.ndarray, query_tf: np.ndarray, idf: np.ndarray) -> np.ndarray:
+    """문서 행렬 (N, dim)과 질의 벡터 (dim,)의 cosine 유사도 (N,)"""
+    if doc_tf.shape[0] == 0:
+        return np.zeros(0, dtype=np.float32)
+    docs = _l2_normalize(np.asarray(doc_tf, dtype=np.float32) * idf)
+    query = _l2_normalize(np.asarray(query_tf, dtype=np.float32).reshape(-1) * idf)
+    return docs @ query
+
+
+class VectorStore:
+    """
+    (언어, 영화 id, 텍스트 digest) -> tf 벡터 LRU.
+    줄거리가 바뀌면 digest가 달라져 자동으로 다시 계산된다.
+    """
+
+    def __init__(self, max_entries: int = 20_000, dim: int = SEMANTIC_DIM) -> None:
+        self.max_entries = max_entries
+        self.dim = dim
+        self._data: "OrderedDict[Tuple[str, int, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(language: str, m: Any) -> Tuple[str, int, str]:
+        digest = hashlib.blake2b(doc_text(m).encode("utf-8"), digest_size=8).hexdigest()
+        return (language, m.get("id"), digest)
+
+    def tf_for(self, language: str, movies: Sequence[Any]) -> np.ndarray:
+        """movies 순서대로 (N, dim) tf 행렬. 없는 것만 모아서 한 번에 계산"""
+        keys = [self._key(language, m) for m in movies]
+        out = np.zeros((len(movies), self.dim), dtype=np.float32)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                vec = self._data.get(key)
+                if vec is None:
+                    missing.append(i)
+                else:
+                    self._data.move_to_end(key)
+                    out[i] = vec
+            self.hits += len(movies) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            computed = hashed_tf([doc_text(movies[i]) for i in missing], self.dim)
+            out[missing] = computed
+            with self._lock:
+                for i, vec in zip(missing, computed.astype(np.float16)):
+                    self._data[keys[i]] = vec
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else None,
+            }
+
+
+def score_pool(
+    pool: Sequence[Any],
+    query_texts: Sequence[str],
+    tf: np.ndarray,
+    idf: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    후보 풀 전체의 질의 유사도 (N,).
+    idf가 없으면(카탈로그 없음) 풀 자체로 idf를 맞춘다.
+    """
+    if not pool or not query_texts:
+        return np.zeros(len(pool), dtype=np.float32)
+    if idf is None:
+        idf = fit_idf(tf)
+    query_tf = hashed_tf([" ".join(query_texts)], tf.shape[1])[0]
+    return similarity(tf, query_tf, idf)
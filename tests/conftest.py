@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 저장소 루트의 모듈(engine, batch, rerank ...)을 패키지 설치 없이 import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
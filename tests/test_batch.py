@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from batch import load_checkpoint, parse_answers, row_ids
+from engine import QUESTIONS
+
+
+# ============================================================
+# parse_answers
+# ============================================================
+def test_parse_answers_index_and_text_agree():
+    expected = [n % len(item["options"]) for n, item in enumerate(QUESTIONS)]
+    by_index = {"answers": expected}
+    by_text = {"answers": [item["options"][i] for item, i in zip(QUESTIONS, expected)]}
+    assert parse_answers(by_index, 0) == expected
+    assert parse_answers(by_text, 0) == expected
+
+
+def test_parse_answers_index_base_and_string_forms():
+    expected = [0] * len(QUESTIONS)
+    one_based = ",".join("1" for _ in QUESTIONS)
+    assert parse_answers({"answers": one_based}, 1) == expected
+    assert parse_answers({f"q{n}": "0" for n in range(1, len(QUESTIONS) + 1)}, 0) == expected
+    # 텍스트는 index_base와 무관
+    assert parse_answers({"answers": [item["options"][0] for item in QUESTIONS]}, 1) == expected
+
+
+def test_parse_answers_rejects_bad_input():
+    with pytest.raises(ValueError):
+        parse_answers({"answers": [0] * (len(QUESTIONS) - 1)}, 0)
+    with pytest.raises(ValueError):
+        parse_answers({"answers": [0] * (len(QUESTIONS) - 1) + [len(QUESTIONS[-1]["options"])]}, 0)
+    with pytest.raises(ValueError):
+        parse_answers({"answers": [0] * (len(QUESTIONS) - 1) + ["없는 선택지"]}, 0)
+    # 1부터 세는 입력에서 0은 범위 밖
+    with pytest.raises(ValueError):
+        parse_answers({"answers": [0] * len(QUESTIONS)}, 1)
+
+
+# ============================================================
+# row_ids
+# ============================================================
+def test_row_ids_keeps_falsy_ids_and_numbers_missing_ones():
+    assert row_ids([{"id": 0}, {}, {"id": ""}, {"id": "a"}]) == ["0", "2", "", "a"]
+
+
+def test_row_ids_rejects_duplicates():
+    with pytest.raises(ValueError, match="중복 id"):
+        row_ids([{"id": 7}, {"id": "7"}])
+    # 자동 순번과 명시 id가 겹쳐도 거부
+    with pytest.raises(ValueError, match="중복 id"):
+        row_ids([{"id": "2"}, {}])
+
+
+# ============================================================
+# load_checkpoint
+# ============================================================
+def _line(record):
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def test_checkpoint_truncates_partial_last_line(tmp_path):
+    out = tmp_path / "out.jsonl"
+    complete = _line({"id": "1", "key": "k1", "status": "ok", "result": {"pick": 1}}) + _line(
+        {"id": "2", "status": "error", "error": "x"}
+    )
+    out.write_bytes(complete.encode("utf-8") + b'{"id":"3","key":"k3","sta')
+
+    done_ids, results = load_checkpoint(str(out), retry_errors=False)
+
+    assert done_ids == {"1", "2"}
+    assert results == {"k1": {"pick": 1}}
+    assert out.read_bytes() == complete.encode("utf-8")
+
+
+def test_checkpoint_retry_errors_and_last_line_wins(tmp_path):
+    out = tmp_path / "out.jsonl"
+    out.write_text(
+        _line({"id": "1", "status": "error", "error": "x"})
+        + _line({"id": "2", "status": "error", "error": "x"})
+        + _line({"id": "2", "key": "k2", "status": "ok", "result": {"pick": 2}}),
+        encoding="utf-8",
+    )
+    done_ids, results = load_checkpoint(str(out), retry_errors=True)
+    assert done_ids == {"2"}
+    assert results == {"k2": {"pick": 2}}
+
+
+def test_checkpoint_missing_file(tmp_path):
+    assert load_checkpoint(str(tmp_path / "none.jsonl"), retry_errors=False) == (set(), {})
@@ -0,0 +1,193 @@
+import threading
+
+import pytest
+
+import engine
+from engine import CircuitBreaker, CircuitOpenError, DeadlineExceeded, SingleFlight, TokenBucket
+
+
+class FakeClock:
+    def __init__(self, now: float = 100.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(engine.time, "monotonic", fake)
+    return fake
+
+
+# ============================================================
+# SingleFlight
+# ============================================================
+def test_single_flight_follower_retries_after_leader_deadline():
+    sf = SingleFlight()
+    leader_started = threading.Event()
+    release_leader = threading.Event()
+    results = {}
+
+    def leader_fn():
+        leader_started.set()
+        release_leader.wait(5)
+        raise DeadlineExceeded("leader budget")
+
+    def run_leader():
+        try:
+            sf.do("k", leader_fn, retry_on=(DeadlineExceeded,))
+        except DeadlineExceeded as e:
+            results["leader"] = e
+
+    def run_follower():
+        results["follower"] = sf.do("k", lambda: "own", retry_on=(DeadlineExceeded,))
+
+    t_leader = threading.Thread(target=run_leader)
+    t_leader.start()
+    assert leader_started.wait(5)
+    t_follower = threading.Thread(target=run_follower)
+    t_follower.start()
+    # follower가 leader의 Future를 기다리는 중인지 확인한 뒤 leader를 실패시킨다
+    for _ in range(500):
+        if sf.stats()["coalesced"]:
+            break
+        threading.Event().wait(0.01)
+    release_leader.set()
+    t_leader.join(5)
+    t_follower.join(5)
+
+    assert isinstance(results["leader"], DeadlineExceeded)
+    assert results["follower"] == "own"
+    assert sf.stats() == {"executed": 1, "coalesced": 1, "in_flight": 0}
+
+
+def test_single_flight_follower_shares_other_errors():
+    sf = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def leader_fn():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    def call(fn):
+        try:
+            sf.do("k", fn, retry_on=(DeadlineExceeded,))
+        except ValueError as e:
+            errors.append(e)
+
+    t_leader = threading.Thread(target=call, args=(leader_fn,))
+    t_leader.start()
+    assert started.wait(5)
+    t_follower = threading.Thread(target=call, args=(lambda: pytest.fail("follower must not run fn"),))
+    t_follower.start()
+    for _ in range(500):
+        if sf.stats()["coalesced"]:
+            break
+        threading.Event().wait(0.01)
+    release.set()
+    t_leader.join(5)
+    t_follower.join(5)
+    assert len(errors) == 2 and errors[0] is errors[1]
+
+
+# ============================================================
+# CircuitBreaker
+# ============================================================
+def _open_breaker(clock: FakeClock, probe_timeout: float = 30.0) -> CircuitBreaker:
+    cb = CircuitBreaker("test", failure_threshold=2, reset_timeout=10.0, probe_timeout=probe_timeout)
+    cb.record_failure()
+    cb.record_failure()
+    assert cb.stats()["state"] == "open"
+    return cb
+
+
+def test_breaker_rejects_while_open(clock):
+    cb = _open_breaker(clock)
+    clock.now += 9.9
+    with pytest.raises(CircuitOpenError):
+        cb.before_call()
+    assert cb.stats()["rejected"] == 1
+
+
+def test_breaker_single_probe_released_when_inconclusive(clock):
+    cb = _open_breaker(clock)
+    clock.now += 10.0
+    cb.before_call()  # probe 자리 획득
+    assert cb.stats()["state"] == "half_open"
+    with pytest.raises(CircuitOpenError):
+        cb.before_call()
+    cb.record_inconclusive()
+    cb.before_call()  # 반납된 자리로 다음 호출이 probe가 된다
+    cb.record_success()
+    assert cb.stats()["state"] == "closed"
+    cb.before_call()
+
+
+def test_breaker_probe_slot_reopens_after_probe_timeout(clock):
+    cb = _open_breaker(clock, probe_timeout=5.0)
+    clock.now += 10.0
+    cb.before_call()
+    clock.now += 4.9
+    with pytest.raises(CircuitOpenError):
+        cb.before_call()
+    clock.now += 0.1
+    cb.before_call()
+
+
+def test_breaker_failed_probe_reopens(clock):
+    cb = _open_breaker(clock)
+    opened = cb.stats()["opened"]
+    clock.now += 10.0
+    cb.before_call()
+    cb.record_failure()
+    assert cb.stats()["state"] == "open"
+    assert cb.stats()["opened"] == opened + 1
+    with pytest.raises(CircuitOpenError):
+        cb.before_call()
+
+
+# ============================================================
+# TokenBucket (GCRA)
+# ============================================================
+def _no_sleep(_seconds: float) -> None:
+    pass
+
+
+def test_token_bucket_burst_then_paced(clock):
+    bucket = TokenBucket(rate=10.0, burst=3, jitter=0.0)
+    waits = [bucket.acquire(sleep=_no_sleep) for _ in range(5)]
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert waits[3] == pytest.approx(0.1)
+    assert waits[4] == pytest.approx(0.2)
+
+
+def test_token_bucket_refills_at_rate(clock):
+    bucket = TokenBucket(rate=10.0, burst=3, jitter=0.0)
+    for _ in range(3):
+        bucket.acquire(sleep=_no_sleep)
+    # 0.1초에 토큰 1개
+    clock.now += 0.1
+    assert bucket.acquire(sleep=_no_sleep) == 0.0
+    assert bucket.acquire(sleep=_no_sleep) == pytest.approx(0.1)
+    # 충분히 쉬면 burst까지만 다시 찬다
+    clock.now += 10.0
+    assert [bucket.acquire(sleep=_no_sleep) for _ in range(4)] == pytest.approx([0.0, 0.0, 0.0, 0.1])
+
+
+def test_token_bucket_timeout_does_not_reserve(clock):
+    bucket = TokenBucket(rate=10.0, burst=1, jitter=0.0)
+    assert bucket.acquire(sleep=_no_sleep) == 0.0
+    assert bucket.acquire(timeout=0.05, sleep=_no_sleep) is None
+    assert bucket.acquire(timeout=0.1, sleep=_no_sleep) == pytest.approx(0.1)
+    assert bucket.stats()["acquired"] == 2
+
+
+def test_token_bucket_pause_holds_all_callers(clock):
+    bucket = TokenBucket(rate=10.0, burst=3, jitter=0.0)
+    bucket.pause(2.0)
+    assert bucket.acquire(sleep=_no_sleep) == pytest.approx(2.0)
@@ -0,0 +1,42 @@
+import random
+
+import numpy as np
+import pytest
+
+from rerank import _legacy_two_sort, rerank, top_k_indices
+
+
+def _tied_pool(n: int, seed: int):
+    # 평점/인기도 값을 몇 개로 제한해 동점을 많이 만든다
+    rnd = random.Random(seed)
+    return [
+        {
+            "id": i,
+            "vote_average": rnd.choice([5.0, 6.5, 7.0, 8.0]),
+            "popularity": rnd.choice([0.0, 4.0, 9.0, 16.0]),
+            "poster_path": f"/p{i}.jpg" if rnd.random() > 0.2 else None,
+        }
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("k", [1, 5, 20, 200])
+def test_rerank_matches_legacy_two_pass_sort(seed, k):
+    pool = _tied_pool(200, seed)
+    expected = [m["id"] for m in _legacy_two_sort(list(pool), k)]
+    assert [m["id"] for m in rerank(pool, k)] == expected
+
+
+def test_top_k_indices_keeps_input_order_for_ties():
+    score = np.array([1.0, 3.0, 3.0, 2.0, 3.0])
+    assert top_k_indices(score, 2).tolist() == [1, 2]
+    assert top_k_indices(score, 3).tolist() == [1, 2, 4]
+    assert top_k_indices(score).tolist() == [1, 2, 4, 3, 0]
+
+
+def test_top_k_indices_edge_sizes():
+    score = np.array([2.0, 1.0])
+    assert top_k_indices(score, 0).tolist() == []
+    assert top_k_indices(score, 5).tolist() == [0, 1]
+    assert top_k_indices(np.zeros(0), 3).tolist() == []